@@ -1,10 +1,12 @@
 from rest_framework import generics, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from .models import Payment, DriverEarnings
 from rides.models import Ride
+from rides.outbox import publish
 from .serializers import PaymentSerializer, PaymentCreateSerializer, DriverEarningsSerializer
 from drf_spectacular.utils import extend_schema
 
@@ -23,30 +25,42 @@ class PaymentCreateView(APIView):
         
         ride = get_object_or_404(Ride, id=serializer.validated_data['ride_id'], status='completed')
         
-        # Create payment
-        payment = Payment.objects.create(
-            ride=ride,
-            passenger=ride.passenger,
-            driver=ride.driver,
-            amount=ride.fare,
-            method=serializer.validated_data['method'],
-            status='completed',  # Mock payment (instant success)
-            completed_at=timezone.now()
-        )
-        
-        # Update driver earnings
-        if ride.driver:
-            earnings, created = DriverEarnings.objects.get_or_create(
+        with transaction.atomic():
+            # Create payment
+            payment = Payment.objects.create(
+                ride=ride,
+                passenger=ride.passenger,
                 driver=ride.driver,
-                date=timezone.now().date()
+                amount=ride.fare,
+                method=serializer.validated_data['method'],
+                status='completed',  # Mock payment (instant success)
+                completed_at=timezone.now()
             )
-            earnings.total_rides += 1
-            earnings.total_earnings += ride.fare
-            earnings.save()
             
-            # Update driver profile
-            ride.driver.driver_profile.total_earnings += ride.fare
-            ride.driver.driver_profile.save()
+            # Update driver earnings
+            if ride.driver:
+                earnings, created = DriverEarnings.objects.get_or_create(
+                    driver=ride.driver,
+                    date=timezone.now().date()
+                )
+                earnings.total_rides += 1
+                earnings.total_earnings += ride.fare
+                earnings.save()
+                
+                # Update driver profile
+                ride.driver.driver_profile.total_earnings += ride.fare
+                ride.driver.driver_profile.save(update_fields=['total_earnings', 'updated_at'])
+            
+            # Both parties hear about it once the payment commits
+            publish([
+                (f'user_{user_id}', {
+                    'type': 'payment_notification',
+                    'ride_id': ride.id,
+                    'amount': str(payment.amount),
+                    'method': payment.method,
+                })
+                for user_id in (ride.passenger_id, ride.driver_id) if user_id
+            ])
         
         return Response(PaymentSerializer(payment).data)
 
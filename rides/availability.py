@@ -0,0 +1,306 @@
+import heapq
+import threading
+import time
+from threading import Lock
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class BaseAvailabilityTracker:
+    """Heartbeat deadlines for available drivers.
+
+    Every location ping pushes the driver's deadline ttl_seconds ahead.
+    The sweeper pops only the drivers whose deadline has passed, ordered
+    by deadline, and takes them offline in one bulk update, so a crashed
+    app stops being offered rides without anything scanning the drivers
+    table. Between sweeps, alive() lets searches skip overdue drivers.
+
+    Only a shared tracker sees every driver's pings, so only a shared
+    tracker is warmed from the database and swept by default; a
+    per-process one tracks just the drivers that pinged this process.
+    """
+
+    shared = False
+
+    def __init__(self, ttl_seconds=90.0, sweep_interval=15.0, batch_size=500):
+        self.ttl_seconds = ttl_seconds
+        self.sweep_interval = sweep_interval
+        self.batch_size = batch_size
+        self._thread = None
+
+    def heartbeat(self, driver_id, now=None):
+        """Push the driver's deadline ttl_seconds from now"""
+        raise NotImplementedError
+
+    def track_many(self, driver_ids, now=None):
+        """Start deadlines for drivers not tracked yet, leaving existing deadlines alone"""
+        raise NotImplementedError
+
+    def clear(self, driver_id):
+        """Stop tracking a driver that is no longer available"""
+        raise NotImplementedError
+
+    def alive(self, driver_ids, now=None):
+        """The subset of driver_ids not past their deadline (untracked ones count as alive)"""
+        raise NotImplementedError
+
+    def pop_expired(self, now=None):
+        """Remove and return the ids of every driver past their deadline"""
+        raise NotImplementedError
+
+    def tracked_count(self):
+        raise NotImplementedError
+
+    def mark_loaded(self):
+        """Return True only for the first caller, so warm-up runs once per loaded_ttl"""
+        raise NotImplementedError
+
+    def sweep(self, now=None):
+        """Take overdue drivers offline; returns how many were expired"""
+        expired = self.pop_expired(now)
+        if not expired:
+            return 0
+        for start in range(0, len(expired), self.batch_size):
+            expire_drivers(expired[start:start + self.batch_size])
+        return len(expired)
+
+    def start(self):
+        """Sweep every sweep_interval from a daemon thread (once per process)"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name='driver-availability-sweeper', daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        from django.db import close_old_connections
+
+        while True:
+            time.sleep(self.sweep_interval)
+            close_old_connections()
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"❌ Error sweeping stale drivers: {e}")
+
+
+class InMemoryAvailabilityTracker(BaseAvailabilityTracker):
+    """Per-process deadlines in a min-heap with lazy deletion.
+
+    A heartbeat pushes a new heap entry and leaves the old one behind;
+    entries whose deadline no longer matches _deadlines are skipped when
+    popped, and the heap is rebuilt once stale entries dominate it.
+    """
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self._deadlines = {}
+        self._heap = []  # (deadline, driver_id)
+        self._loaded = False
+        self._lock = Lock()
+
+    def heartbeat(self, driver_id, now=None):
+        deadline = (time.time() if now is None else now) + self.ttl_seconds
+        with self._lock:
+            self._deadlines[driver_id] = deadline
+            heapq.heappush(self._heap, (deadline, driver_id))
+            if len(self._heap) > 2 * len(self._deadlines) + 1000:
+                self._heap = [(deadline, member) for member, deadline in self._deadlines.items()]
+                heapq.heapify(self._heap)
+
+    def track_many(self, driver_ids, now=None):
+        deadline = (time.time() if now is None else now) + self.ttl_seconds
+        with self._lock:
+            for driver_id in driver_ids:
+                if driver_id not in self._deadlines:
+                    self._deadlines[driver_id] = deadline
+                    heapq.heappush(self._heap, (deadline, driver_id))
+
+    def clear(self, driver_id):
+        with self._lock:
+            self._deadlines.pop(driver_id, None)
+
+    def alive(self, driver_ids, now=None):
+        now = time.time() if now is None else now
+        return {
+            driver_id for driver_id in driver_ids
+            if self._deadlines.get(driver_id, now) >= now
+        }
+
+    def pop_expired(self, now=None):
+        now = time.time() if now is None else now
+        expired = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, driver_id = heapq.heappop(self._heap)
+                if self._deadlines.get(driver_id) == deadline:
+                    del self._deadlines[driver_id]
+                    expired.append(driver_id)
+        return expired
+
+    def tracked_count(self):
+        return len(self._deadlines)
+
+    def mark_loaded(self):
+        with self._lock:
+            if self._loaded:
+                return False
+            self._loaded = True
+            return True
+
+
+class RedisAvailabilityTracker(BaseAvailabilityTracker):
+    """Deadlines shared by all workers in a sorted set scored by deadline.
+
+    The overdue range is read and removed in one MULTI, so concurrent
+    sweepers never expire the same driver twice and a heartbeat cannot
+    slip in between the read and the delete.
+    """
+
+    shared = True
+
+    def __init__(self, url, loaded_ttl=3600, **options):
+        super().__init__(**options)
+        import redis
+
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.loaded_ttl = loaded_ttl
+        self.deadlines_key = 'availability:deadlines'
+        self.loaded_key = 'availability:loaded'
+
+    def heartbeat(self, driver_id, now=None):
+        deadline = (time.time() if now is None else now) + self.ttl_seconds
+        self.redis.zadd(self.deadlines_key, {driver_id: deadline})
+
+    def track_many(self, driver_ids, now=None):
+        deadline = (time.time() if now is None else now) + self.ttl_seconds
+        mapping = {driver_id: deadline for driver_id in driver_ids}
+        if mapping:
+            self.redis.zadd(self.deadlines_key, mapping, nx=True)
+
+    def clear(self, driver_id):
+        self.redis.zrem(self.deadlines_key, driver_id)
+
+    def alive(self, driver_ids, now=None):
+        driver_ids = list(driver_ids)
+        if not driver_ids:
+            return set()
+        now = time.time() if now is None else now
+        deadlines = self.redis.zmscore(self.deadlines_key, driver_ids)
+        return {
+            driver_id for driver_id, deadline in zip(driver_ids, deadlines)
+            if deadline is None or deadline >= now
+        }
+
+    def pop_expired(self, now=None):
+        now = time.time() if now is None else now
+        pipe = self.redis.pipeline()
+        pipe.zrangebyscore(self.deadlines_key, '-inf', now)
+        pipe.zremrangebyscore(self.deadlines_key, '-inf', now)
+        expired, _ = pipe.execute()
+        return [int(driver_id) for driver_id in expired]
+
+    def tracked_count(self):
+        return self.redis.zcard(self.deadlines_key)
+
+    def mark_loaded(self):
+        return bool(self.redis.set(self.loaded_key, 1, nx=True, ex=self.loaded_ttl))
+
+
+_tracker = None
+_tracker_lock = Lock()
+
+
+def get_availability_tracker():
+    """The configured tracker, or None if TTLs are off.
+
+    Only a shared tracker is warmed from the database and swept in-process:
+    a per-process tracker never saw the pings that went to other workers,
+    so expiring from it would take their drivers offline.
+    """
+    global _tracker
+    if _tracker is None and settings.DRIVER_AVAILABILITY['ENABLED']:
+        with _tracker_lock:
+            if _tracker is None:
+                config = settings.DRIVER_AVAILABILITY
+                tracker = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+                if tracker.shared and tracker.mark_loaded():
+                    _load_available_drivers(tracker)
+                if config.get('SWEEP_IN_PROCESS', tracker.shared):
+                    tracker.start()
+                _tracker = tracker
+    return _tracker
+
+
+def _load_available_drivers(tracker):
+    """Drivers available at startup get one TTL to check in (deadlines already set are kept)"""
+    from users.models import Driver
+
+    driver_ids = Driver.objects.filter(status='available').values_list('user_id', flat=True)
+    tracker.track_many(list(driver_ids))
+
+
+def driver_heartbeat(driver_id):
+    """Record that a driver's app is alive"""
+    tracker = get_availability_tracker()
+    if tracker is None:
+        return
+    try:
+        tracker.heartbeat(driver_id)
+    except Exception as e:
+        print(f"⚠️ Driver heartbeat failed: {e}")
+
+
+def sync_driver_availability(driver):
+    """Track available drivers; forget the rest.
+
+    A per-process tracker starts a deadline on pings only, so a status
+    change here cannot expire a driver whose pings go to another worker.
+    """
+    tracker = get_availability_tracker()
+    if tracker is None:
+        return
+    try:
+        if driver.status == 'available':
+            if tracker.shared:
+                tracker.heartbeat(driver.user_id)
+        else:
+            tracker.clear(driver.user_id)
+    except Exception as e:
+        print(f"⚠️ Driver availability update failed: {e}")
+
+
+def live_driver_ids(driver_ids):
+    """Drop drivers past their heartbeat deadline; everyone passes if the tracker is off"""
+    tracker = get_availability_tracker()
+    if tracker is None:
+        return set(driver_ids)
+    try:
+        return tracker.alive(driver_ids)
+    except Exception as e:
+        print(f"⚠️ Availability lookup failed: {e}")
+        return set(driver_ids)
+
+
+def expire_drivers(driver_ids):
+    """Take the given drivers offline in one UPDATE and drop them from matching"""
+    from users.models import Driver
+    from .location_store import sync_driver
+    from .surge import sync_driver_supply
+
+    # A conditional UPDATE, so a driver who went on a trip meanwhile is left alone
+    stale = Driver.objects.filter(user_id__in=driver_ids, status='available')
+    pks = list(stale.values_list('pk', flat=True))
+    if not pks or not Driver.objects.filter(pk__in=pks, status='available').update(status='offline'):
+        return 0
+
+    # update() skips save(), so the store and surge supply are synced by hand
+    drivers = list(Driver.objects.filter(pk__in=pks, status='offline'))
+    for driver in drivers:
+        sync_driver(driver)
+        sync_driver_supply(driver)
+
+    print(f"⏱️ Took {len(drivers)} stale drivers offline")
+    return len(drivers)
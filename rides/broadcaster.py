@@ -0,0 +1,114 @@
+import asyncio
+from threading import Lock
+
+from django.conf import settings
+
+from .fanout import group_send_many
+
+
+class LocationBroadcaster:
+    """Coalesces driver positions per group and sends one frame per tick.
+
+    publish() only records the latest position of each driver for the
+    group; every tick_seconds the changed drivers of each group go out as
+    location_batch messages of at most max_drivers_per_frame entries.
+    Consumers hold a batch for settle_seconds so the batches of all their
+    groups leave in one WebSocket frame. The tick runs as a task on the
+    ASGI event loop, started by the first WebSocket connection; until then
+    publish() returns False and callers send the update directly.
+    """
+
+    def __init__(self, tick_seconds=0.5, max_drivers_per_frame=100):
+        self.tick_seconds = tick_seconds
+        self.max_drivers_per_frame = max_drivers_per_frame
+        self.settle_seconds = min(0.05, tick_seconds / 10)
+
+        self._pending = {}  # group -> {driver_id: (lat, lon)}
+        self._lock = Lock()
+        self._task = None
+        self._loop = None
+
+        self.updates = 0
+        self.coalesced = 0
+        self.messages = 0
+        self.ticks = 0
+
+    @property
+    def running(self):
+        return (
+            self._task is not None and not self._task.done()
+            and self._loop is not None and self._loop.is_running()
+        )
+
+    def ensure_running(self):
+        """Start the tick on the current event loop (call from async code)"""
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._task = loop.create_task(self._run())
+
+    def publish(self, group, driver_id, lat, lon):
+        """Queue a position for the next tick; False if the tick is not running"""
+        if not self.running:
+            return False
+        with self._lock:
+            drivers = self._pending.setdefault(group, {})
+            if driver_id in drivers:
+                self.coalesced += 1
+            drivers[driver_id] = (round(float(lat), 6), round(float(lon), 6))
+            self.updates += 1
+        return True
+
+    def drain(self):
+        """Take the pending positions as [(group, message)], split at the frame cap"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        frames = []
+        for group, drivers in pending.items():
+            entries = [[driver_id, lat, lon] for driver_id, (lat, lon) in drivers.items()]
+            for start in range(0, len(entries), self.max_drivers_per_frame):
+                frames.append((group, {
+                    'type': 'location_batch',
+                    'drivers': entries[start:start + self.max_drivers_per_frame],
+                }))
+        return frames
+
+    async def flush(self):
+        frames = self.drain()
+        if frames:
+            await group_send_many(frames)
+        self.messages += len(frames)
+        self.ticks += 1
+        return len(frames)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick_seconds)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"❌ Error broadcasting location batch: {e}")
+
+    def stats(self):
+        return {
+            'updates': self.updates,
+            'coalesced': self.coalesced,
+            'messages': self.messages,
+            'ticks': self.ticks,
+            'pending_groups': len(self._pending),
+        }
+
+
+_broadcaster = None
+
+
+def get_location_broadcaster():
+    """The process-wide broadcaster, or None when tick aggregation is off"""
+    global _broadcaster
+    if _broadcaster is None and settings.LOCATION_BROADCAST_TICK_MS > 0:
+        _broadcaster = LocationBroadcaster(
+            tick_seconds=settings.LOCATION_BROADCAST_TICK_MS / 1000,
+            max_drivers_per_frame=settings.LOCATION_BATCH_MAX_DRIVERS,
+        )
+    return _broadcaster
@@ -1,11 +1,18 @@
-import json
+import asyncio
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from django.utils import timezone
+from django.conf import settings
+from .broadcaster import get_location_broadcaster
+from .dispatch import get_dispatch_worker
+from .fanout import driver_location_group, location_cell, location_groups_around, ride_group
+from .outbox import get_outbox_relay
+from .protocol import negotiate
 
 class LocationConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        await self.accept()
+        # Binary (MessagePack/CBOR) frames if the client offers a subprotocol, JSON otherwise
+        subprotocol, self.codec = negotiate(self.scope.get('subprotocols'))
+        await self.accept(subprotocol=subprotocol)
         self.user = self.scope['user']
 
         if not self.user.is_authenticated:
@@ -21,94 +28,208 @@ class LocationConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
 
-        self.location_room = 'location_updates'
-        await self.channel_layer.group_add(
-            self.location_room,
-            self.channel_name
-        )
+        # Driver positions are flushed once per tick from this event loop
+        broadcaster = get_location_broadcaster()
+        if broadcaster:
+            broadcaster.ensure_running()
+
+        # New rides are matched and offered to drivers from this event loop too
+        dispatch_worker = get_dispatch_worker()
+        if dispatch_worker:
+            dispatch_worker.ensure_running()
+
+        # Ride and payment events are relayed from the outbox by this event loop as well
+        if settings.OUTBOX_RELAY_IN_PROCESS:
+            get_outbox_relay().ensure_running()
+
+        # Batches from all of this socket's groups merge into one write per tick
+        self.batched_drivers = {}
+        self.batch_flush = None
+
+        # Location broadcasts are sharded by cell; groups are joined once we know where the client is
+        self.location_cell = None
+        self.location_groups = set()
+
+        # Rides in progress: their group carries the driver's position (rejoined after reconnects)
+        self.ride_ids = set()
+        for ride_id in await self.get_active_ride_ids():
+            await self.join_ride(ride_id)
 
     async def disconnect(self, close_code):
         if self.user.is_authenticated:
+            if self.batch_flush is not None:
+                self.batch_flush.cancel()
             await self.channel_layer.group_discard(
                 self.personal_room,
                 self.channel_name
             )
-            await self.channel_layer.group_discard(
-                self.location_room,
-                self.channel_name
-            )
+            await asyncio.gather(*(
+                self.channel_layer.group_discard(group, self.channel_name)
+                for group in self.location_groups | {ride_group(ride_id) for ride_id in self.ride_ids}
+            ))
             print(f"❌ WebSocket disconnected: {self.user.username}")
         else:
             print(f"❌ WebSocket disconnected: Anonymous user")
     
-    async def receive(self, text_data):
+    async def send_frame(self, frame):
+        """Encode a frame with the negotiated codec"""
+        await self.send_encoded(self.codec.encode(frame))
+
+    async def send_encoded(self, data):
+        """Send a frame already encoded with the negotiated codec"""
+        if self.codec.binary:
+            await self.send(bytes_data=data)
+        else:
+            await self.send(text_data=data)
+
+    async def receive(self, text_data=None, bytes_data=None):
         """Receive message from WebSocket"""
         try:
-            data = json.loads(text_data)
+            data = self.codec.decode(text_data, bytes_data)
             message_type = data.get('type')
             
             # Check authentication for sensitive operations
             if not self.user.is_authenticated:
-                await self.send(text_data=json.dumps({
+                await self.send_frame({
                     'type': 'error',
                     'message': 'Authentication required'
-                }))
+                })
                 return
             
             if message_type == 'location_update':
                 await self.handle_location_update(data)
             
+            elif message_type == 'subscribe_area':
+                await self.handle_subscribe_area(data)
+            
             elif message_type == 'ping':
-                await self.send(text_data=json.dumps({'type': 'pong'}))
+                await self.send_frame({'type': 'pong'})
         
         except Exception as e:
             print(f"Error in receive: {e}")
-            await self.send(text_data=json.dumps({
+            await self.send_frame({
                 'type': 'error',
                 'message': str(e)
-            }))
+            })
     
     async def handle_location_update(self, data):
         latitude = data.get('latitude')
         longitude = data.get('longitude')
 
         if latitude is None or longitude is None:
-            await self.send(text_data=json.dumps({
+            await self.send_frame({
                 'type': 'error',
                 'message': 'Latitude and longitude are required'
-            }))
+            })
             return
 
-        # Save to database
-        await self.save_user_location(latitude, longitude)
-
-        # Broadcast to others (optional)
-        await self.channel_layer.group_send(
-            self.location_room,
-            {
-                'type': 'location_broadcast',
-                'driver_id': self.user.id,
-                'latitude': latitude,
-                'longitude': longitude,
-            }
+        # Save to database (False when the ingestion filter drops a driver's ping)
+        ingested = await self.save_user_location(latitude, longitude)
+
+        # Watch the cells around where we are now
+        await self.update_location_groups(latitude, longitude)
+
+        # Drivers are shown only to their riders while on a ride, else to clients watching their cell
+        if self.user.user_type == 'driver' and ingested:
+            group = await database_sync_to_async(driver_location_group)(
+                self.user.id, latitude, longitude
+            )
+
+            # Batched into the group's next tick frame when aggregation is on
+            broadcaster = get_location_broadcaster()
+            if broadcaster and broadcaster.publish(group, self.user.id, latitude, longitude):
+                return
+
+            await self.channel_layer.group_send(
+                group,
+                {
+                    'type': 'location_broadcast',
+                    'driver_id': self.user.id,
+                    'latitude': latitude,
+                    'longitude': longitude,
+                }
+            )
+
+    async def handle_subscribe_area(self, data):
+        """Watch drivers around a point without reporting our own location"""
+        latitude = data.get('latitude')
+        longitude = data.get('longitude')
+
+        if latitude is None or longitude is None:
+            await self.send_frame({
+                'type': 'error',
+                'message': 'Latitude and longitude are required'
+            })
+            return
+
+        await self.update_location_groups(latitude, longitude)
+
+    async def update_location_groups(self, latitude, longitude):
+        """Join the cell groups around a point and leave the ones out of range"""
+        cell = location_cell(latitude, longitude)
+        if cell == self.location_cell:
+            return
+
+        # A passenger on a ride only follows their own driver
+        if self.ride_ids and self.user.user_type != 'driver':
+            groups = set()
+        else:
+            groups = location_groups_around(latitude, longitude)
+        await asyncio.gather(
+            *(self.channel_layer.group_add(group, self.channel_name)
+              for group in groups - self.location_groups),
+            *(self.channel_layer.group_discard(group, self.channel_name)
+              for group in self.location_groups - groups),
         )
+        self.location_cell = cell
+        self.location_groups = groups
+
+    async def join_ride(self, ride_id):
+        await self.channel_layer.group_add(ride_group(ride_id), self.channel_name)
+        self.ride_ids.add(ride_id)
+
+        # Passengers stop receiving area broadcasts while their ride is in progress
+        if self.user.user_type != 'driver' and self.location_groups:
+            await asyncio.gather(*(
+                self.channel_layer.group_discard(group, self.channel_name)
+                for group in self.location_groups
+            ))
+            self.location_groups = set()
 
     @database_sync_to_async
-    def save_user_location(self, latitude, longitude):
+    def get_active_ride_ids(self):
+        from django.db.models import Q
+        from .models import Ride
+
         user = self.user
-        user.current_latitude = latitude
-        user.current_longitude = longitude
-        user.location_updated_at = timezone.now()
-        user.save(update_fields=[
-            'current_latitude',
-            'current_longitude',
-            'location_updated_at'
-        ])
+        return list(
+            Ride.objects.filter(status__in=['accepted', 'picked_up'])
+            .filter(Q(passenger=user) | Q(driver=user) | Q(shared_passengers__passenger=user))
+            .values_list('id', flat=True)
+            .distinct()
+        )
+
+    @database_sync_to_async
+    def save_user_location(self, latitude, longitude):
+        # Buffered; the flusher bulk-writes the latest position per user
+        from .availability import driver_heartbeat
+        from .ingestion import should_ingest
+        from .location_buffer import buffer_user_location
+        from .traces import record_trace_point
+        is_driver = self.user.user_type == 'driver'
+        if is_driver:
+            driver_heartbeat(self.user.id)
+            if not should_ingest(self.user.id, latitude, longitude):
+                return False
+        buffer_user_location(self.user, latitude, longitude)
+        if is_driver:
+            record_trace_point(self.user.id, latitude, longitude)
+        return True
 
     # Handle new ride notifications (sent to drivers)
     async def new_ride_notification(self, event):
         """Send new ride notification to driver"""
-        await self.send(text_data=json.dumps({
+        await self.send_frame({
             'type': 'new_ride',
             'ride_id': event['ride_id'],
             'passenger_name': event['passenger_name'],
@@ -119,12 +240,17 @@ class LocationConsumer(AsyncWebsocketConsumer):
             'fare': event['fare'],
             'estimated_distance': event['estimated_distance'],
             'ride_type': event['ride_type'],
-        }))
+        })
+    
+    # Frames encoded once by the sender for every recipient (see rides.protocol.prepare)
+    async def prepared_frame(self, event):
+        """Send our codec's copy of a prepared frame as is"""
+        await self.send_encoded(self.codec.fill(event['frames'][self.codec.name], event.get('value')))
     
     # Handle ride accepted notifications (sent to passengers)
     async def ride_accepted_notification(self, event):
         """Send ride accepted notification to passenger"""
-        await self.send(text_data=json.dumps({
+        await self.send_frame({
             'type': 'ride_accepted',
             'ride_id': event['ride_id'],
             'driver_name': event['driver_name'],
@@ -134,22 +260,90 @@ class LocationConsumer(AsyncWebsocketConsumer):
             'vehicle_number': event['vehicle_number'],
             'vehicle_color': event['vehicle_color'],
             'driver_rating': event['driver_rating'],
-        }))
+        })
+    
+    # Handle pooled passengers joining a shared ride (sent to the driver)
+    async def shared_passenger_notification(self, event):
+        """Send pooled passenger details to driver"""
+        await self.send_frame({
+            'type': 'shared_passenger_added',
+            'ride_id': event['ride_id'],
+            'passenger_name': event['passenger_name'],
+            'passenger_phone': event['passenger_phone'],
+            'pickup_latitude': event['pickup_latitude'],
+            'pickup_longitude': event['pickup_longitude'],
+            'dropoff_latitude': event['dropoff_latitude'],
+            'dropoff_longitude': event['dropoff_longitude'],
+            'fare_share': event['fare_share'],
+        })
+    
+    # Handle payment notifications (sent to passenger and driver)
+    async def payment_notification(self, event):
+        """Send payment confirmation"""
+        await self.send_frame({
+            'type': 'payment_completed',
+            'ride_id': event['ride_id'],
+            'amount': event['amount'],
+            'method': event['method'],
+        })
     
     # Handle ride status updates
     async def ride_status_update(self, event):
         """Send ride status update"""
-        await self.send(text_data=json.dumps({
+        await self.send_frame({
             'type': 'status_update',
             'ride_id': event['ride_id'],
             'status': event['status'],
-        }))
+        })
+    
+    # Ride-scoped tracking group (see rides.fanout)
+    async def ride_group_join(self, event):
+        """Join a ride's group once it is accepted"""
+        await self.join_ride(event['ride_id'])
+        await self.send_frame({
+            'type': 'ride_tracking_started',
+            'ride_id': event['ride_id'],
+        })
+    
+    async def ride_group_leave(self, event):
+        """Leave a ride's group when it is completed or cancelled"""
+        await self.channel_layer.group_discard(ride_group(event['ride_id']), self.channel_name)
+        self.ride_ids.discard(event['ride_id'])
+        self.location_cell = None  # resubscribe to the area on the next location update
+        await self.send_frame({
+            'type': 'ride_tracking_ended',
+            'ride_id': event['ride_id'],
+            'status': event['status'],
+        })
+    
+    async def location_batch(self, event):
+        """Latest positions of the drivers that moved during the last tick"""
+        for driver_id, lat, lon in event['drivers']:
+            self.batched_drivers[driver_id] = [driver_id, lat, lon]
+        if self.batch_flush is None:
+            self.batch_flush = asyncio.create_task(self.flush_location_batch())
+
+    async def flush_location_batch(self):
+        """Send the tick's merged batch once the other groups' batches have arrived"""
+        broadcaster = get_location_broadcaster()
+        await asyncio.sleep(broadcaster.settle_seconds if broadcaster else 0)
+
+        drivers = list(self.batched_drivers.values())
+        self.batched_drivers = {}
+        self.batch_flush = None
+
+        cap = broadcaster.max_drivers_per_frame if broadcaster else max(len(drivers), 1)
+        for start in range(0, len(drivers), cap):
+            await self.send_frame({
+                'type': 'location_batch',
+                'drivers': drivers[start:start + cap],
+            })
     
     async def location_broadcast(self, event):
         """Send location update to WebSocket"""
-        await self.send(text_data=json.dumps({
+        await self.send_frame({
             'type': 'location_update',
             'driver_id': event['driver_id'],
             'latitude': event['latitude'],
             'longitude': event['longitude'],
-        }))
\ No newline at end of file
+        })
\ No newline at end of file
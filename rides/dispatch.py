@@ -0,0 +1,410 @@
+import asyncio
+import time
+from collections import deque
+from threading import Lock
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .fanout import group_send_many, send_many
+
+# SADD only while the ride's set exists: a plain SADD after close() would reopen it
+ADD_IF_OPEN_LUA = """
+    if redis.call('EXISTS', KEYS[1]) == 1 then
+        return redis.call('SADD', KEYS[1], unpack(ARGV))
+    end
+    return 0
+"""
+
+
+def match_ride(ride_id, limit=None, exclude=()):
+    """[(driver_user_id, message)] offering a pending ride to its nearby drivers.
+
+    At most limit offers, closest first, skipping drivers in exclude.
+    """
+    from .models import Ride
+    from .notifications import new_ride_frames, new_ride_message
+    from .utils import find_nearby_drivers, rank_drivers_by_eta
+
+    ride = Ride.objects.select_related('passenger').filter(id=ride_id, status='pending').first()
+    if ride is None:
+        return []
+
+    # Find the closest drivers, searching outward up to the max radius
+    limit = limit or settings.DISPATCH_MAX_DRIVERS
+    nearby = find_nearby_drivers(
+        float(ride.pickup_latitude),
+        float(ride.pickup_longitude),
+        radius_km=settings.DISPATCH_MAX_RADIUS_KM,
+        limit=limit + len(exclude)
+    )
+    nearby = [item for item in nearby if item['driver'].user_id not in exclude]
+    if not nearby:
+        print(f"⚠️ No drivers found near ride #{ride.id}")
+        return []
+
+    # Closest by road first when a road graph is configured
+    nearby = rank_drivers_by_eta(
+        nearby,
+        float(ride.pickup_latitude),
+        float(ride.pickup_longitude)
+    )
+
+    # Built and encoded once; each driver's offer only adds their distance
+    frames = new_ride_frames(ride)
+    offers = []
+    for driver_info in nearby:
+        driver = driver_info['driver']
+        # Only notify available drivers
+        if driver.status != 'available':
+            continue
+        print(f"📢 Notifying driver {driver.user.username} about ride #{ride.id}")
+        offers.append((driver.user_id, new_ride_message(ride, driver_info['distance'], frames)))
+    return offers[:limit]
+
+
+def notify_nearby_drivers(ride_id, limit=None):
+    """Offer a ride to nearby drivers from the calling thread, in one batched send"""
+    offers = match_ride(ride_id, limit=limit)
+    send_many((f'user_{driver_id}', message) for driver_id, message in offers)
+    print(f"✅ Notified {len(offers)} drivers about ride #{ride_id}")
+    return len(offers)
+
+
+class BaseOfferBook:
+    """Which drivers a ride has been offered to, and whether it is still open.
+
+    Wave dispatch checks is_open() when a wave's window ends instead of
+    polling the rides table; the Ride post_save signal closes the ride
+    once it leaves 'pending'.
+    """
+
+    def __init__(self, ttl_seconds=600):
+        self.ttl_seconds = ttl_seconds
+
+    def open(self, ride_id):
+        raise NotImplementedError
+
+    def add(self, ride_id, driver_ids):
+        """Record offers; a ride closed meanwhile stays closed"""
+        raise NotImplementedError
+
+    def offered(self, ride_id):
+        """Driver ids the ride has been offered to so far"""
+        raise NotImplementedError
+
+    def is_open(self, ride_id):
+        raise NotImplementedError
+
+    def close(self, ride_id):
+        """Stop offering a ride; returns True if it was open"""
+        raise NotImplementedError
+
+
+class InMemoryOfferBook(BaseOfferBook):
+    """Per-process offer state (tests, single-node)"""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self._rides = {}  # ride_id -> set of offered driver ids
+        self._lock = Lock()
+
+    def open(self, ride_id):
+        with self._lock:
+            self._rides.setdefault(ride_id, set())
+
+    def add(self, ride_id, driver_ids):
+        with self._lock:
+            offered = self._rides.get(ride_id)
+            if offered is not None:
+                offered.update(driver_ids)
+
+    def offered(self, ride_id):
+        return set(self._rides.get(ride_id, ()))
+
+    def is_open(self, ride_id):
+        return ride_id in self._rides
+
+    def close(self, ride_id):
+        with self._lock:
+            return self._rides.pop(ride_id, None) is not None
+
+
+class RedisOfferBook(BaseOfferBook):
+    """Offer state shared by all workers; a ride is open while its key exists"""
+
+    def __init__(self, url, **options):
+        super().__init__(**options)
+        import redis
+
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+
+    def _key(self, ride_id):
+        return f'offers:ride:{ride_id}'
+
+    def open(self, ride_id):
+        # Sentinel member keeps the set (and so the ride) alive before the first offer
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.sadd(self._key(ride_id), '-')
+        pipe.expire(self._key(ride_id), self.ttl_seconds)
+        pipe.execute()
+
+    def add(self, ride_id, driver_ids):
+        if driver_ids:
+            self.redis.eval(ADD_IF_OPEN_LUA, 1, self._key(ride_id), *driver_ids)
+
+    def offered(self, ride_id):
+        return {int(member) for member in self.redis.smembers(self._key(ride_id)) if member != '-'}
+
+    def is_open(self, ride_id):
+        return bool(self.redis.exists(self._key(ride_id)))
+
+    def close(self, ride_id):
+        return bool(self.redis.delete(self._key(ride_id)))
+
+
+_offer_book = None
+
+
+def get_offer_book():
+    global _offer_book
+    if _offer_book is None:
+        backend = import_string(settings.DISPATCH_OFFERS['BACKEND'])
+        _offer_book = backend(**settings.DISPATCH_OFFERS.get('OPTIONS', {}))
+    return _offer_book
+
+
+class DispatchWorker:
+    """Matches new rides and fans out the offers off the request path.
+
+    The booking view only submits the ride id; worker tasks on the ASGI
+    event loop pull from a bounded queue, run matching in a thread and
+    send all offers of a ride concurrently, retrying sends that fail with
+    backoff. The worker is started by the first WebSocket connection;
+    until then, or while the queue is full, submit() returns False and the
+    caller dispatches inline.
+    """
+
+    def __init__(self, queue_size=1000, concurrency=4, max_retries=3, retry_backoff=0.05,
+                 waves=None):
+        self.queue_size = queue_size
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.waves = waves  # {'size', 'window', 'max_waves'} for wave dispatch, else broadcast
+
+        self._queue = None
+        self._loop = None
+        self._tasks = []
+        self._closed = {}  # ride_id -> asyncio.Event set when the ride leaves 'pending'
+
+        self.submitted = 0
+        self.rejected = 0
+        self.dispatched = 0
+        self.offers = 0
+        self.retries = 0
+        self.failed_sends = 0
+        self.max_depth = 0
+        self._latencies = deque(maxlen=1000)  # seconds from submit to last offer sent
+
+    @property
+    def running(self):
+        return (
+            self._loop is not None and self._loop.is_running()
+            and any(not task.done() for task in self._tasks)
+        )
+
+    def ensure_running(self):
+        """Start the worker tasks on the current event loop (call from async code)"""
+        loop = asyncio.get_running_loop()
+        if self.running and self._loop is loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [loop.create_task(self._work()) for _ in range(self.concurrency)]
+
+    def submit(self, ride_id):
+        """Queue a ride for dispatch from any thread; False if it must be dispatched inline"""
+        if not self.running or self._queue.qsize() >= self.queue_size:
+            self.rejected += 1
+            return False
+        try:
+            self._loop.call_soon_threadsafe(self._enqueue, ride_id, time.perf_counter())
+        except RuntimeError:  # loop closed since the check
+            self.rejected += 1
+            return False
+        self.submitted += 1
+        return True
+
+    def _enqueue(self, ride_id, submitted_at):
+        try:
+            self._queue.put_nowait((ride_id, submitted_at))
+        except asyncio.QueueFull:
+            # Raced past the size check; wait for room rather than lose the ride
+            self._loop.create_task(self._queue.put((ride_id, submitted_at)))
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+
+    async def _work(self):
+        while True:
+            ride_id, submitted_at = await self._queue.get()
+            try:
+                await self.dispatch(ride_id, submitted_at)
+            except Exception as e:
+                print(f"❌ Error dispatching ride #{ride_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def dispatch(self, ride_id, submitted_at):
+        if self.waves:
+            # Waves outlive a worker slot: they run as their own task, sleeping between waves
+            self._closed[ride_id] = asyncio.Event()
+            self._loop.create_task(self._run_waves(ride_id, submitted_at))
+            return
+
+        sent = len(await self._offer(ride_id, match_ride))
+        latency = time.perf_counter() - submitted_at
+        self._latencies.append(latency)
+        self.dispatched += 1
+        print(
+            f"✅ Notified {sent} drivers about ride #{ride_id} "
+            f"in {latency * 1000:.1f} ms (queue depth {self._queue.qsize()})"
+        )
+
+    async def _offer(self, ride_id, matcher, *args, **kwargs):
+        """Match and send the offers as one batch; returns the driver ids reached"""
+        offers = await database_sync_to_async(matcher)(ride_id, *args, **kwargs)
+        if not offers:
+            return []
+        pairs = [(f'user_{driver_id}', message) for driver_id, message in offers]
+        if not await self._send(pairs, f'ride #{ride_id}'):
+            return []
+        self.offers += len(offers)
+        return [driver_id for driver_id, _ in offers]
+
+    async def _run_waves(self, ride_id, submitted_at):
+        """Offer to the next closest wave until the ride is accepted or waves run out"""
+        book = get_offer_book()
+        closed = self._closed[ride_id]
+        try:
+            await database_sync_to_async(book.open)(ride_id)
+            for wave in range(self.waves['max_waves']):
+                offered = await database_sync_to_async(book.offered)(ride_id)
+                reached = await self._offer(
+                    ride_id, match_ride, limit=self.waves['size'], exclude=offered
+                )
+                await database_sync_to_async(book.add)(ride_id, reached)
+                if wave == 0:
+                    latency = time.perf_counter() - submitted_at
+                    self._latencies.append(latency)
+                    self.dispatched += 1
+                print(f"🌊 Wave {wave + 1} of ride #{ride_id}: offered to {len(reached)} drivers")
+
+                # Accepted here: the event fires; accepted by another worker: the book says so
+                try:
+                    await asyncio.wait_for(closed.wait(), self.waves['window'])
+                except asyncio.TimeoutError:
+                    pass
+                if closed.is_set() or not await database_sync_to_async(book.is_open)(ride_id):
+                    print(f"✅ Ride #{ride_id} taken after {wave + 1} wave(s)")
+                    return
+            print(f"⚠️ Ride #{ride_id} not accepted after {self.waves['max_waves']} waves")
+            await database_sync_to_async(book.close)(ride_id)
+        except Exception as e:
+            print(f"❌ Error in wave dispatch of ride #{ride_id}: {e}")
+        finally:
+            self._closed.pop(ride_id, None)
+
+    def ride_closed(self, ride_id):
+        """Wake the ride's wave task (thread-safe) so no further wave is sent"""
+        if ride_id in self._closed and self.running:
+            self._loop.call_soon_threadsafe(self._set_closed, ride_id)
+
+    def _set_closed(self, ride_id):
+        event = self._closed.get(ride_id)
+        if event is not None:
+            event.set()
+
+    async def _send(self, pairs, label):
+        """Batched group_send with retries and exponential backoff; True once delivered"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                await group_send_many(pairs)
+                return True
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.failed_sends += len(pairs)
+                    print(f"❌ Giving up on offers for {label} after {attempt + 1} attempts: {e}")
+                    return False
+                self.retries += 1
+                await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+        return {
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'open_waves': len(self._closed),
+            'max_depth': self.max_depth,
+            'submitted': self.submitted,
+            'rejected': self.rejected,
+            'dispatched': self.dispatched,
+            'offers': self.offers,
+            'retries': self.retries,
+            'failed_sends': self.failed_sends,
+            'latency_ms_p50': round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+            'latency_ms_p95': round(latencies[int(len(latencies) * 0.95)] * 1000, 1) if latencies else None,
+            'latency_ms_max': round(latencies[-1] * 1000, 1) if latencies else None,
+        }
+
+
+_worker = None
+
+
+def get_dispatch_worker():
+    """The process-wide dispatch worker, or None when dispatch runs inline"""
+    global _worker
+    if _worker is None and settings.DISPATCH_QUEUE_SIZE > 0:
+        _worker = DispatchWorker(
+            queue_size=settings.DISPATCH_QUEUE_SIZE,
+            concurrency=settings.DISPATCH_WORKERS,
+            max_retries=settings.DISPATCH_SEND_RETRIES,
+            retry_backoff=settings.DISPATCH_RETRY_BACKOFF_MS / 1000,
+            waves=wave_settings(),
+        )
+    return _worker
+
+
+def wave_settings():
+    if settings.DISPATCH_MODE != 'waves':
+        return None
+    return {
+        'size': settings.DISPATCH_WAVE_SIZE,
+        'window': settings.DISPATCH_WAVE_WINDOW,
+        'max_waves': settings.DISPATCH_MAX_WAVES,
+    }
+
+
+def dispatch_ride(ride):
+    """Hand a new ride to the dispatch worker, or offer it inline if the worker can't take it"""
+    worker = get_dispatch_worker()
+    if worker is not None and worker.submit(ride.id):
+        return
+    try:
+        # Without the worker's timers only the first wave can go out
+        waves = wave_settings()
+        notify_nearby_drivers(ride.id, limit=waves['size'] if waves else None)
+    except Exception as e:
+        print(f"❌ Error notifying drivers: {e}")
+
+
+def sync_ride_offers(ride):
+    """Close a ride's offers once it is no longer pending"""
+    if ride.status == 'pending' or settings.DISPATCH_MODE != 'waves':
+        return
+    try:
+        get_offer_book().close(ride.id)
+        worker = get_dispatch_worker()
+        if worker is not None:
+            worker.ride_closed(ride.id)
+    except Exception as e:
+        print(f"⚠️ Error closing ride offers: {e}")
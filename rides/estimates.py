@@ -0,0 +1,149 @@
+import json
+import math
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from .roads import routing_version
+from .surge import surge_multiplier
+from .utils import calculate_fare, estimate_route
+
+METERS_PER_DEGREE = 111320
+
+
+class EstimateCache:
+    """Bounded LRU + TTL cache of trip estimates keyed on snapped coordinates.
+
+    Pickup and dropoff are snapped to cells of cell_size_m, so repeated
+    requests around the same pin (or popular places) share one entry. An
+    optional Redis tier lets every worker reuse the others' results. Keys
+    name the routing in use, so straight-line estimates are never served
+    once a road graph is loaded, nor one graph's after another's.
+    """
+
+    def __init__(self, max_size=10000, ttl_seconds=300, cell_size_m=100, redis_url=None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.cell_deg = cell_size_m / METERS_PER_DEGREE
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = Lock()
+
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+        self.redis = None
+        if redis_url:
+            import redis
+            self.redis = redis.Redis.from_url(redis_url, decode_responses=True)
+
+    def key(self, pickup_lat, pickup_lon, dropoff_lat, dropoff_lon, ride_type, routing='line'):
+        cells = ':'.join(
+            str(math.floor(float(value) / self.cell_deg))
+            for value in (pickup_lat, pickup_lon, dropoff_lat, dropoff_lon)
+        )
+        return f'estimate:{routing}:{ride_type}:{cells}'
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+
+        if self.redis is not None:
+            try:
+                cached = self.redis.get(key)
+            except Exception as e:
+                print(f"⚠️ Estimate cache Redis error: {e}")
+                cached = None
+            if cached:
+                value = json.loads(cached)
+                self._store_local(key, value)
+                with self._lock:
+                    self.redis_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value):
+        self._store_local(key, value)
+        if self.redis is not None:
+            try:
+                self.redis.set(key, json.dumps(value), ex=self.ttl_seconds)
+            except Exception as e:
+                print(f"⚠️ Estimate cache Redis error: {e}")
+
+    def _store_local(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.redis_hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'redis_hits': self.redis_hits,
+            'misses': self.misses,
+            'hit_rate': round((self.hits + self.redis_hits) / lookups, 3) if lookups else 0,
+        }
+
+
+_cache = None
+
+
+def get_estimate_cache():
+    global _cache
+    if _cache is None:
+        from django.conf import settings
+
+        _cache = EstimateCache(
+            max_size=settings.ESTIMATE_CACHE_SIZE,
+            ttl_seconds=settings.ESTIMATE_CACHE_TTL,
+            cell_size_m=settings.ESTIMATE_CACHE_CELL_M,
+            redis_url=settings.REDIS_URL,
+        )
+    return _cache
+
+
+def estimate_trip(pickup_lat, pickup_lon, dropoff_lat, dropoff_lon, ride_type='solo'):
+    """{'distance', 'duration', 'fare', 'surge_multiplier'} for a trip.
+
+    Wraps estimate_route, so it caches road-graph and straight-line
+    estimates alike. Only the base fare is cached; the pickup cell's
+    current surge is applied on every call.
+    """
+    cache = get_estimate_cache()
+    key = cache.key(
+        pickup_lat, pickup_lon, dropoff_lat, dropoff_lon, ride_type, routing=routing_version()
+    )
+
+    estimate = cache.get(key)
+    if estimate is None:
+        distance, duration = estimate_route(pickup_lat, pickup_lon, dropoff_lat, dropoff_lon)
+        estimate = {
+            'distance': distance,
+            'duration': duration,
+            'fare': calculate_fare(distance, ride_type),
+        }
+        cache.set(key, estimate)
+
+    surge = surge_multiplier(pickup_lat, pickup_lon)
+    return {
+        **estimate,
+        'fare': round(estimate['fare'] * surge, 2),
+        'surge_multiplier': surge,
+    }
@@ -0,0 +1,215 @@
+import asyncio
+import time
+from collections import defaultdict
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from .spatial import GridIndex
+
+# The Redis batch path reuses private channels_redis internals checked against this release
+# (rides/tests/test_fanout.py); any other version falls back to plain group_send
+CHANNELS_REDIS_VERSION = '4.3.0'
+
+# Same script channels_redis runs per group_send: push to each channel below capacity
+GROUP_SEND_LUA = """
+    local over_capacity = 0
+    local current_time = ARGV[#ARGV - 1]
+    local expiry = ARGV[#ARGV]
+    for i=1,#KEYS do
+        if redis.call('ZCOUNT', KEYS[i], '-inf', '+inf') < tonumber(ARGV[i + #KEYS]) then
+            redis.call('ZADD', KEYS[i], current_time, ARGV[i])
+            redis.call('EXPIRE', KEYS[i], expiry)
+        else
+            over_capacity = over_capacity + 1
+        end
+    end
+    return over_capacity
+"""
+
+_grid = None
+_version_warned = False
+
+
+def _get_grid():
+    global _grid
+    if _grid is None:
+        _grid = GridIndex(cell_size_km=settings.LOCATION_BROADCAST_CELL_KM)  # cell math only
+    return _grid
+
+
+async def group_send_many(pairs, channel_layer=None):
+    """Send many (group, message) pairs at once.
+
+    On the Redis layer every group's members are read in one pipeline and
+    every message is pushed in a second one, so N sends cost two round
+    trips per Redis host instead of about four each. Other layers get the
+    sends concurrently.
+    """
+    channel_layer = channel_layer or get_channel_layer()
+    pairs = list(pairs)
+    if not pairs:
+        return
+    if _is_redis_layer(channel_layer):
+        await _redis_group_send_many(channel_layer, pairs)
+    else:
+        await asyncio.gather(*(
+            channel_layer.group_send(group, message) for group, message in pairs
+        ))
+
+
+def send_many(pairs):
+    """group_send_many for sync code: one event-loop hop for the whole batch"""
+    pairs = list(pairs)
+    if pairs:
+        async_to_sync(group_send_many)(pairs)
+
+
+def _is_redis_layer(channel_layer):
+    """A RedisChannelLayer of the channels_redis release the batch path was verified on"""
+    global _version_warned
+    try:
+        import channels_redis
+        from channels_redis.core import RedisChannelLayer
+    except ImportError:
+        return False
+    if not isinstance(channel_layer, RedisChannelLayer):
+        return False
+    if channels_redis.__version__ != CHANNELS_REDIS_VERSION:
+        if not _version_warned:
+            _version_warned = True
+            print(f"⚠️ channels_redis {channels_redis.__version__} is not {CHANNELS_REDIS_VERSION}; "
+                  f"batched sends fall back to group_send")
+        return False
+    return True
+
+
+async def _redis_group_send_many(layer, pairs):
+    """channels_redis group_send for a batch (mirrors channels_redis 4.3's internals)"""
+    now = time.time()
+
+    # Round trip 1: drop expired members and read the members of every group
+    groups_by_host = defaultdict(list)
+    for group in dict.fromkeys(group for group, _ in pairs):
+        assert layer.require_valid_group_name(group), "Group name not valid"
+        groups_by_host[layer.consistent_hash(group)].append(group)
+
+    async def read_members(index, groups):
+        pipe = layer.connection(index).pipeline(transaction=False)
+        for group in groups:
+            key = layer._group_key(group)
+            pipe.zremrangebyscore(key, min=0, max=int(now) - layer.group_expiry)
+            pipe.zrange(key, 0, -1)
+        results = await pipe.execute()
+        return {
+            group: [channel.decode('utf8') for channel in channels]
+            for group, channels in zip(groups, results[1::2])
+        }
+
+    members = {}
+    for found in await asyncio.gather(*(
+        read_members(index, groups) for index, groups in groups_by_host.items()
+    )):
+        members.update(found)
+
+    # Round trip 2: one script call per message and host, all in one pipeline per host.
+    # Channels pop their lowest score first, so each message gets its own, in send order
+    calls_by_host = defaultdict(list)
+    for sequence, (group, message) in enumerate(pairs):
+        if not members.get(group):
+            continue
+        channel_keys, key_messages, key_capacities = layer._map_channel_keys_to_connection(
+            members[group], message
+        )
+        for index, keys in channel_keys.items():
+            args = [key_messages[key] for key in keys] + [key_capacities[key] for key in keys]
+            calls_by_host[index].append((keys, args + [now + sequence * 1e-6, layer.expiry]))
+
+    async def push(index, calls):
+        pipe = layer.connection(index).pipeline(transaction=False)
+        for keys, args in calls:
+            for key in keys:
+                pipe.zremrangebyscore(key, min=0, max=int(now) - int(layer.expiry))
+            pipe.eval(GROUP_SEND_LUA, len(keys), *keys, *args)
+        await pipe.execute()
+
+    await asyncio.gather(*(push(index, calls) for index, calls in calls_by_host.items()))
+
+
+def location_cell(lat, lon):
+    return _get_grid().cell_for(float(lat), float(lon))
+
+
+def location_group(lat, lon):
+    """Channel group of the broadcast cell containing a point"""
+    row, col = location_cell(lat, lon)
+    return f'location_{row}_{col}'
+
+
+def location_groups_around(lat, lon, radius_km=None):
+    """Groups a client at this point listens to, covering radius_km around it"""
+    if radius_km is None:
+        radius_km = settings.LOCATION_SUBSCRIBE_RADIUS_KM
+    return {
+        f'location_{row}_{col}'
+        for row, col in _get_grid().cells_in_radius(float(lat), float(lon), radius_km)
+    }
+
+
+def ride_group(ride_id):
+    """Group of everyone riding in (or driving) a ride in progress"""
+    return f'ride_{ride_id}'
+
+
+def driver_location_group(driver_id, lat, lon):
+    """Where a driver's position goes: their ride's group while on one, else their cell"""
+    from .traces import get_trace_recorder
+
+    try:
+        ride_id = get_trace_recorder().active_ride(driver_id)
+    except Exception as e:
+        print(f"⚠️ Active ride lookup failed: {e}")
+        ride_id = None
+    if ride_id is not None:
+        return ride_group(ride_id)
+    return location_group(lat, lon)
+
+
+def publish_location(lat, lon, message):
+    """Send a location event to the clients watching the point's cell"""
+    send_many([(location_group(lat, lon), message)])
+
+
+def publish_driver_location(driver_id, lat, lon, message):
+    """Send a driver's location to their ride, or to their cell when not on a ride.
+
+    With tick aggregation running the position joins the group's next
+    location_batch frame instead of going out on its own.
+    """
+    from .broadcaster import get_location_broadcaster
+
+    group = driver_location_group(driver_id, lat, lon)
+    broadcaster = get_location_broadcaster()
+    if broadcaster and broadcaster.publish(group, driver_id, lat, lon):
+        return
+
+    send_many([(group, message)])
+
+
+def ride_group_join_messages(ride):
+    """(group, message) pairs asking the driver's and passengers' sockets to join the ride's group"""
+    members = {ride.passenger_id, ride.driver_id}
+    members.update(ride.shared_passengers.values_list('passenger_id', flat=True))
+    return [
+        (f'user_{user_id}', {'type': 'ride_group_join', 'ride_id': ride.id})
+        for user_id in members - {None}
+    ]
+
+
+def ride_group_leave_message(ride):
+    """(group, message) telling every socket in the ride's group to leave it"""
+    return (
+        ride_group(ride.id),
+        {'type': 'ride_group_leave', 'ride_id': ride.id, 'status': ride.status}
+    )
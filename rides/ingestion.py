@@ -0,0 +1,212 @@
+import math
+import time
+from threading import Lock
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .utils import EARTH_RADIUS_KM
+
+# Filter outcomes; only the first three let a ping through to storage and broadcast
+ACCEPTED = 'accepted'
+STATUS_CHANGE = 'status_change'
+KEEPALIVE = 'keepalive'
+STATIONARY = 'stationary'
+RATE_LIMITED = 'rate_limited'
+
+DECISIONS = (ACCEPTED, STATUS_CHANGE, KEEPALIVE, STATIONARY, RATE_LIMITED)
+PASSED = (ACCEPTED, STATUS_CHANGE, KEEPALIVE)
+
+
+def moved_meters(lat1, lon1, lat2, lon2):
+    """Equirectangular distance; accurate to well under a metre at ping scale"""
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return math.hypot(x, y) * EARTH_RADIUS_KM * 1000
+
+
+class BaseIngestionFilter:
+    """Drops driver pings that carry no news before they cost a write and a broadcast.
+
+    A ping is compared with the last one let through for the same driver:
+    a status change always passes, anything within min_interval_seconds is
+    rate limited, and a move shorter than min_distance_m is dropped as
+    stationary unless keepalive_seconds have passed since the last one.
+    Every decision is counted.
+    """
+
+    def __init__(self, min_distance_m=15.0, keepalive_seconds=30.0,
+                 min_interval_seconds=1.0, log_every=0):
+        self.min_distance_m = min_distance_m
+        self.keepalive_seconds = keepalive_seconds
+        self.min_interval_seconds = min_interval_seconds
+        self.log_every = log_every
+
+    def check(self, driver_id, lat, lon, status=None, now=None):
+        """Return the decision for a ping and remember it if it passes"""
+        now = time.time() if now is None else now
+        lat, lon = float(lat), float(lon)
+
+        last = self._last(driver_id)
+        decision = self.decide(last, lat, lon, status, now)
+        if decision in PASSED:
+            self._remember(driver_id, lat, lon, status or (last and last['status']), now)
+        total = self._count(decision)
+
+        if self.log_every and total % self.log_every == 0:
+            self.log()
+        return decision
+
+    def decide(self, last, lat, lon, status, now):
+        if last is None:
+            return ACCEPTED
+        if status and status != last['status']:
+            return STATUS_CHANGE
+
+        elapsed = now - last['at']
+        if elapsed < self.min_interval_seconds:
+            return RATE_LIMITED
+        if moved_meters(last['lat'], last['lon'], lat, lon) < self.min_distance_m:
+            return KEEPALIVE if elapsed >= self.keepalive_seconds else STATIONARY
+        return ACCEPTED
+
+    def stats(self):
+        counts = self._counts()
+        total = sum(counts.values())
+        suppressed = counts[STATIONARY] + counts[RATE_LIMITED]
+        return {
+            **counts,
+            'total': total,
+            'suppressed': suppressed,
+            'suppressed_ratio': round(suppressed / total, 3) if total else 0.0,
+        }
+
+    def log(self):
+        stats = self.stats()
+        print(
+            f"📉 Location ingestion: {stats['suppressed']}/{stats['total']} pings suppressed "
+            f"({stats['stationary']} stationary, {stats['rate_limited']} rate limited, "
+            f"{stats['keepalive']} keep-alives)"
+        )
+
+    def forget(self, driver_id):
+        raise NotImplementedError
+
+    def _last(self, driver_id):
+        """{'lat', 'lon', 'status', 'at'} of the last ping let through, or None"""
+        raise NotImplementedError
+
+    def _remember(self, driver_id, lat, lon, status, now):
+        raise NotImplementedError
+
+    def _count(self, decision):
+        """Count a decision; returns the total number of decisions"""
+        raise NotImplementedError
+
+    def _counts(self):
+        raise NotImplementedError
+
+
+class InMemoryIngestionFilter(BaseIngestionFilter):
+    """Per-process filter state and counters (tests, single-node)"""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self._drivers = {}
+        self._decisions = dict.fromkeys(DECISIONS, 0)
+        self._lock = Lock()
+
+    def forget(self, driver_id):
+        with self._lock:
+            self._drivers.pop(driver_id, None)
+
+    def _last(self, driver_id):
+        return self._drivers.get(driver_id)
+
+    def _remember(self, driver_id, lat, lon, status, now):
+        with self._lock:
+            self._drivers[driver_id] = {'lat': lat, 'lon': lon, 'status': status, 'at': now}
+
+    def _count(self, decision):
+        with self._lock:
+            self._decisions[decision] += 1
+            return sum(self._decisions.values())
+
+    def _counts(self):
+        with self._lock:
+            return dict(self._decisions)
+
+
+class RedisIngestionFilter(BaseIngestionFilter):
+    """Filter state and counters shared by every worker.
+
+    Each driver's last passed ping is a small hash that expires after
+    twice the keep-alive, so drivers who went quiet start fresh.
+    """
+
+    STATS_KEY = 'ingestion:decisions'
+
+    def __init__(self, url, **options):
+        super().__init__(**options)
+        import redis
+
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.ttl = max(1, int(self.keepalive_seconds * 2))
+
+    def _key(self, driver_id):
+        return f'ingestion:driver:{driver_id}'
+
+    def forget(self, driver_id):
+        self.redis.delete(self._key(driver_id))
+
+    def _last(self, driver_id):
+        state = self.redis.hgetall(self._key(driver_id))
+        if not state:
+            return None
+        return {
+            'lat': float(state['lat']),
+            'lon': float(state['lon']),
+            'status': state.get('status') or None,
+            'at': float(state['at']),
+        }
+
+    def _remember(self, driver_id, lat, lon, status, now):
+        key = self._key(driver_id)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(key, mapping={'lat': lat, 'lon': lon, 'status': status or '', 'at': now})
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def _count(self, decision):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hincrby(self.STATS_KEY, decision, 1)
+        pipe.hincrby(self.STATS_KEY, 'total', 1)
+        return pipe.execute()[1]
+
+    def _counts(self):
+        stored = self.redis.hgetall(self.STATS_KEY)
+        return {decision: int(stored.get(decision, 0)) for decision in DECISIONS}
+
+
+_filter = None
+
+
+def get_ingestion_filter():
+    """The configured filter, or None if ingestion filtering is off"""
+    global _filter
+    if _filter is None and settings.LOCATION_INGESTION['ENABLED']:
+        backend = import_string(settings.LOCATION_INGESTION['BACKEND'])
+        _filter = backend(**settings.LOCATION_INGESTION.get('OPTIONS', {}))
+    return _filter
+
+
+def should_ingest(driver_id, lat, lon, status=None):
+    """Whether a driver ping should be stored and broadcast; True if the filter is off or fails"""
+    ingestion_filter = get_ingestion_filter()
+    if ingestion_filter is None:
+        return True
+    try:
+        return ingestion_filter.check(driver_id, lat, lon, status) in PASSED
+    except Exception as e:
+        print(f"⚠️ Ingestion filter failed, accepting ping: {e}")
+        return True
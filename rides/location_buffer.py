@@ -0,0 +1,308 @@
+import atexit
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from threading import Lock
+
+from django.apps import apps
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Models whose location columns are written behind, per buffer name
+BUFFER_TARGETS = {
+    'drivers': {'model': 'users.Driver', 'timestamp_field': None},
+    'users': {'model': 'users.User', 'timestamp_field': 'location_updated_at'},
+}
+
+COORDINATE_PLACES = Decimal('0.000001')
+
+
+def _coordinate(value, limit):
+    value = float(value)
+    if not -limit <= value <= limit:
+        raise ValueError(f"Coordinate {value} is out of range")
+    return value
+
+
+class BaseLocationBuffer:
+    """Write-behind buffer for location pings.
+
+    record() only keeps the latest position per row; flush() writes every
+    changed row with bulk_update in batches. Pings superseded before a
+    flush never reach the database and are counted as coalesced.
+    """
+
+    def __init__(self, name, interval=2.0, batch_size=500, max_pending=50000):
+        target = BUFFER_TARGETS[name]
+        self.name = name
+        self.model = apps.get_model(target['model'])
+        self.timestamp_field = target['timestamp_field']
+        self.fields = ['current_latitude', 'current_longitude']
+        if self.timestamp_field:
+            self.fields.append(self.timestamp_field)
+
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+
+        self._stats = {
+            'recorded': 0,
+            'coalesced': 0,
+            'dropped': 0,
+            'flushed': 0,
+            'flushes': 0,
+            'failed_flushes': 0,
+            'last_batch_size': 0,
+            'max_batch_size': 0,
+            'last_flush_lag': 0.0,
+            'max_flush_lag': 0.0,
+            'last_flush_ms': 0.0,
+        }
+        self._stats_lock = Lock()
+        self._flush_lock = Lock()
+        self._thread = None
+
+    def record(self, pk, lat, lon, timestamp=None):
+        """Buffer a position; raises ValueError for invalid coordinates"""
+        record = {
+            'latitude': _coordinate(lat, 90),
+            'longitude': _coordinate(lon, 180),
+            'timestamp': time.time() if timestamp is None else timestamp,
+        }
+        outcome = self._put(pk, record)
+        self._count('recorded')
+        if outcome == 'replaced':
+            self._count('coalesced')
+        elif outcome == 'dropped':
+            self._count('dropped')
+
+    def pending(self, pk):
+        """The buffered position of a row not yet flushed, or None"""
+        raise NotImplementedError
+
+    def pending_count(self):
+        raise NotImplementedError
+
+    def flush(self):
+        """Write all buffered positions to the database; returns the row count"""
+        with self._flush_lock:
+            records = self._take()
+            if not records:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                self._write(records)
+            except Exception as e:
+                print(f"❌ Error flushing {self.name} locations: {e}")
+                self._requeue(records)
+                self._count('failed_flushes')
+                return 0
+
+            lag = time.time() - min(record['timestamp'] for record in records.values())
+            with self._stats_lock:
+                stats = self._stats
+                stats['flushed'] += len(records)
+                stats['flushes'] += 1
+                stats['last_batch_size'] = len(records)
+                stats['max_batch_size'] = max(stats['max_batch_size'], len(records))
+                stats['last_flush_lag'] = round(lag, 3)
+                stats['max_flush_lag'] = round(max(stats['max_flush_lag'], lag), 3)
+                stats['last_flush_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            return len(records)
+
+    def _write(self, records):
+        objects = []
+        for pk, record in records.items():
+            obj = self.model(pk=int(pk))
+            obj.current_latitude = Decimal(str(record['latitude'])).quantize(COORDINATE_PLACES)
+            obj.current_longitude = Decimal(str(record['longitude'])).quantize(COORDINATE_PLACES)
+            if self.timestamp_field:
+                setattr(obj, self.timestamp_field,
+                        datetime.fromtimestamp(record['timestamp'], tz=dt_timezone.utc))
+            objects.append(obj)
+
+        # bulk_update skips save(), so no auto_now bump, signals or avatar resizing
+        self.model.objects.bulk_update(objects, self.fields, batch_size=self.batch_size)
+
+    def stats(self):
+        with self._stats_lock:
+            return {**self._stats, 'pending': self.pending_count()}
+
+    def start(self):
+        """Flush every interval from a daemon thread (once per process)"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name=f'{self.name}-location-flusher', daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        from django.db import close_old_connections
+
+        while True:
+            time.sleep(self.interval)
+            close_old_connections()
+            self.flush()
+
+    def _count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def _put(self, pk, record):
+        """Store the record; return 'added', 'replaced' or 'dropped'"""
+        raise NotImplementedError
+
+    def _take(self):
+        """Remove and return every buffered {pk: record}"""
+        raise NotImplementedError
+
+    def _requeue(self, records):
+        """Put back records after a failed flush unless a newer ping arrived"""
+        raise NotImplementedError
+
+
+class InMemoryLocationBuffer(BaseLocationBuffer):
+    """Per-process buffer; unflushed pings are lost if the process dies"""
+
+    def __init__(self, name, **options):
+        super().__init__(name, **options)
+        self._pending = {}
+        self._lock = Lock()
+
+    def _put(self, pk, record):
+        with self._lock:
+            if pk in self._pending:
+                self._pending[pk] = record
+                return 'replaced'
+            if len(self._pending) >= self.max_pending:
+                return 'dropped'
+            self._pending[pk] = record
+            return 'added'
+
+    def _take(self):
+        with self._lock:
+            records, self._pending = self._pending, {}
+        return records
+
+    def _requeue(self, records):
+        with self._lock:
+            for pk, record in records.items():
+                self._pending.setdefault(pk, record)
+
+    def pending(self, pk):
+        return self._pending.get(pk)
+
+    def pending_count(self):
+        return len(self._pending)
+
+
+class RedisLocationBuffer(BaseLocationBuffer):
+    """Buffer shared by all workers in a Redis hash.
+
+    A flush atomically renames the hash away, so any number of flushers
+    can run without writing a ping twice.
+    """
+
+    def __init__(self, name, url, **options):
+        super().__init__(name, **options)
+        import redis
+
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.pending_key = f'location_buffer:{name}'
+
+    def _put(self, pk, record):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hlen(self.pending_key)
+        pipe.hset(self.pending_key, pk, json.dumps(record))
+        size, added = pipe.execute()
+        if not added:
+            return 'replaced'
+        if size >= self.max_pending:
+            self.redis.hdel(self.pending_key, pk)
+            return 'dropped'
+        return 'added'
+
+    def _take(self):
+        import redis
+
+        processing_key = f'{self.pending_key}:flushing:{uuid.uuid4().hex}'
+        try:
+            self.redis.rename(self.pending_key, processing_key)
+        except redis.ResponseError:
+            return {}  # nothing buffered
+
+        pipe = self.redis.pipeline()
+        pipe.hgetall(processing_key)
+        pipe.delete(processing_key)
+        records, _ = pipe.execute()
+        return {pk: json.loads(record) for pk, record in records.items()}
+
+    def _requeue(self, records):
+        pipe = self.redis.pipeline(transaction=False)
+        for pk, record in records.items():
+            pipe.hsetnx(self.pending_key, pk, json.dumps(record))
+        pipe.execute()
+
+    def pending(self, pk):
+        record = self.redis.hget(self.pending_key, pk)
+        return json.loads(record) if record else None
+
+    def pending_count(self):
+        return self.redis.hlen(self.pending_key)
+
+
+_buffers = {}
+_buffers_lock = Lock()
+
+
+def get_location_buffer(name):
+    """The configured buffer for 'drivers' or 'users', flushing in-process if enabled"""
+    buffer = _buffers.get(name)
+    if buffer is None:
+        with _buffers_lock:
+            buffer = _buffers.get(name)
+            if buffer is None:
+                config = settings.LOCATION_BUFFER
+                backend = import_string(config['BACKEND'])
+                buffer = backend(name, **config.get('OPTIONS', {}))
+                if config.get('FLUSH_IN_PROCESS', True):
+                    buffer.start()
+                _buffers[name] = buffer
+    return buffer
+
+
+def buffer_driver_location(driver):
+    """Apply a driver ping to the fast tier now and to Postgres on the next flush"""
+    from .location_store import sync_driver
+    from .surge import sync_driver_supply
+    from .traces import record_trace_point
+
+    get_location_buffer('drivers').record(
+        driver.pk, driver.current_latitude, driver.current_longitude
+    )
+    sync_driver(driver)
+    sync_driver_supply(driver)
+    record_trace_point(driver.user_id, driver.current_latitude, driver.current_longitude)
+
+
+def buffer_user_location(user, lat, lon):
+    """Buffer a user's location ping; raises ValueError for invalid coordinates"""
+    get_location_buffer('users').record(user.pk, lat, lon)
+
+
+def pending_location(name, pk):
+    """(lat, lon) buffered for a row but not yet flushed, or None"""
+    try:
+        record = get_location_buffer(name).pending(pk)
+    except Exception as e:
+        print(f"⚠️ Location buffer lookup failed: {e}")
+        return None
+    if record is None:
+        return None
+    return record['latitude'], record['longitude']
@@ -0,0 +1,288 @@
+import json
+import time
+from threading import Lock
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .spatial import GridIndex
+
+# Driver columns the write-behind buffer owns
+LOCATION_FIELDS = frozenset({'current_latitude', 'current_longitude'})
+
+
+class BaseLocationStore:
+    """Latest known position per member plus a radius search over them.
+
+    Members can be stored without being searchable, e.g. a driver on a
+    trip still has a position passengers can track but must not show up
+    in nearby searches.
+    """
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+
+    def update(self, member_id, lat, lon, searchable=True, **meta):
+        raise NotImplementedError
+
+    def remove(self, member_id):
+        raise NotImplementedError
+
+    def position(self, member_id):
+        """Return {'latitude', 'longitude', 'updated_at', **meta} or None"""
+        raise NotImplementedError
+
+    def positions(self, member_ids):
+        """Return {member_id: position} for the members that have one"""
+        positions = {}
+        for member_id in member_ids:
+            position = self.position(member_id)
+            if position is not None:
+                positions[member_id] = position
+        return positions
+
+    def search(self, lat, lon, radius_km):
+        """Return [(member_id, distance_km)] of searchable members, closest first"""
+        raise NotImplementedError
+
+    def nearest(self, lat, lon, k, max_radius_km):
+        """Return the k closest [(member_id, distance_km)] within max_radius_km"""
+        raise NotImplementedError
+
+    def mark_loaded(self):
+        """Return True only for the first caller, so warm-up runs once"""
+        raise NotImplementedError
+
+
+class InMemoryLocationStore(BaseLocationStore):
+    """Per-process store backed by a GridIndex (tests, single-node)"""
+
+    def __init__(self, namespace, cell_size_km=1.0):
+        super().__init__(namespace)
+        self.index = GridIndex(cell_size_km=cell_size_km)
+        self._positions = {}
+        self._loaded = False
+        self._lock = Lock()
+
+    def update(self, member_id, lat, lon, searchable=True, **meta):
+        lat, lon = float(lat), float(lon)
+        self._positions[member_id] = {
+            'latitude': lat,
+            'longitude': lon,
+            'updated_at': time.time(),
+            **meta,
+        }
+        if searchable:
+            self.index.upsert(member_id, lat, lon)
+        else:
+            self.index.remove(member_id)
+
+    def remove(self, member_id):
+        self._positions.pop(member_id, None)
+        self.index.remove(member_id)
+
+    def position(self, member_id):
+        return self._positions.get(member_id)
+
+    def search(self, lat, lon, radius_km):
+        return self.index.search(lat, lon, radius_km)
+
+    def nearest(self, lat, lon, k, max_radius_km):
+        return self.index.nearest(lat, lon, k, max_radius_km)
+
+    def mark_loaded(self):
+        with self._lock:
+            if self._loaded:
+                return False
+            self._loaded = True
+            return True
+
+
+class RedisLocationStore(BaseLocationStore):
+    """Store shared by all workers using Redis GEOADD/GEOSEARCH"""
+
+    def __init__(self, namespace, url, loaded_ttl=3600):
+        super().__init__(namespace)
+        import redis
+
+        # The loaded flag expires so a store that drifted from the DB is rebuilt eventually
+        self.loaded_ttl = loaded_ttl
+
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.geo_key = f'{namespace}:geo'
+        self.positions_key = f'{namespace}:positions'
+        self.loaded_key = f'{namespace}:loaded'
+
+    def update(self, member_id, lat, lon, searchable=True, **meta):
+        lat, lon = float(lat), float(lon)
+        record = json.dumps({
+            'latitude': lat,
+            'longitude': lon,
+            'updated_at': time.time(),
+            **meta,
+        })
+
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(self.positions_key, member_id, record)
+        if searchable:
+            pipe.geoadd(self.geo_key, (lon, lat, member_id))
+        else:
+            pipe.zrem(self.geo_key, member_id)
+        pipe.execute()
+
+    def remove(self, member_id):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hdel(self.positions_key, member_id)
+        pipe.zrem(self.geo_key, member_id)
+        pipe.execute()
+
+    def position(self, member_id):
+        record = self.redis.hget(self.positions_key, member_id)
+        return json.loads(record) if record else None
+
+    def positions(self, member_ids):
+        member_ids = list(member_ids)
+        if not member_ids:
+            return {}
+        records = self.redis.hmget(self.positions_key, member_ids)
+        return {
+            member_id: json.loads(record)
+            for member_id, record in zip(member_ids, records) if record
+        }
+
+    def search(self, lat, lon, radius_km):
+        matches = self.redis.geosearch(
+            self.geo_key,
+            longitude=float(lon),
+            latitude=float(lat),
+            radius=float(radius_km),
+            unit='km',
+            withdist=True,
+            sort='ASC',
+        )
+        return [(int(member), round(distance, 2)) for member, distance in matches]
+
+    def nearest(self, lat, lon, k, max_radius_km):
+        # GEOSEARCH with COUNT + ASC already stops after the k closest
+        matches = self.redis.geosearch(
+            self.geo_key,
+            longitude=float(lon),
+            latitude=float(lat),
+            radius=float(max_radius_km),
+            unit='km',
+            withdist=True,
+            sort='ASC',
+            count=int(k),
+        )
+        return [(int(member), round(distance, 2)) for member, distance in matches]
+
+    def mark_loaded(self):
+        return bool(self.redis.set(self.loaded_key, 1, nx=True, ex=self.loaded_ttl))
+
+
+_stores = {}
+_warmed = set()
+_warm_lock = Lock()
+
+
+def get_location_store(namespace):
+    """Return the configured store for a namespace (one per process)"""
+    store = _stores.get(namespace)
+    if store is None:
+        config = settings.LOCATION_STORE
+        backend = import_string(config['BACKEND'])
+        store = backend(namespace, **config.get('OPTIONS', {}))
+        _stores[namespace] = store
+    return store
+
+
+def _warm_once(store, loader):
+    """Fill a store from the database the first time this process uses it.
+
+    Only the first worker to claim the loaded flag runs the loader; the
+    rest skip the check from then on instead of asking Redis every call.
+    """
+    if store.namespace not in _warmed:
+        with _warm_lock:
+            if store.namespace not in _warmed:
+                if store.mark_loaded():
+                    loader(store)
+                _warmed.add(store.namespace)
+    return store
+
+
+def get_driver_store():
+    """Driver positions keyed by the driver's user id"""
+    return _warm_once(get_location_store('drivers'), _load_drivers)
+
+
+def get_pending_ride_store():
+    """Pickup points of pending rides keyed by ride id"""
+    return _warm_once(get_location_store('pending_rides'), _load_pending_rides)
+
+
+def _load_drivers(store):
+    from users.models import Driver
+
+    rows = Driver.objects.filter(
+        current_latitude__isnull=False,
+        current_longitude__isnull=False
+    ).values_list('user_id', 'current_latitude', 'current_longitude', 'status')
+
+    for user_id, lat, lon, status in rows:
+        store.update(user_id, lat, lon, searchable=(status == 'available'), status=status)
+
+
+def _load_pending_rides(store):
+    from .models import Ride
+
+    rows = Ride.objects.filter(status='pending').values_list(
+        'id', 'pickup_latitude', 'pickup_longitude'
+    )
+    for ride_id, lat, lon in rows:
+        store.update(ride_id, lat, lon)
+
+
+def sync_driver(driver, update_fields=None):
+    """Reflect a driver's current status/position in the store"""
+    from .location_buffer import pending_location
+
+    try:
+        store = get_driver_store()
+        lat, lon = driver.current_latitude, driver.current_longitude
+
+        # A ping still waiting for the bulk flush is newer than a row read from the DB,
+        # and so is the stored position when this save did not write the coordinates
+        pending = pending_location('drivers', driver.pk)
+        if pending is not None:
+            lat, lon = pending
+        elif update_fields is not None and not LOCATION_FIELDS.intersection(update_fields):
+            current = store.position(driver.user_id)
+            if current is not None:
+                lat, lon = current['latitude'], current['longitude']
+
+        if lat is None or lon is None:
+            store.remove(driver.user_id)
+            return
+
+        store.update(
+            driver.user_id,
+            lat,
+            lon,
+            searchable=(driver.status == 'available'),
+            status=driver.status,
+        )
+    except Exception as e:
+        print(f"❌ Error updating driver location store: {e}")
+
+
+def sync_pending_ride(ride):
+    """Index a ride's pickup while it is pending, drop it otherwise"""
+    try:
+        store = get_pending_ride_store()
+        if ride.status == 'pending':
+            store.update(ride.id, ride.pickup_latitude, ride.pickup_longitude)
+        else:
+            store.remove(ride.id)
+    except Exception as e:
+        print(f"❌ Error updating pending ride store: {e}")
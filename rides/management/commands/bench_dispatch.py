@@ -0,0 +1,107 @@
+import math
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Simulate ride offers: accept contention and time-to-accept, broadcast vs waves"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rides', type=int, default=10000)
+        parser.add_argument('--drivers-per-ride', type=float, default=20,
+                            help='Mean available drivers within the radius of a pickup')
+        parser.add_argument('--radius-km', type=float, default=5)
+        parser.add_argument('--accept-prob', type=float, default=0.35,
+                            help='Chance the closest driver takes an offer (falls off with distance)')
+        parser.add_argument('--reaction-s', type=float, default=6,
+                            help='Median seconds from offer to a driver tapping accept')
+        parser.add_argument('--wave-size', type=int, default=settings.DISPATCH_WAVE_SIZE)
+        parser.add_argument('--wave-window', type=float, default=settings.DISPATCH_WAVE_WINDOW)
+        parser.add_argument('--max-waves', type=int, default=settings.DISPATCH_MAX_WAVES)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        rides = [self._ride(rng, options) for _ in range(options['rides'])]
+        waves = options['max_waves']
+
+        self.stdout.write(
+            f"{options['rides']} rides, ~{options['drivers_per_ride']:.0f} drivers within "
+            f"{options['radius_km']} km, waves of {options['wave_size']} every "
+            f"{options['wave_window']} s (max {waves})"
+        )
+        self.stdout.write(
+            f"{'mode':>10} {'offers':>7} {'accepts':>8} {'404s':>6} {'races':>6} "
+            f"{'p50 s':>6} {'p95 s':>6} {'unfilled':>9} {'pickup km':>10}"
+        )
+
+        for mode in ('broadcast', 'waves'):
+            results = [self._simulate(mode, ride, options) for ride in rides]
+            filled = [r for r in results if r['accepted_at'] is not None]
+            times = np.array([r['accepted_at'] for r in filled]) if filled else np.zeros(1)
+
+            self.stdout.write(
+                f"{mode:>10} "
+                f"{np.mean([r['offers'] for r in results]):>7.1f} "
+                f"{np.mean([r['attempts'] for r in results]):>8.2f} "
+                f"{np.mean([r['attempts'] - (r['accepted_at'] is not None) for r in results]):>6.2f} "
+                f"{np.mean([r['races'] for r in results]):>6.2f} "
+                f"{np.percentile(times, 50):>6.1f} {np.percentile(times, 95):>6.1f} "
+                f"{1 - len(filled) / len(results):>9.1%} "
+                f"{np.mean([r['pickup_km'] for r in filled]) if filled else 0:>10.2f}"
+            )
+
+        self.stdout.write(
+            "accepts/404s: accept calls per ride and the ones that lost; races: losing calls "
+            "within 1 s of the winner (concurrent UPDATEs on the same row)"
+        )
+
+    def _ride(self, rng, options):
+        """Drivers around one pickup, closest first: (distance_km, accepts, reaction_s)"""
+        count = rng.poisson(options['drivers_per_ride'])
+        radius = options['radius_km']
+        # Uniform over the disc: distance grows with the square root
+        distances = np.sort(radius * np.sqrt(rng.uniform(0, 1, count)))
+        accept_prob = options['accept_prob'] * (1 - 0.6 * distances / radius)
+        accepts = rng.uniform(0, 1, count) < accept_prob
+        reactions = rng.lognormal(math.log(options['reaction_s']), 0.5, count)
+        return distances, accepts, reactions
+
+    def _simulate(self, mode, ride, options):
+        distances, accepts, reactions = ride
+
+        # When each driver gets the offer (inf: never offered)
+        offered_at = np.full(len(distances), np.inf)
+        if mode == 'broadcast':
+            offered_at[:] = 0
+        else:
+            size, window = options['wave_size'], options['wave_window']
+            for wave in range(options['max_waves']):
+                start = wave * window
+                taken = self._winner(offered_at, accepts, reactions)
+                if taken is not None and taken[0] <= start:
+                    break
+                offered_at[wave * size:(wave + 1) * size] = start
+
+        winner = self._winner(offered_at, accepts, reactions)
+        attempt_times = (offered_at + reactions)[accepts & np.isfinite(offered_at)]
+        accepted_at = winner[0] if winner else None
+        return {
+            'offers': int(np.isfinite(offered_at).sum()),
+            # Every driver who decided to take it taps accept; apps aren't told it's gone
+            'attempts': len(attempt_times),
+            'races': int(((attempt_times > accepted_at) & (attempt_times <= accepted_at + 1)).sum())
+            if winner else 0,
+            'accepted_at': accepted_at,
+            'pickup_km': float(distances[winner[1]]) if winner else None,
+        }
+
+    def _winner(self, offered_at, accepts, reactions):
+        """(time, driver index) of the first accept among the drivers offered so far"""
+        attempt_at = np.where(accepts & np.isfinite(offered_at), offered_at + reactions, np.inf)
+        if not len(attempt_at) or not np.isfinite(attempt_at.min()):
+            return None
+        index = int(attempt_at.argmin())
+        return float(attempt_at[index]), index
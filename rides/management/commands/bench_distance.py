@@ -0,0 +1,63 @@
+import math
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from rides.utils import calculate_distance, calculate_distances, haversine_array
+
+CITY_CENTER = (41.311, 69.279)
+CITY_SPAN_DEG = 0.15
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark scalar vs vectorized Haversine distance"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,1000,5000,100000',
+                            help='Comma-separated candidate counts per query')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        repeat = options['repeat']
+        origin = CITY_CENTER
+
+        self.stdout.write(
+            f"{'points':>8} {'scalar ms':>11} {'vector ms':>11} {'speedup':>9} {'max diff m':>11}"
+        )
+
+        for size in [int(s) for s in options['sizes'].split(',')]:
+            lats = [CITY_CENTER[0] + rng.uniform(-CITY_SPAN_DEG, CITY_SPAN_DEG) for _ in range(size)]
+            lons = [CITY_CENTER[1] + rng.uniform(-CITY_SPAN_DEG, CITY_SPAN_DEG) for _ in range(size)]
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                scalar = [calculate_distance(*origin, lat, lon) for lat, lon in zip(lats, lons)]
+            scalar_ms = (time.perf_counter() - start) * 1000 / repeat
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                vector = calculate_distances(*origin, lats, lons)
+            vector_ms = (time.perf_counter() - start) * 1000 / repeat
+
+            # Compare unrounded values so rounding boundaries don't hide real drift
+            exact = np.array([self._unrounded(*origin, lat, lon) for lat, lon in zip(lats, lons)])
+            max_diff_m = float(np.max(np.abs(haversine_array(*origin, lats, lons) - exact))) * 1000
+            mismatches = int(np.count_nonzero(np.asarray(scalar) != vector))
+
+            self.stdout.write(
+                f"{size:>8} {scalar_ms:>11.3f} {vector_ms:>11.3f} "
+                f"{scalar_ms / vector_ms:>8.1f}x {max_diff_m:>11.2e}"
+            )
+            if mismatches:
+                self.stderr.write(f"  {mismatches} rounded values differ from calculate_distance")
+
+    def _unrounded(self, lat1, lon1, lat2, lon2):
+        lat1_rad, lat2_rad = math.radians(lat1), math.radians(lat2)
+        a = (math.sin(math.radians(lat2 - lat1) / 2) ** 2 +
+             math.cos(lat1_rad) * math.cos(lat2_rad) *
+             math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+        return 6371 * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
@@ -0,0 +1,109 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from rides.utils import bounding_box, calculate_distance, find_nearby_drivers_db
+
+CITY_CENTER = (41.311, 69.279)
+CITY_SPAN_DEG = 0.15
+INDEX_NAME = 'driver_status_location_idx'
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway drivers table, check the bounding-box query uses "
+        f"{INDEX_NAME} and time it against the full scan (rolled back afterwards)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drivers', type=int, default=100000)
+        parser.add_argument('--queries', type=int, default=20)
+        parser.add_argument('--radius', type=float, default=5)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise Rollback
+        except Rollback:
+            self.stdout.write("Seeded rows rolled back")
+
+    def _run(self, options):
+        from users.models import Driver, User
+
+        rng = random.Random(options['seed'])
+        count = options['drivers']
+        radius = options['radius']
+
+        self.stdout.write(f"Seeding {count} drivers...")
+        users = User.objects.bulk_create([
+            User(username=f'bench_driver_{i}', phone_number=f'bench{i}', user_type='driver')
+            for i in range(count)
+        ], batch_size=5000)
+        Driver.objects.bulk_create([
+            Driver(
+                user=user,
+                status=rng.choice(['available', 'available', 'on_trip', 'offline']),
+                current_latitude=f"{CITY_CENTER[0] + rng.uniform(-CITY_SPAN_DEG, CITY_SPAN_DEG):.6f}",
+                current_longitude=f"{CITY_CENTER[1] + rng.uniform(-CITY_SPAN_DEG, CITY_SPAN_DEG):.6f}",
+            )
+            for user in users
+        ], batch_size=5000)
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE users_driver')
+
+        lat, lon = CITY_CENTER
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius)
+        plan = Driver.objects.filter(
+            status='available',
+            current_latitude__range=(f"{min_lat:.6f}", f"{max_lat:.6f}"),
+            current_longitude__range=(f"{min_lon:.6f}", f"{max_lon:.6f}")
+        ).explain()
+        self.stdout.write(plan)
+        if INDEX_NAME in plan:
+            self.stdout.write(self.style.SUCCESS(f"Bounding-box query uses {INDEX_NAME}"))
+        else:
+            self.stdout.write(self.style.WARNING(f"{INDEX_NAME} not used by the planner"))
+
+        points = [
+            (lat + rng.uniform(-0.1, 0.1), lon + rng.uniform(-0.1, 0.1))
+            for _ in range(options['queries'])
+        ]
+
+        start = time.perf_counter()
+        for point_lat, point_lon in points:
+            self._full_scan(Driver, point_lat, point_lon, radius)
+        scan_ms = (time.perf_counter() - start) * 1000 / len(points)
+
+        start = time.perf_counter()
+        for point_lat, point_lon in points:
+            find_nearby_drivers_db(point_lat, point_lon, radius)
+        bbox_ms = (time.perf_counter() - start) * 1000 / len(points)
+
+        self.stdout.write(f"Full scan:        {scan_ms:10.2f} ms/query")
+        self.stdout.write(f"Bounding box:     {bbox_ms:10.2f} ms/query ({scan_ms / bbox_ms:.1f}x)")
+
+    def _full_scan(self, Driver, lat, lon, radius):
+        """Same query find_nearby_drivers ran before the prefilter"""
+        nearby = []
+        for driver in Driver.objects.filter(
+            status='available',
+            current_latitude__isnull=False,
+            current_longitude__isnull=False
+        ):
+            distance = calculate_distance(
+                lat, lon, float(driver.current_latitude), float(driver.current_longitude)
+            )
+            if distance <= radius:
+                nearby.append({'driver': driver, 'distance': distance})
+        nearby.sort(key=lambda x: x['distance'])
+        return nearby
@@ -0,0 +1,136 @@
+import asyncio
+import math
+import random
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+
+from rides.broadcaster import LocationBroadcaster
+from rides.fanout import location_group, location_groups_around
+
+CITY_CENTER = (41.311, 69.279)
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test of WebSocket location fan-out: one global group vs cell-keyed "
+        "groups vs cell-keyed groups with tick aggregation"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=5000, help='Connected WebSocket clients')
+        parser.add_argument('--drivers', type=int, default=1000, help='Drivers sending location updates')
+        parser.add_argument('--ping-interval', type=float, default=1.0,
+                            help='Seconds between updates from one driver')
+        parser.add_argument('--tick-ms', type=int, default=500, help='Aggregation tick for the batched mode')
+        parser.add_argument('--max-drivers-per-frame', type=int, default=100)
+        parser.add_argument('--sample-updates', type=int, default=50,
+                            help='Driver updates actually pushed through the channel layer per mode')
+        parser.add_argument('--city-span-deg', type=float, default=0.25,
+                            help='Side of the square clients and drivers are spread over (~28 km)')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        span = options['city_span_deg']
+        clients = [self._point(rng, span) for _ in range(options['clients'])]
+        drivers = [self._point(rng, span) for _ in range(options['drivers'])]
+        updates_per_second = options['drivers'] / options['ping_interval']
+
+        self.stdout.write(
+            f"{len(clients)} clients, {len(drivers)} drivers, "
+            f"{updates_per_second:.0f} driver updates/s"
+        )
+        self.stdout.write(
+            f"{'mode':>8} {'groups':>7} {'group sends/s':>14} {'deliveries/s':>13} "
+            f"{'ws frames/s':>12} {'frames/client/s':>16} {'send ms/s':>10}"
+        )
+
+        for mode in ('global', 'sharded', 'batched'):
+            row = asyncio.run(self._run(mode, clients, drivers, rng, options))
+            groups, sends, deliveries, frames, send_ms = row
+            self.stdout.write(
+                f"{mode:>8} {groups:>7} {sends:>14.0f} {deliveries:>13.0f} {frames:>12.0f} "
+                f"{frames / len(clients):>16.2f} {send_ms:>10.1f}"
+            )
+
+    async def _run(self, mode, clients, drivers, rng, options):
+        """Return (groups, group sends/s, layer deliveries/s, WebSocket frames/s, layer ms/s)"""
+        layer = InMemoryChannelLayer(capacity=1000)
+        channels = [f'client.{i}' for i in range(len(clients))]
+
+        # Subscribe every client the way LocationConsumer does
+        subscriptions = []
+        for channel, (lat, lon) in zip(channels, clients):
+            groups = ['location_updates'] if mode == 'global' else location_groups_around(lat, lon)
+            for group in groups:
+                await layer.group_add(group, channel)
+            subscriptions.append(groups)
+        members = {group: len(channels) for group, channels in layer.groups.items()}
+
+        def group_for(lat, lon):
+            return 'location_updates' if mode == 'global' else location_group(lat, lon)
+
+        updates_per_second = len(drivers) / options['ping_interval']
+
+        if mode != 'batched':
+            # One message per driver update, delivered to every member of its group
+            fanout = sum(members.get(group_for(*point), 0) for point in drivers) / len(drivers)
+            sample = drivers[:options['sample_updates']]
+            messages = [
+                (group_for(lat, lon), {
+                    'type': 'location_broadcast', 'driver_id': driver_id,
+                    'latitude': lat, 'longitude': lon,
+                })
+                for driver_id, (lat, lon) in enumerate(sample)
+            ]
+            send_ms = await self._send(layer, messages) / len(sample) * updates_per_second
+            deliveries = fanout * updates_per_second
+            return len(members), updates_per_second, deliveries, deliveries, send_ms
+
+        # One tick: every driver that pinged during it lands in its group's batch
+        tick_seconds = options['tick_ms'] / 1000
+        ticks_per_second = 1 / tick_seconds
+        chance = min(1.0, tick_seconds / options['ping_interval'])
+        broadcaster = LocationBroadcaster(tick_seconds, options['max_drivers_per_frame'])
+        pending = {}
+        for driver_id, (lat, lon) in enumerate(drivers):
+            if rng.random() < chance:
+                pending.setdefault(group_for(lat, lon), {})[driver_id] = (lat, lon)
+        broadcaster._pending = pending
+        messages = broadcaster.drain()
+
+        deliveries = sum(members.get(group, 0) for group, _ in messages)
+
+        # Each consumer merges the batches of its groups into one frame per tick
+        cap = options['max_drivers_per_frame']
+        frames = 0
+        for groups in subscriptions:
+            changed = sum(len(pending.get(group, ())) for group in groups)
+            frames += math.ceil(changed / cap)
+
+        send_ms = await self._send(layer, messages) * ticks_per_second
+        return (
+            len(members), len(messages) * ticks_per_second, deliveries * ticks_per_second,
+            frames * ticks_per_second, send_ms,
+        )
+
+    async def _send(self, layer, messages):
+        """Push messages through the layer; returns elapsed ms"""
+        started = time.perf_counter()
+        for group, message in messages:
+            await layer.group_send(group, message)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        expected = sum(len(layer.groups.get(group, ())) for group, _ in messages)
+        delivered = sum(queue.qsize() for queue in layer.channels.values())
+        if delivered != expected:
+            self.stderr.write("⚠️ layer dropped messages (channel capacity reached)")
+        return elapsed_ms
+
+    def _point(self, rng, span):
+        return (
+            CITY_CENTER[0] + rng.uniform(-span / 2, span / 2),
+            CITY_CENTER[1] + rng.uniform(-span / 2, span / 2),
+        )
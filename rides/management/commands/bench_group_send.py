@@ -0,0 +1,64 @@
+import statistics
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand
+
+from rides.fanout import send_many
+
+
+class Command(BaseCommand):
+    help = (
+        "Time notifying N recipients from sync code: one async_to_sync(group_send) "
+        "per message vs one batched send_many"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipients', default='1,10,100',
+                            help='Comma-separated recipient counts')
+        parser.add_argument('--repeat', type=int, default=50,
+                            help='Batches per measurement (stay under the channel capacity)')
+
+    def handle(self, *args, **options):
+        channel_layer = get_channel_layer()
+        self.stdout.write(f"Channel layer: {channel_layer.__class__.__name__}")
+        self.stdout.write(f"{'recipients':>10} {'loop ms':>9} {'batched ms':>11} {'speedup':>8}")
+
+        for count in [int(n) for n in options['recipients'].split(',')]:
+            pairs = self._subscribe(channel_layer, count)
+
+            def loop():
+                for group, message in pairs:
+                    async_to_sync(channel_layer.group_send)(group, message)
+
+            loop_ms = self._time(loop, options['repeat'])
+            async_to_sync(channel_layer.flush)()
+            pairs = self._subscribe(channel_layer, count)
+            batched_ms = self._time(lambda: send_many(pairs), options['repeat'])
+            async_to_sync(channel_layer.flush)()
+
+            self.stdout.write(
+                f"{count:>10} {loop_ms:>9.2f} {batched_ms:>11.2f} {loop_ms / batched_ms:>7.1f}x"
+            )
+
+    def _subscribe(self, channel_layer, count):
+        """One personal group per recipient, like user_<id>; returns the messages to send"""
+        pairs = []
+        for index in range(count):
+            channel = async_to_sync(channel_layer.new_channel)()
+            group = f'bench_user_{index}'
+            async_to_sync(channel_layer.group_add)(group, channel)
+            pairs.append((group, {
+                'type': 'ride_status_update', 'ride_id': 90211, 'status': 'accepted',
+            }))
+        return pairs
+
+    def _time(self, send, repeat):
+        """Median ms per batch"""
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            send()
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples)
@@ -0,0 +1,67 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from rides.matching import UNREACHABLE, build_cost_matrix, solve_assignment
+
+CITY_CENTER = (41.311, 69.279)
+CITY_SPAN_DEG = 0.15
+
+
+class Command(BaseCommand):
+    help = "Benchmark batch matching solve time and pickup distance vs first-come greedy"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='500,2000',
+                            help='Comma-separated problem sizes (rides = drivers = N)')
+        parser.add_argument('--max-pickup', type=float, default=10)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+
+        self.stdout.write(
+            f"{'size':>11} {'cost ms':>9} {'solve ms':>9} {'matched':>8} "
+            f"{'batch km':>9} {'greedy km':>10}"
+        )
+
+        for size in [int(s) for s in options['sizes'].split(',')]:
+            ride_lats, ride_lons = self._points(rng, size)
+            driver_lats, driver_lons = self._points(rng, size)
+
+            start = time.perf_counter()
+            cost = build_cost_matrix(ride_lats, ride_lons, driver_lats, driver_lons,
+                                     options['max_pickup'])
+            cost_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            pairs = solve_assignment(cost)
+            solve_ms = (time.perf_counter() - start) * 1000
+
+            batch_km = np.mean([cost[i, j] for i, j in pairs]) if pairs else 0
+            greedy_km = self._greedy_mean(cost)
+
+            self.stdout.write(
+                f"{size:>5}x{size:<5} {cost_ms:>9.1f} {solve_ms:>9.1f} {len(pairs):>8} "
+                f"{batch_km:>9.2f} {greedy_km:>10.2f}"
+            )
+
+    def _points(self, rng, n):
+        return (
+            CITY_CENTER[0] + rng.uniform(-CITY_SPAN_DEG, CITY_SPAN_DEG, n),
+            CITY_CENTER[1] + rng.uniform(-CITY_SPAN_DEG, CITY_SPAN_DEG, n),
+        )
+
+    def _greedy_mean(self, cost):
+        """Rides in request order each take the closest free driver (broadcast mode)"""
+        free = np.ones(cost.shape[1], dtype=bool)
+        picked = []
+        for row in cost:
+            masked = np.where(free, row, UNREACHABLE)
+            j = int(np.argmin(masked))
+            if masked[j] >= UNREACHABLE:
+                continue
+            free[j] = False
+            picked.append(masked[j])
+        return float(np.mean(picked)) if picked else 0
@@ -0,0 +1,68 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from rides.spatial import GridIndex
+from rides.utils import calculate_distance
+
+# Rough bounding box around Tashkent
+CITY_CENTER = (41.311, 69.279)
+CITY_SPAN_DEG = 0.15
+
+
+class Command(BaseCommand):
+    help = "Benchmark nearby-driver search: linear scan vs grid index"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000',
+                            help='Comma-separated driver counts')
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--radius', type=float, default=5)
+        parser.add_argument('--cell-size', type=float, default=1.0)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        radius = options['radius']
+
+        self.stdout.write(f"{'drivers':>10} {'scan ms/q':>12} {'index ms/q':>12} {'speedup':>9}")
+
+        for size in [int(s) for s in options['sizes'].split(',')]:
+            drivers = [(i, *self._random_point(rng)) for i in range(size)]
+            queries = [self._random_point(rng) for _ in range(options['queries'])]
+
+            index = GridIndex(cell_size_km=options['cell_size'])
+            for driver_id, lat, lon in drivers:
+                index.upsert(driver_id, lat, lon)
+
+            start = time.perf_counter()
+            scan_results = [self._scan(drivers, lat, lon, radius) for lat, lon in queries]
+            scan_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+            start = time.perf_counter()
+            index_results = [index.search(lat, lon, radius) for lat, lon in queries]
+            index_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+            if [len(r) for r in scan_results] != [len(r) for r in index_results]:
+                self.stderr.write(f"Result mismatch at {size} drivers")
+
+            self.stdout.write(
+                f"{size:>10} {scan_ms:>12.3f} {index_ms:>12.3f} {scan_ms / index_ms:>8.1f}x"
+            )
+
+    def _random_point(self, rng):
+        return (
+            CITY_CENTER[0] + rng.uniform(-CITY_SPAN_DEG, CITY_SPAN_DEG),
+            CITY_CENTER[1] + rng.uniform(-CITY_SPAN_DEG, CITY_SPAN_DEG),
+        )
+
+    def _scan(self, drivers, lat, lon, radius):
+        """Same algorithm find_nearby_drivers used before the index"""
+        nearby = []
+        for driver_id, driver_lat, driver_lon in drivers:
+            distance = calculate_distance(lat, lon, driver_lat, driver_lon)
+            if distance <= radius:
+                nearby.append((driver_id, distance))
+        nearby.sort(key=lambda x: x[1])
+        return nearby
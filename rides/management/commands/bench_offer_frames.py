@@ -0,0 +1,78 @@
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from rides.models import Ride
+from rides.notifications import new_ride_frames, new_ride_message
+from rides.protocol import CODECS
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "CPU to build and encode one ride offer for N drivers: a frame dict and "
+        "encode per recipient vs one prepared frame per event"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipients', default='1,10,100',
+                            help='Comma-separated driver counts')
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        passenger = User(first_name='Aziza', last_name='Karimova', phone_number='+998901234567')
+        ride = Ride(
+            id=90211, passenger=passenger, pickup_address='Amir Temur Avenue 107, Tashkent',
+            dropoff_address='Tashkent International Airport', fare=Decimal('38500.00'),
+            distance=Decimal('12.40'), ride_type='solo',
+        )
+
+        self.stdout.write(f"{'recipients':>10} {'codec':>16} {'per-recipient µs':>17} "
+                          f"{'prepared µs':>12} {'speedup':>8}")
+        for count in [int(n) for n in options['recipients'].split(',')]:
+            distances = [0.3 + index * 0.05 for index in range(count)]
+            for codec in CODECS:
+                before = self._time(lambda: self._per_recipient(ride, distances, codec),
+                                    options['repeat'])
+                after = self._time(lambda: self._prepared(ride, distances, codec),
+                                   options['repeat'])
+                self.stdout.write(
+                    f"{count:>10} {codec.name:>16} {before:>17.1f} {after:>12.1f} "
+                    f"{before / after:>7.1f}x"
+                )
+
+    def _per_recipient(self, ride, distances, codec):
+        """The old path: message dict per driver, then a frame dict and encode per socket"""
+        for distance in distances:
+            event = {
+                'type': 'new_ride_notification',
+                'ride_id': ride.id,
+                'passenger_name': f"{ride.passenger.first_name} {ride.passenger.last_name}",
+                'passenger_phone': ride.passenger.phone_number,
+                'pickup_address': ride.pickup_address,
+                'dropoff_address': ride.dropoff_address,
+                'distance_to_pickup': round(distance, 2),
+                'fare': str(ride.fare),
+                'estimated_distance': str(ride.distance),
+                'ride_type': ride.ride_type,
+            }
+            codec.encode({'type': 'new_ride', **{
+                key: value for key, value in event.items() if key != 'type'
+            }})
+
+    def _prepared(self, ride, distances, codec):
+        frames = new_ride_frames(ride)
+        for distance in distances:
+            event = new_ride_message(ride, distance, frames)
+            codec.fill(event['frames'][codec.name], event['value'])
+
+    def _time(self, run, repeat):
+        """Median µs per event"""
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            samples.append((time.perf_counter() - started) * 1_000_000)
+        return statistics.median(samples)
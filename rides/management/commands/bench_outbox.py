@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from rides.models import OutboxEvent
+from rides.outbox import OutboxRelay, publish
+
+
+class Command(BaseCommand):
+    help = "Outbox throughput: events written per transaction and relayed to the channel layer"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=20000)
+        parser.add_argument('--per-transaction', type=int, default=2,
+                            help='Events saved by each state change (accept is 2-4)')
+        parser.add_argument('--recipients', type=int, default=100,
+                            help='Personal groups the events are spread over')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if OutboxEvent.objects.exists():
+            self.stdout.write("⚠️ The outbox is not empty; run `manage.py relay_outbox --once` first")
+            return
+
+        channel_layer = get_channel_layer()
+        self.stdout.write(f"Channel layer: {channel_layer.__class__.__name__}")
+        groups = self._subscribe(channel_layer, options['recipients'])
+
+        per_transaction = options['per_transaction']
+        started = time.perf_counter()
+        for start in range(0, options['events'], per_transaction):
+            with transaction.atomic():
+                publish(
+                    (groups[index % len(groups)], {
+                        'type': 'ride_status_update', 'ride_id': index, 'status': 'picked_up',
+                    })
+                    for index in range(start, min(start + per_transaction, options['events']))
+                )
+        write_s = time.perf_counter() - started
+
+        relay = OutboxRelay(batch_size=options['batch_size'])
+        started = time.perf_counter()
+        relayed = asyncio.run(relay.drain())
+        relay_s = time.perf_counter() - started
+        async_to_sync(channel_layer.flush)()
+
+        self.stdout.write(
+            f"write: {options['events'] / write_s:,.0f} events/s "
+            f"({options['events'] // per_transaction:,} transactions of {per_transaction})"
+        )
+        self.stdout.write(
+            f"relay: {relayed / relay_s:,.0f} events/s "
+            f"({relay.batches} batches of up to {options['batch_size']})"
+        )
+
+    def _subscribe(self, channel_layer, count):
+        groups = []
+        for index in range(count):
+            channel = async_to_sync(channel_layer.new_channel)()
+            group = f'bench_user_{index}'
+            async_to_sync(channel_layer.group_add)(group, channel)
+            groups.append(group)
+        return groups
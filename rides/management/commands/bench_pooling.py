@@ -0,0 +1,83 @@
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from rides.pooling import InMemoryPoolIndex, PoolingEngine, SharedTrip
+from rides.utils import calculate_distance
+
+CITY_CENTER = (41.311, 69.279)
+CITY_SPAN_DEG = 0.12
+
+
+class Command(BaseCommand):
+    help = (
+        "Synthetic-load benchmark of shared-ride pooling decisions "
+        "(index lookup and insertion check; the row locking in reserve() is not included)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--open-rides', default='1000,5000,20000',
+                            help='Comma-separated numbers of open shared rides')
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'open':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'pooled':>8}"
+        )
+
+        for open_rides in [int(s) for s in options['open_rides'].split(',')]:
+            rng = random.Random(options['seed'])
+            engine = PoolingEngine(InMemoryPoolIndex())
+            now = time.time()
+
+            trips = {}
+            for ride_id in range(open_rides):
+                self._open(engine, trips, ride_id, self._point(rng), self._point(rng),
+                           now - rng.uniform(0, engine.max_wait_seconds))
+
+            timings = []
+            pooled = 0
+            for i in range(options['requests']):
+                passenger_id = open_rides + i
+                pickup, dropoff = self._point(rng), self._point(rng)
+
+                start = time.perf_counter()
+                candidates = engine.index.candidates(
+                    pickup, dropoff, now, engine.max_pickup_km, engine.max_dropoff_km
+                )
+                oldest = now - engine.max_wait_seconds
+                best = engine.best_insertion(
+                    [trips[ride_id] for ride_id in candidates if trips[ride_id].requested_at >= oldest],
+                    passenger_id, pickup, dropoff, calculate_distance(*pickup, *dropoff)
+                )
+                timings.append((time.perf_counter() - start) * 1000)
+
+                if best is None:
+                    self._open(engine, trips, passenger_id, pickup, dropoff, now)
+                else:
+                    _, trip, stops = best
+                    trip.stops = stops
+                    trip.direct_km[passenger_id] = calculate_distance(*pickup, *dropoff)
+                    engine.index.add(trip.ride_id, trip.requested_at, [pickup], [dropoff])
+                    pooled += 1
+
+            p50, p99 = np.percentile(timings, [50, 99])
+            self.stdout.write(
+                f"{open_rides:>7} {p50:>8.3f} {p99:>8.3f} {max(timings):>8.3f} "
+                f"{pooled / options['requests']:>7.0%}"
+            )
+
+    def _open(self, engine, trips, ride_id, pickup, dropoff, requested_at):
+        trip = SharedTrip(ride_id, requested_at)
+        engine.add_passenger(trip, ride_id, pickup, dropoff)
+        trips[ride_id] = trip
+        engine.index.add(ride_id, requested_at, [pickup], [dropoff])
+
+    def _point(self, rng):
+        return (
+            CITY_CENTER[0] + rng.uniform(-CITY_SPAN_DEG, CITY_SPAN_DEG),
+            CITY_CENTER[1] + rng.uniform(-CITY_SPAN_DEG, CITY_SPAN_DEG),
+        )
@@ -0,0 +1,64 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from rides.protocol import JSON_CODEC, SUBPROTOCOLS
+
+# Frames as LocationConsumer sends them today (location values arrive as strings)
+SAMPLE_FRAMES = {
+    'location_update': {
+        'type': 'location_update',
+        'driver_id': 1842,
+        'latitude': '41.299512',
+        'longitude': '69.240187',
+    },
+    'new_ride': {
+        'type': 'new_ride',
+        'ride_id': 90211,
+        'passenger_name': 'Aziz Rahimov',
+        'passenger_phone': '+998901234567',
+        'pickup_address': 'Amir Temur Square, Tashkent',
+        'dropoff_address': 'Tashkent International Airport',
+        'distance_to_pickup': 1.84,
+        'fare': '22280.00',
+        'estimated_distance': '5.76',
+        'ride_type': 'solo',
+    },
+    'status_update': {
+        'type': 'status_update',
+        'ride_id': 90211,
+        'status': 'picked_up',
+    },
+}
+
+
+class Command(BaseCommand):
+    help = "Bytes and encode CPU per WebSocket frame: JSON vs MessagePack vs CBOR"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=100000)
+
+    def handle(self, *args, **options):
+        codecs = {'json': JSON_CODEC, **SUBPROTOCOLS}
+        iterations = options['iterations']
+
+        self.stdout.write(f"{'frame':>16} {'codec':>16} {'bytes':>6} {'vs json':>8} {'encode us':>10}")
+        for name, frame in SAMPLE_FRAMES.items():
+            json_bytes = len(json.dumps(frame).encode())
+            for codec_name, codec in codecs.items():
+                encoded = codec.encode(frame)
+                size = len(encoded if codec.binary else encoded.encode())
+
+                # Round trip once so the benchmark never measures a lossy codec
+                decoded = codec.decode(bytes_data=encoded) if codec.binary else codec.decode(encoded)
+                assert decoded['type'] == frame['type']
+
+                started = time.perf_counter()
+                for _ in range(iterations):
+                    codec.encode(frame)
+                encode_us = (time.perf_counter() - started) / iterations * 1e6
+
+                self.stdout.write(
+                    f"{name:>16} {codec_name:>16} {size:>6} {size / json_bytes:>7.0%} {encode_us:>10.2f}"
+                )
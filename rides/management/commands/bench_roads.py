@@ -0,0 +1,97 @@
+import random
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from rides.roads import RoadGraph, compile_graph
+from rides.utils import calculate_distance
+
+CITY_CENTER = (41.311, 69.279)
+SPACING_DEG = 0.0009  # ~100 m between intersections
+
+
+class Command(BaseCommand):
+    help = (
+        "Time loading a compiled road graph and routing on it, using a synthetic "
+        "street grid of the given size"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--side', type=int, default=500,
+                            help='Intersections per side of the grid (side^2 nodes)')
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--drivers', type=int, default=10,
+                            help='Origins per durations_to query')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        side = options['side']
+
+        started = time.perf_counter()
+        graph = self._grid(side, rng)
+        build_s = time.perf_counter() - started
+
+        with tempfile.TemporaryDirectory() as path:
+            graph.save(path)
+            started = time.perf_counter()
+            graph = RoadGraph.load(path)
+            load_ms = (time.perf_counter() - started) * 1000
+            self.stdout.write(
+                f"{len(graph)} nodes, {len(graph.indices)} edges: "
+                f"compiled in {build_s:.1f}s, loaded in {load_ms:.1f} ms"
+            )
+
+            span = side * SPACING_DEG / 2
+            trips, etas = [], []
+            for _ in range(options['queries']):
+                origin = self._point(rng, span)
+                # Rides across town: 1-8 km
+                km = rng.uniform(1, 8)
+                dest = (origin[0] + km / 111.195 * rng.choice((-1, 1)) * 0.7,
+                        origin[1] + km / 83.4 * rng.choice((-1, 1)) * 0.7)
+                started = time.perf_counter()
+                graph.route(*origin, *dest)
+                trips.append((time.perf_counter() - started) * 1000)
+
+                # Drivers within 3 km of a pickup
+                drivers = [(origin[0] + rng.uniform(-0.02, 0.02), origin[1] + rng.uniform(-0.027, 0.027))
+                           for _ in range(options['drivers'])]
+                started = time.perf_counter()
+                graph.durations_to(*origin, drivers)
+                etas.append((time.perf_counter() - started) * 1000)
+
+        for label, timings in (('route', trips), (f"durations_to x{options['drivers']}", etas)):
+            timings.sort()
+            self.stdout.write(
+                f"{label:>16}: p50 {statistics.median(timings):.2f} ms, "
+                f"p95 {timings[int(len(timings) * 0.95)]:.2f} ms, max {timings[-1]:.2f} ms"
+            )
+
+    def _point(self, rng, span):
+        return (CITY_CENTER[0] + rng.uniform(-span, span) * 0.8,
+                CITY_CENTER[1] + rng.uniform(-span, span) * 1.33 * 0.8)
+
+    def _grid(self, side, rng):
+        lat0 = CITY_CENTER[0] - side * SPACING_DEG / 2
+        lon0 = CITY_CENTER[1] - side * SPACING_DEG * 1.33 / 2
+        lats, lons = [], []
+        for row in range(side):
+            for col in range(side):
+                lats.append(lat0 + row * SPACING_DEG + rng.uniform(-1e-4, 1e-4))
+                lons.append(lon0 + col * SPACING_DEG * 1.33 + rng.uniform(-1e-4, 1e-4))
+
+        edges = {}
+        for row in range(side):
+            for col in range(side):
+                u = row * side + col
+                for v in ((u + 1) if col + 1 < side else None, (u + side) if row + 1 < side else None):
+                    if v is None:
+                        continue
+                    # Every tenth street is an avenue
+                    speed = 60 if (row % 10 == 0 or col % 10 == 0) else rng.choice((20, 30, 40))
+                    length_m = calculate_distance(lats[u], lons[u], lats[v], lons[v]) * 1000 or 1.0
+                    edges[(u, v)] = edges[(v, u)] = (length_m, length_m / (speed / 3.6))
+        return compile_graph(lats, lons, edges)
@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from rides.location_buffer import BUFFER_TARGETS, get_location_buffer
+
+
+class Command(BaseCommand):
+    help = "Flush buffered location pings to the database and report buffer stats"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            default=settings.LOCATION_BUFFER['OPTIONS']['interval'],
+                            help='Seconds between flushes')
+        parser.add_argument('--once', action='store_true', help='Flush once and exit')
+
+    def handle(self, *args, **options):
+        # This process does the flushing; don't start the in-process thread as well
+        settings.LOCATION_BUFFER['FLUSH_IN_PROCESS'] = False
+        buffers = [get_location_buffer(name) for name in BUFFER_TARGETS]
+
+        while True:
+            started = time.perf_counter()
+            for buffer in buffers:
+                if buffer.flush():
+                    stats = buffer.stats()
+                    self.stdout.write(
+                        f"✅ {buffer.name}: flushed {stats['last_batch_size']} rows "
+                        f"in {stats['last_flush_ms']} ms, lag {stats['last_flush_lag']} s, "
+                        f"{stats['coalesced']} coalesced, {stats['dropped']} dropped, "
+                        f"{stats['pending']} pending"
+                    )
+
+            if options['once']:
+                break
+            time.sleep(max(0, options['interval'] - (time.perf_counter() - started)))
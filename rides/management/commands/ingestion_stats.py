@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from rides.ingestion import DECISIONS, get_ingestion_filter
+
+
+class Command(BaseCommand):
+    help = "Show how many driver pings the location ingestion filter let through or suppressed"
+
+    def handle(self, *args, **options):
+        ingestion_filter = get_ingestion_filter()
+        if ingestion_filter is None:
+            self.stdout.write("⚠️ Location ingestion filter is disabled")
+            return
+        if 'url' not in settings.LOCATION_INGESTION['OPTIONS']:
+            self.stdout.write(
+                "⚠️ In-memory filter: counters are per process, see the workers' "
+                "'Location ingestion' log lines instead"
+            )
+            return
+
+        stats = ingestion_filter.stats()
+        for decision in DECISIONS:
+            self.stdout.write(f"{decision:>14} {stats[decision]:>10}")
+        self.stdout.write(
+            f"{'suppressed':>14} {stats['suppressed']:>10} "
+            f"({stats['suppressed_ratio']:.1%} of {stats['total']} pings: writes and broadcasts saved)"
+        )
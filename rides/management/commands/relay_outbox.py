@@ -0,0 +1,30 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from rides.outbox import get_outbox_relay
+
+
+class Command(BaseCommand):
+    help = "Relay ride and payment events from the outbox to the channel layer"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Relay until caught up and exit')
+        parser.add_argument('--stats-interval', type=float, default=60,
+                            help='Seconds between stats lines')
+
+    def handle(self, *args, **options):
+        asyncio.run(self._relay(options))
+
+    async def _relay(self, options):
+        relay = get_outbox_relay()
+        if options['once']:
+            relayed = await relay.drain()
+            self.stdout.write(f"✅ Relayed {relayed} events")
+            return
+
+        relay.ensure_running()
+        self.stdout.write(f"✅ Relaying outbox events as {relay.owner}")
+        while True:
+            await asyncio.sleep(options['stats_interval'])
+            self.stdout.write(str(relay.stats()))
@@ -0,0 +1,40 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from rides.matching import BatchMatcher
+
+
+class Command(BaseCommand):
+    help = "Run the batch ride-to-driver matcher (use with DISPATCH_MODE=batch)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=settings.DISPATCH_BATCH_INTERVAL,
+                            help='Seconds between matching rounds')
+        parser.add_argument('--once', action='store_true', help='Run a single round and exit')
+
+    def handle(self, *args, **options):
+        if settings.DISPATCH_MODE != 'batch':
+            self.stdout.write(self.style.WARNING(
+                "DISPATCH_MODE is not 'batch'; rides are also broadcast on booking"
+            ))
+
+        matcher = BatchMatcher(
+            max_pickup_km=settings.DISPATCH_MAX_RADIUS_KM,
+            offer_timeout=settings.DISPATCH_OFFER_TIMEOUT,
+        )
+
+        while True:
+            started = time.perf_counter()
+            try:
+                offers = matcher.run_round()
+                if offers:
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                    self.stdout.write(f"✅ Sent {offers} ride offers ({elapsed_ms:.1f} ms)")
+            except Exception as e:
+                self.stderr.write(f"❌ Matching round failed: {e}")
+
+            if options['once']:
+                break
+            time.sleep(max(0, options['interval'] - (time.perf_counter() - started)))
@@ -0,0 +1,41 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from rides.availability import get_availability_tracker
+
+
+class Command(BaseCommand):
+    help = "Take available drivers offline once their location heartbeat is overdue"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            default=settings.DRIVER_AVAILABILITY['OPTIONS']['sweep_interval'],
+                            help='Seconds between sweeps')
+        parser.add_argument('--once', action='store_true', help='Sweep once and exit')
+
+    def handle(self, *args, **options):
+        # This process does the sweeping; don't start the in-process thread as well
+        settings.DRIVER_AVAILABILITY['SWEEP_IN_PROCESS'] = False
+        tracker = get_availability_tracker()
+        if tracker is None:
+            self.stdout.write("⚠️ Driver heartbeats are disabled")
+            return
+        if not tracker.shared:
+            # Pings land in the workers' own trackers, never in this process
+            self.stdout.write("⚠️ Sweeping from a separate process needs the Redis tracker (set REDIS_URL)")
+            return
+
+        while True:
+            started = time.perf_counter()
+            expired = tracker.sweep()
+            if expired:
+                self.stdout.write(
+                    f"✅ Expired {expired} drivers in {(time.perf_counter() - started) * 1000:.1f} ms, "
+                    f"{tracker.tracked_count()} still tracked"
+                )
+
+            if options['once']:
+                break
+            time.sleep(max(0, options['interval'] - (time.perf_counter() - started)))
@@ -0,0 +1,130 @@
+import time
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from .fanout import send_many
+from .utils import distance_matrix
+
+# Cost given to pairs that must never be matched
+UNREACHABLE = 1e9
+
+
+def build_cost_matrix(ride_lats, ride_lons, driver_lats, driver_lons, max_pickup_km):
+    """Rides x drivers pickup distances; pairs beyond max_pickup_km are unreachable"""
+    cost = distance_matrix(ride_lats, ride_lons, driver_lats, driver_lons)
+    cost[cost > max_pickup_km] = UNREACHABLE
+    return cost
+
+
+def solve_assignment(cost):
+    """Min-cost assignment; returns [(ride_index, driver_index)] of reachable pairs"""
+    if cost.size == 0:
+        return []
+    rows, cols = linear_sum_assignment(cost)
+    return [
+        (int(row), int(col)) for row, col in zip(rows, cols)
+        if cost[row, col] < UNREACHABLE
+    ]
+
+
+class BatchMatcher:
+    """Periodically matches all pending rides to available drivers at once.
+
+    Each round offers every matched ride to a single driver. A ride and its
+    driver are held out of later rounds until the offer times out.
+    """
+
+    def __init__(self, max_pickup_km, offer_timeout):
+        self.max_pickup_km = max_pickup_km
+        self.offer_timeout = offer_timeout
+        self._offers = {}  # ride_id -> (driver_user_id, expires_at)
+
+    def run_round(self):
+        """Run one matching round and return the number of offers sent"""
+        from .models import Ride
+
+        now = time.monotonic()
+        self._offers = {
+            ride_id: offer for ride_id, offer in self._offers.items()
+            if offer[1] > now
+        }
+        offered_drivers = {driver_id for driver_id, _ in self._offers.values()}
+
+        rides = list(
+            Ride.objects.filter(status='pending')
+            .exclude(id__in=list(self._offers))
+            .values_list('id', 'pickup_latitude', 'pickup_longitude')
+        )
+        if not rides:
+            return 0
+        drivers = self._available_drivers(exclude=offered_drivers)
+        if not drivers:
+            return 0
+
+        cost = build_cost_matrix(
+            np.array([row[1] for row in rides], dtype=np.float64),
+            np.array([row[2] for row in rides], dtype=np.float64),
+            np.array([row[1] for row in drivers], dtype=np.float64),
+            np.array([row[2] for row in drivers], dtype=np.float64),
+            self.max_pickup_km,
+        )
+        pairs = solve_assignment(cost)
+
+        matched = {rides[i][0]: (drivers[j][0], float(cost[i, j])) for i, j in pairs}
+        self._send_offers(matched)
+
+        expires_at = now + self.offer_timeout
+        for ride_id, (driver_id, _) in matched.items():
+            self._offers[ride_id] = (driver_id, expires_at)
+
+        return len(matched)
+
+    def _available_drivers(self, exclude):
+        """[(user_id, lat, lon)] of live available drivers at their latest position.
+
+        Positions come from the location store, which has every ping; the
+        drivers table only has them as of the last buffer flush.
+        """
+        from users.models import Driver
+        from .availability import live_driver_ids
+        from .location_store import get_driver_store
+
+        rows = list(
+            Driver.objects.filter(status='available')
+            .exclude(user_id__in=exclude)
+            .values_list('user_id', 'current_latitude', 'current_longitude')
+        )
+        # Drivers past their heartbeat deadline but not swept yet are skipped
+        live = live_driver_ids([row[0] for row in rows])
+        rows = [row for row in rows if row[0] in live]
+
+        try:
+            positions = get_driver_store().positions([row[0] for row in rows])
+        except Exception as e:
+            print(f"⚠️ Location store unavailable, matching on database positions: {e}")
+            positions = {}
+
+        drivers = []
+        for user_id, lat, lon in rows:
+            position = positions.get(user_id)
+            if position is not None:
+                lat, lon = position['latitude'], position['longitude']
+            if lat is not None and lon is not None:
+                drivers.append((user_id, lat, lon))
+        return drivers
+
+    def _send_offers(self, matched):
+        from .models import Ride
+        from .notifications import new_ride_message
+
+        rides = Ride.objects.select_related('passenger').in_bulk(list(matched))
+        offers = [
+            (f'user_{driver_id}', new_ride_message(rides[ride_id], distance))
+            for ride_id, (driver_id, distance) in matched.items()
+            if ride_id in rides
+        ]
+        try:
+            send_many(offers)
+        except Exception as e:
+            print(f"❌ Error sending {len(offers)} ride offers: {e}")
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0003_alter_ride_ride_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RideTraceChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('ended_at', models.DateTimeField()),
+                ('point_count', models.PositiveIntegerField()),
+                ('points', models.BinaryField(help_text='Zigzag varint deltas of microdegrees and seconds')),
+                ('ride', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trace_chunks', to='rides.ride')),
+            ],
+            options={
+                'ordering': ['started_at', 'id'],
+                'indexes': [models.Index(fields=['ride', 'started_at'], name='ride_trace_chunk_idx')],
+            },
+        ),
+    ]
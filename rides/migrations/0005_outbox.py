@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0004_ride_trace_chunk'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxCursor',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('position', models.BigIntegerField(default=0)),
+                ('leased_by', models.CharField(blank=True, max_length=100)),
+                ('leased_until', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group', models.CharField(max_length=100)),
+                ('message', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -57,3 +57,50 @@ class SharedRide(models.Model):
     
     def __str__(self):
         return f"Shared Ride #{self.ride.id} - {self.passenger.username}"
+
+class RideTraceChunk(models.Model):
+    """A batch of GPS points recorded during a ride (see rides.traces for the format)"""
+    ride = models.ForeignKey(Ride, on_delete=models.CASCADE, related_name='trace_chunks')
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField()
+    point_count = models.PositiveIntegerField()
+    points = models.BinaryField(help_text="Zigzag varint deltas of microdegrees and seconds")
+
+    class Meta:
+        ordering = ['started_at', 'id']
+        indexes = [
+            models.Index(fields=['ride', 'started_at'], name='ride_trace_chunk_idx'),
+        ]
+
+    def __str__(self):
+        return f"Trace of ride #{self.ride_id} - {self.point_count} points"
+
+class OutboxEvent(models.Model):
+    """A channel-layer message saved in the same transaction as the change it announces.
+
+    rides.outbox relays events to the channel layer in id order and
+    deletes them once they are past the relay's high-water mark.
+    """
+    group = models.CharField(max_length=100)
+    message = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"Outbox event #{self.id} - {self.message.get('type')} to {self.group}"
+
+class OutboxCursor(models.Model):
+    """High-water mark of a relay: every event with id <= position has been sent.
+
+    The relay holding the lease (leased_by, until leased_until) is the only
+    one sending, so events go out in order.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    position = models.BigIntegerField(default=0)
+    leased_by = models.CharField(max_length=100, blank=True)
+    leased_until = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Outbox cursor {self.name} at #{self.position}"
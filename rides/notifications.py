@@ -0,0 +1,28 @@
+from .protocol import prepare, prepared_message
+
+
+def new_ride_frames(ride):
+    """The new_ride frame encoded once per codec, leaving each driver's distance open"""
+    return prepare({
+        'type': 'new_ride',
+        'ride_id': ride.id,
+        'passenger_name': f"{ride.passenger.first_name} {ride.passenger.last_name}",
+        'passenger_phone': ride.passenger.phone_number,
+        'pickup_address': ride.pickup_address,
+        'dropoff_address': ride.dropoff_address,
+        'distance_to_pickup': None,
+        'fare': str(ride.fare),
+        'estimated_distance': str(ride.distance),
+        'ride_type': ride.ride_type,
+    }, slot='distance_to_pickup')
+
+
+def new_ride_message(ride, distance_to_pickup, frames=None):
+    """Channel-layer message offering a ride to a driver.
+
+    Pass the ride's new_ride_frames when offering it to several drivers,
+    so it is built and encoded once rather than once per driver.
+    """
+    if frames is None:
+        frames = new_ride_frames(ride)
+    return prepared_message(frames, round(distance_to_pickup, 2))
@@ -0,0 +1,260 @@
+import asyncio
+import os
+import socket
+import time
+from collections import deque
+from datetime import timedelta
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .fanout import group_send_many
+
+CURSOR = 'default'
+
+
+def publish(pairs):
+    """Save (group, message) pairs to the outbox; they are sent once the transaction commits.
+
+    Call it inside the transaction.atomic() block that makes the change, so
+    events are stored only for writes that commit. Messages must be
+    JSON-serializable.
+    """
+    from .models import OutboxEvent
+
+    events = [OutboxEvent(group=group, message=message) for group, message in pairs]
+    if not events:
+        return
+    OutboxEvent.objects.bulk_create(events)
+    transaction.on_commit(get_outbox_relay().wake)
+
+
+class OutboxRelay:
+    """Sends outbox events to the channel layer in order, at least once.
+
+    Each pass reads up to batch_size events past the cursor's high-water
+    mark and sends them with one group_send_many. It then moves the mark to
+    the last event and deletes everything up to it, in one transaction. A
+    crash between the send and that commit sends the batch again.
+
+    Ids are taken when rows are inserted, not when their transaction
+    commits, so a later id can become visible before an earlier one. The
+    relay waits at such a gap until the event after it is gap_timeout
+    seconds old. By then the missing id is usually a rollback; if it commits
+    after all, it lands under the mark and is sent with the next batch.
+    Only rows that were sent are deleted, so nothing is lost either way.
+
+    Only the relay holding the cursor's lease sends. Others keep polling and
+    take over once the lease lapses. The relay runs on the ASGI loop,
+    started by the first WebSocket connection and woken by every commit
+    that publishes. `manage.py relay_outbox` runs it as its own process.
+    """
+
+    def __init__(self, batch_size=500, poll_interval=0.2, gap_timeout=5.0, lease_seconds=10.0,
+                 max_age=None, retry_backoff=0.05, max_backoff=5.0):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.gap_timeout = gap_timeout
+        self.lease_seconds = lease_seconds
+        self.max_age = max_age  # if set, older events are dropped instead of sent
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{id(self):x}'
+
+        self._loop = None
+        self._task = None
+        self._wakeup = None
+        self._cursor_ready = False
+
+        self.relayed = 0
+        self.batches = 0
+        self.retries = 0
+        self.gaps_skipped = 0
+        self.dropped = 0
+        self.late = 0
+        self._lags = deque(maxlen=1000)  # seconds from insert to send, last event per batch
+
+    @property
+    def running(self):
+        return self._loop is not None and self._loop.is_running() and not self._task.done()
+
+    def ensure_running(self):
+        """Start relaying on the current event loop (call from async code)"""
+        loop = asyncio.get_running_loop()
+        if self.running and self._loop is loop:
+            return
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._run())
+
+    def wake(self):
+        """Relay now rather than at the next poll (thread-safe)"""
+        if not self.running:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:  # loop closed since the check
+            pass
+
+    async def _run(self):
+        backoff = self.retry_backoff
+        while True:
+            self._wakeup.clear()
+            try:
+                moved = await self.relay_batch()
+                backoff = self.retry_backoff
+            except Exception as e:
+                self.retries += 1
+                print(f"⚠️ Outbox relay failed, retrying in {backoff:.2f}s: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+
+            # A full batch means more is waiting; otherwise sleep until a commit or the poll
+            if moved < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def drain(self):
+        """Relay until caught up; returns how many events were moved past"""
+        total = 0
+        while True:
+            moved = await self.relay_batch()
+            total += moved
+            if moved < self.batch_size:
+                return total
+
+    async def relay_batch(self):
+        """Send late events and the next batch; returns how many events were handled"""
+        claimed = await database_sync_to_async(self._claim)()
+        if claimed is None:
+            return 0
+        late, events = claimed
+        if not late and not events:
+            return 0
+
+        sent = late + events
+        if self.max_age:
+            cutoff = time.time() - self.max_age
+            sent = [event for event in sent if event[3].timestamp() >= cutoff]
+            if len(sent) < len(late) + len(events):
+                print(f"⚠️ Outbox: dropped {len(late) + len(events) - len(sent)} events "
+                      f"older than {self.max_age}s")
+        if sent:
+            await group_send_many([(group, message) for _, group, message, _ in sent])
+
+        last_id = events[-1][0] if events else None
+        ids = [event[0] for event in late + events]
+        if not await database_sync_to_async(self._advance)(last_id, ids):
+            return 0
+        self.relayed += len(sent)
+        self.late += len(late)
+        self.dropped += len(late) + len(events) - len(sent)
+        self.batches += 1
+        if sent:
+            self._lags.append(time.time() - max(event[3] for event in sent).timestamp())
+        return len(late) + len(events)
+
+    def _claim(self):
+        """Renew the lease and read (late, next) events in id order; None if another relay holds it.
+
+        Late events are rows under the high-water mark: their transaction
+        committed after the mark moved past their gap.
+        """
+        from .models import OutboxCursor, OutboxEvent
+
+        if not self._cursor_ready:
+            OutboxCursor.objects.get_or_create(name=CURSOR)
+            self._cursor_ready = True
+
+        now = timezone.now()
+        leased = OutboxCursor.objects.filter(name=CURSOR).filter(
+            Q(leased_by=self.owner) | Q(leased_until__isnull=True) | Q(leased_until__lt=now)
+        ).update(leased_by=self.owner, leased_until=now + timedelta(seconds=self.lease_seconds))
+        if not leased:
+            return None
+
+        position = OutboxCursor.objects.values_list('position', flat=True).get(name=CURSOR)
+        fields = ('id', 'group', 'message', 'created_at')
+        late = list(
+            OutboxEvent.objects.filter(id__lte=position).order_by('id')
+            .values_list(*fields)[:self.batch_size]
+        )
+        events = list(
+            OutboxEvent.objects.filter(id__gt=position).order_by('id')
+            .values_list(*fields)[:self.batch_size]
+        )
+        return late, self._contiguous(events, position, now)
+
+    def _contiguous(self, events, position, now):
+        """The events up to the first gap still young enough to be an open transaction"""
+        expected = position + 1
+        cutoff = now - timedelta(seconds=self.gap_timeout)
+        for index, (event_id, _, _, created_at) in enumerate(events):
+            if event_id != expected:
+                if created_at > cutoff:
+                    return events[:index]
+                self.gaps_skipped += 1
+            expected = event_id + 1
+        return events
+
+    def _advance(self, last_id, ids):
+        """Move the high-water mark to last_id (if any) and delete the events sent.
+
+        Deleting by id rather than by range keeps any row that commits under
+        the mark meanwhile, so the next pass sends it as a late event.
+        Returns False if the lease was lost mid-batch; the new holder then
+        sends from the old mark.
+        """
+        from .models import OutboxCursor, OutboxEvent
+
+        with transaction.atomic():
+            cursor = OutboxCursor.objects.select_for_update().filter(
+                name=CURSOR, leased_by=self.owner
+            ).first()
+            if cursor is None:
+                return False
+            if last_id is not None:
+                if cursor.position >= last_id:
+                    return False
+                cursor.position = last_id
+                cursor.save(update_fields=['position'])
+            OutboxEvent.objects.filter(id__in=ids).delete()
+        return True
+
+    def stats(self):
+        lags = sorted(self._lags)
+        return {
+            'running': self.running,
+            'relayed': self.relayed,
+            'batches': self.batches,
+            'retries': self.retries,
+            'gaps_skipped': self.gaps_skipped,
+            'dropped': self.dropped,
+            'late': self.late,
+            'lag_ms_p50': round(lags[len(lags) // 2] * 1000, 1) if lags else None,
+            'lag_ms_p95': round(lags[int(len(lags) * 0.95)] * 1000, 1) if lags else None,
+            'lag_ms_max': round(lags[-1] * 1000, 1) if lags else None,
+        }
+
+
+_relay = None
+
+
+def get_outbox_relay():
+    """The process-wide outbox relay"""
+    global _relay
+    if _relay is None:
+        _relay = OutboxRelay(
+            batch_size=settings.OUTBOX_BATCH_SIZE,
+            poll_interval=settings.OUTBOX_POLL_MS / 1000,
+            gap_timeout=settings.OUTBOX_GAP_TIMEOUT,
+            lease_seconds=settings.OUTBOX_LEASE_SECONDS,
+            max_age=settings.OUTBOX_MAX_AGE or None,
+        )
+    return _relay
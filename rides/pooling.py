@@ -0,0 +1,451 @@
+import time
+from datetime import datetime, timezone as dt_timezone
+from threading import Lock
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .spatial import GridIndex
+from .utils import calculate_distance, calculate_fare
+
+# Ride statuses a shared ride can still take passengers in
+OPEN_STATUSES = ('pending', 'accepted', 'picked_up')
+
+# Short trips get some absolute slack on top of the detour ratio (km)
+DETOUR_SLACK_KM = 0.5
+
+
+class SharedTrip:
+    """An open shared ride and its remaining stops in driving order"""
+
+    def __init__(self, ride_id, requested_at):
+        self.ride_id = ride_id
+        self.requested_at = requested_at
+        self.start = None   # (lat, lon) once the vehicle is under way
+        self.stops = []     # [(passenger_id, 'pickup' | 'dropoff', lat, lon)]
+        self.direct_km = {}  # passenger_id -> direct pickup-to-dropoff distance
+
+    @property
+    def passenger_count(self):
+        return len(self.direct_km)
+
+
+class BasePoolIndex:
+    """Open shared rides by the cells of their stops and by request-time bucket.
+
+    The index only proposes candidates. They are re-read from the database
+    under a row lock before anyone joins them, so a stale entry costs a
+    lookup, never a wrong match.
+    """
+
+    def __init__(self, cell_size_km=1.0, time_bucket_seconds=300, retention_seconds=600):
+        self.grid = GridIndex(cell_size_km=cell_size_km)  # used for cell math only
+        self.time_bucket_seconds = time_bucket_seconds
+        self.retention_seconds = retention_seconds  # rides older than this are never candidates
+
+    def add(self, ride_id, requested_at, pickups=(), dropoffs=()):
+        """Index a ride's pickup and dropoff points (under its request time)"""
+        raise NotImplementedError
+
+    def remove(self, ride_id):
+        raise NotImplementedError
+
+    def candidates(self, pickup, dropoff, now, max_pickup_km, max_dropoff_km):
+        """Ids of recent rides with a pickup near `pickup` and a dropoff near `dropoff`"""
+        buckets = range(self._bucket(now - self.retention_seconds), self._bucket(now) + 1)
+        pickup_keys = [
+            (row, col, bucket)
+            for row, col in self.grid.cells_in_radius(*pickup, max_pickup_km)
+            for bucket in buckets
+        ]
+        dropoff_keys = [
+            (row, col, bucket)
+            for row, col in self.grid.cells_in_radius(*dropoff, max_dropoff_km)
+            for bucket in buckets
+        ]
+        return self._lookup(pickup_keys, dropoff_keys)
+
+    def mark_loaded(self):
+        """Return True only for the first caller, so warm-up runs once"""
+        raise NotImplementedError
+
+    def _bucket(self, timestamp):
+        return int(timestamp // self.time_bucket_seconds)
+
+    def _keys(self, points, requested_at):
+        bucket = self._bucket(requested_at)
+        return {(*self.grid.cell_for(*point), bucket) for point in points}
+
+    def _lookup(self, pickup_keys, dropoff_keys):
+        raise NotImplementedError
+
+
+class InMemoryPoolIndex(BasePoolIndex):
+    """Per-process index (tests, single-node)"""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self._by_pickup = {}   # (row, col, bucket) -> {ride_id}
+        self._by_dropoff = {}  # (row, col, bucket) -> {ride_id}
+        self._entries = {}     # ride_id -> [(index, key)]
+        self._loaded = False
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, ride_id, requested_at, pickups=(), dropoffs=()):
+        with self._lock:
+            entries = self._entries.setdefault(ride_id, [])
+            for index, points in ((self._by_pickup, pickups), (self._by_dropoff, dropoffs)):
+                for key in self._keys(points, requested_at):
+                    index.setdefault(key, set()).add(ride_id)
+                    entries.append((index, key))
+
+    def remove(self, ride_id):
+        with self._lock:
+            for index, key in self._entries.pop(ride_id, ()):
+                members = index.get(key)
+                if members is not None:
+                    members.discard(ride_id)
+                    if not members:
+                        del index[key]
+
+    def mark_loaded(self):
+        with self._lock:
+            if self._loaded:
+                return False
+            self._loaded = True
+            return True
+
+    def _lookup(self, pickup_keys, dropoff_keys):
+        with self._lock:
+            near_pickup = set().union(*(self._by_pickup.get(key, ()) for key in pickup_keys))
+            if not near_pickup:
+                return set()
+            near_dropoff = set().union(*(self._by_dropoff.get(key, ()) for key in dropoff_keys))
+        return near_pickup & near_dropoff
+
+
+class RedisPoolIndex(BasePoolIndex):
+    """Index shared by all workers: one Redis set of ride ids per (cell, bucket).
+
+    Each set expires once its bucket has aged out of every search, so
+    rides nobody removed do not pile up.
+    """
+
+    def __init__(self, url, loaded_ttl=3600, **options):
+        super().__init__(**options)
+        import redis
+
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.loaded_ttl = loaded_ttl
+        self.loaded_key = 'pooling:loaded'
+
+    def _set_key(self, kind, key):
+        return f'pooling:{kind}:' + ':'.join(str(part) for part in key)
+
+    def _entries_key(self, ride_id):
+        return f'pooling:ride:{ride_id}'
+
+    def add(self, ride_id, requested_at, pickups=(), dropoffs=()):
+        bucket = self._bucket(requested_at)
+        expires_at = int((bucket + 1) * self.time_bucket_seconds + self.retention_seconds) + 1
+
+        set_keys = [self._set_key('pickup', key) for key in self._keys(pickups, requested_at)]
+        set_keys += [self._set_key('dropoff', key) for key in self._keys(dropoffs, requested_at)]
+        if not set_keys:
+            return
+
+        pipe = self.redis.pipeline(transaction=False)
+        for set_key in set_keys:
+            pipe.sadd(set_key, ride_id)
+            pipe.expireat(set_key, expires_at)
+        pipe.sadd(self._entries_key(ride_id), *set_keys)
+        pipe.expireat(self._entries_key(ride_id), expires_at)
+        pipe.execute()
+
+    def remove(self, ride_id):
+        set_keys = self.redis.smembers(self._entries_key(ride_id))
+        pipe = self.redis.pipeline(transaction=False)
+        for set_key in set_keys:
+            pipe.srem(set_key, ride_id)
+        pipe.delete(self._entries_key(ride_id))
+        pipe.execute()
+
+    def mark_loaded(self):
+        return bool(self.redis.set(self.loaded_key, 1, nx=True, ex=self.loaded_ttl))
+
+    def _lookup(self, pickup_keys, dropoff_keys):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.sunion([self._set_key('pickup', key) for key in pickup_keys])
+        pipe.sunion([self._set_key('dropoff', key) for key in dropoff_keys])
+        near_pickup, near_dropoff = pipe.execute()
+        return {int(ride_id) for ride_id in near_pickup & near_dropoff}
+
+
+class PoolingEngine:
+    """Finds an open shared ride a new shared request can join.
+
+    The pool index narrows the search to rides that start and end near
+    the new passenger and were requested recently. Those rides are then
+    locked and their routes rebuilt from the database, so every worker
+    decides on the same state. Each one is checked with a
+    cheapest-insertion heuristic that keeps every passenger's in-vehicle
+    distance within the detour limit.
+    """
+
+    def __init__(self, index, max_pickup_km=2.0, max_dropoff_km=3.0, max_detour_ratio=1.5,
+                 max_wait_seconds=600, max_passengers=4):
+        self.index = index
+        self.max_pickup_km = max_pickup_km
+        self.max_dropoff_km = max_dropoff_km
+        self.max_detour_ratio = max_detour_ratio
+        self.max_wait_seconds = max_wait_seconds
+        self.max_passengers = max_passengers
+
+    def open_trip(self, ride):
+        """Make a new shared ride findable by later requests"""
+        self.index.add(
+            ride.id, ride.requested_at.timestamp(),
+            pickups=[(float(ride.pickup_latitude), float(ride.pickup_longitude))],
+            dropoffs=[(float(ride.dropoff_latitude), float(ride.dropoff_longitude))],
+        )
+
+    def close_trip(self, ride_id):
+        self.index.remove(ride_id)
+
+    def reserve(self, passenger_id, pickup, dropoff, now=None):
+        """Lock the best open ride for a passenger; call inside transaction.atomic().
+
+        Returns (ride, direct_km) or None. Every candidate stays locked
+        until the transaction ends, so a concurrent request waits and then
+        sees this passenger's seat.
+        """
+        from .models import Ride, SharedRide
+
+        now = time.time() if now is None else now
+        candidates = self.index.candidates(
+            pickup, dropoff, now, self.max_pickup_km, self.max_dropoff_km
+        )
+        if not candidates:
+            return None
+
+        # Locked in id order, so requests with overlapping candidates cannot deadlock
+        rides = list(Ride.objects.select_for_update().filter(
+            id__in=candidates,
+            ride_type='shared',
+            status__in=OPEN_STATUSES,
+            requested_at__gte=datetime.fromtimestamp(now - self.max_wait_seconds, tz=dt_timezone.utc),
+        ).order_by('id'))
+        if not rides:
+            return None
+
+        # Seats are only added under the ride's lock, so these are current
+        seats = {}
+        for shared in SharedRide.objects.filter(ride__in=rides).order_by('id'):
+            seats.setdefault(shared.ride_id, []).append(shared)
+
+        trips = {ride.id: self.trip_for(ride, seats.get(ride.id, ())) for ride in rides}
+        direct_km = calculate_distance(*pickup, *dropoff)
+        best = self.best_insertion(trips.values(), passenger_id, pickup, dropoff, direct_km)
+        if best is None:
+            return None
+
+        _, trip, _ = best
+        return next(ride for ride in rides if ride.id == trip.ride_id), direct_km
+
+    def trip_for(self, ride, seats=()):
+        """Rebuild a ride's route: its own passenger, then each pooled seat in booking order"""
+        trip = SharedTrip(ride.id, ride.requested_at.timestamp())
+        pickup = (float(ride.pickup_latitude), float(ride.pickup_longitude))
+        dropoff = (float(ride.dropoff_latitude), float(ride.dropoff_longitude))
+        self.add_passenger(trip, ride.passenger_id, pickup, dropoff)
+        if ride.status == 'picked_up':
+            trip.start = pickup
+            trip.stops = [stop for stop in trip.stops if stop[1] != 'pickup']
+
+        for shared in seats:
+            self.add_passenger(
+                trip, shared.passenger_id,
+                (float(shared.pickup_latitude), float(shared.pickup_longitude)),
+                (float(shared.dropoff_latitude), float(shared.dropoff_longitude)),
+            )
+        return trip
+
+    def add_passenger(self, trip, passenger_id, pickup, dropoff):
+        """Insert a booked passenger at their cheapest point, feasible or not"""
+        direct_km = calculate_distance(*pickup, *dropoff)
+        insertion = self._best_insertion(trip, passenger_id, pickup, dropoff, direct_km)
+        if insertion:
+            trip.stops = insertion[1]
+        else:
+            trip.stops = trip.stops + [
+                (passenger_id, 'pickup', *pickup),
+                (passenger_id, 'dropoff', *dropoff),
+            ]
+        trip.direct_km[passenger_id] = direct_km
+
+    def best_insertion(self, trips, passenger_id, pickup, dropoff, direct_km):
+        """Cheapest feasible (added_km, trip, new_stops) over the trips, or None"""
+        best = None
+        for trip in trips:
+            # Full rides, and rides the passenger is already on, cannot take them
+            if trip.passenger_count >= self.max_passengers or passenger_id in trip.direct_km:
+                continue
+            insertion = self._best_insertion(trip, passenger_id, pickup, dropoff, direct_km)
+            if insertion and (best is None or insertion[0] < best[0]):
+                best = (insertion[0], trip, insertion[1])
+        return best
+
+    def _best_insertion(self, trip, passenger_id, pickup, dropoff, direct_km):
+        """Cheapest feasible (added_km, new_stops) for inserting the passenger"""
+        stops = trip.stops
+        current_km = self._route_km(trip.start, stops)
+        new_pickup = (passenger_id, 'pickup', *pickup)
+        new_dropoff = (passenger_id, 'dropoff', *dropoff)
+        direct = {**trip.direct_km, passenger_id: direct_km}
+
+        best = None
+        for i in range(len(stops) + 1):
+            for j in range(i, len(stops) + 1):
+                candidate = stops[:i] + [new_pickup] + stops[i:j] + [new_dropoff] + stops[j:]
+                route_km = self._feasible_route_km(trip.start, candidate, direct)
+                if route_km is None:
+                    continue
+                added_km = route_km - current_km
+                if best is None or added_km < best[0]:
+                    best = (added_km, candidate)
+        return best
+
+    def _route_km(self, start, stops):
+        points = ([start] if start else []) + [(stop[2], stop[3]) for stop in stops]
+        return sum(calculate_distance(*a, *b) for a, b in zip(points, points[1:]))
+
+    def _feasible_route_km(self, start, stops, direct):
+        """Route length, or None if any passenger's ride exceeds the detour limit"""
+        travelled = 0.0
+        previous = start
+        boarded = {}
+        for passenger_id, kind, lat, lon in stops:
+            if previous is not None:
+                travelled += calculate_distance(*previous, lat, lon)
+            previous = (lat, lon)
+
+            if kind == 'pickup':
+                boarded[passenger_id] = travelled
+            elif passenger_id in boarded:
+                ride_km = travelled - boarded[passenger_id]
+                limit = direct[passenger_id] * self.max_detour_ratio + DETOUR_SLACK_KM
+                if ride_km > limit:
+                    return None
+        return travelled
+
+
+_engine = None
+_engine_lock = Lock()
+
+
+def get_pooling_engine():
+    """The pooling engine over the configured index, warmed from open shared rides once"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                config = settings.POOLING_INDEX
+                index = import_string(config['BACKEND'])(
+                    retention_seconds=settings.POOLING_MAX_WAIT_SECONDS,
+                    **config.get('OPTIONS', {})
+                )
+                if index.mark_loaded():
+                    _load_open_trips(index)
+                _engine = PoolingEngine(
+                    index,
+                    max_pickup_km=settings.POOLING_MAX_PICKUP_KM,
+                    max_dropoff_km=settings.POOLING_MAX_DROPOFF_KM,
+                    max_detour_ratio=settings.POOLING_MAX_DETOUR_RATIO,
+                    max_wait_seconds=settings.POOLING_MAX_WAIT_SECONDS,
+                )
+    return _engine
+
+
+def _load_open_trips(index):
+    from django.utils import timezone
+    from datetime import timedelta
+    from .models import Ride
+
+    since = timezone.now() - timedelta(seconds=index.retention_seconds)
+    rides = Ride.objects.filter(
+        ride_type='shared',
+        status__in=OPEN_STATUSES,
+        requested_at__gte=since
+    ).prefetch_related('shared_passengers')
+
+    for ride in rides:
+        seats = list(ride.shared_passengers.all())
+        index.add(
+            ride.id, ride.requested_at.timestamp(),
+            pickups=[(float(ride.pickup_latitude), float(ride.pickup_longitude))] + [
+                (float(shared.pickup_latitude), float(shared.pickup_longitude)) for shared in seats
+            ],
+            dropoffs=[(float(ride.dropoff_latitude), float(ride.dropoff_longitude))] + [
+                (float(shared.dropoff_latitude), float(shared.dropoff_longitude)) for shared in seats
+            ],
+        )
+
+
+def sync_shared_ride(ride, created=False):
+    """Index a new shared ride, or drop a closed one, once the change commits"""
+    from django.db import transaction
+
+    if ride.ride_type != 'shared':
+        return
+    if ride.status not in OPEN_STATUSES:
+        transaction.on_commit(lambda: _update_index(lambda engine: engine.close_trip(ride.id)))
+    elif created:
+        transaction.on_commit(lambda: _update_index(lambda engine: engine.open_trip(ride)))
+
+
+def _update_index(change):
+    try:
+        change(get_pooling_engine())
+    except Exception as e:
+        print(f"❌ Error updating pooling index: {e}")
+
+
+def pool_shared_request(passenger, validated_data):
+    """Attach a shared request to a compatible open ride.
+
+    Returns the new SharedRide, or None if the passenger needs a ride of
+    their own. Call it inside transaction.atomic(): the seat, and the
+    lock on the ride it joins, last until that transaction commits.
+    """
+    from django.db import transaction
+    from .models import SharedRide
+    from .surge import surge_multiplier
+
+    pickup = (float(validated_data['pickup_latitude']), float(validated_data['pickup_longitude']))
+    dropoff = (float(validated_data['dropoff_latitude']), float(validated_data['dropoff_longitude']))
+
+    engine = get_pooling_engine()
+    with transaction.atomic():
+        match = engine.reserve(passenger.id, pickup, dropoff)
+        if match is None:
+            return None
+
+        ride, direct_km = match
+        shared = SharedRide.objects.create(
+            ride=ride,
+            passenger=passenger,
+            pickup_latitude=validated_data['pickup_latitude'],
+            pickup_longitude=validated_data['pickup_longitude'],
+            dropoff_latitude=validated_data['dropoff_latitude'],
+            dropoff_longitude=validated_data['dropoff_longitude'],
+            fare_share=calculate_fare(direct_km, 'shared', surge_multiplier(*pickup)),
+        )
+
+        # The new stops are only searchable once the seat is committed
+        transaction.on_commit(lambda: _update_index(lambda engine: engine.index.add(
+            ride.id, ride.requested_at.timestamp(), pickups=[pickup], dropoffs=[dropoff]
+        )))
+        return shared
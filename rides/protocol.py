@@ -0,0 +1,247 @@
+import json
+import math
+import struct
+
+import cbor2
+import msgpack
+
+# Frame type codes of the compact binary frames
+LOCATION_UPDATE = 1
+NEW_RIDE = 2
+STATUS_UPDATE = 3
+LOCATION_BATCH = 4
+
+RIDE_STATUSES = ('pending', 'accepted', 'picked_up', 'completed', 'cancelled')
+
+NEW_RIDE_FIELDS = (
+    'ride_id', 'passenger_name', 'passenger_phone', 'pickup_address', 'dropoff_address',
+    'distance_to_pickup', 'fare', 'estimated_distance', 'ride_type',
+)
+NEW_RIDE_NUMBERS = ('distance_to_pickup', 'fare', 'estimated_distance')
+
+MICRODEGREES = 1_000_000
+
+
+# Binary frames: the high-volume frame types become positional arrays
+# with numeric fields; anything else is sent as a plain map.
+#
+#   location_update  [1, driver_id, lat_e6, lon_e6]
+#   new_ride         [2, ride_id, passenger_name, passenger_phone, pickup_address,
+#                     dropoff_address, distance_to_pickup, fare, estimated_distance, ride_type]
+#   status_update    [3, ride_id, status_index]   (index into RIDE_STATUSES)
+#   location_batch   [4, driver_id, lat_e6, lon_e6, driver_id, lat_e6, lon_e6, ...]
+#
+# Clients send location_update as [1, 0, lat_e6, lon_e6] or as a map.
+
+def _number(value):
+    return None if value in (None, 'None', '') else float(value)
+
+
+def compact(frame):
+    """Turn a frame dict into its compact binary form"""
+    kind = frame.get('type')
+    if kind == 'location_update' and set(frame) <= {'type', 'driver_id', 'latitude', 'longitude'}:
+        return [
+            LOCATION_UPDATE,
+            frame.get('driver_id', 0),
+            round(float(frame['latitude']) * MICRODEGREES),
+            round(float(frame['longitude']) * MICRODEGREES),
+        ]
+    if kind == 'new_ride':
+        return [NEW_RIDE] + [
+            _number(frame[field]) if field in NEW_RIDE_NUMBERS else frame[field]
+            for field in NEW_RIDE_FIELDS
+        ]
+    if kind == 'location_batch':
+        values = [LOCATION_BATCH]
+        for driver_id, lat, lon in frame['drivers']:
+            values += [driver_id, round(float(lat) * MICRODEGREES), round(float(lon) * MICRODEGREES)]
+        return values
+    if kind == 'status_update' and frame.get('status') in RIDE_STATUSES:
+        return [STATUS_UPDATE, frame['ride_id'], RIDE_STATUSES.index(frame['status'])]
+    return frame
+
+
+def expand(payload):
+    """Inverse of compact, so consumers only ever deal with frame dicts"""
+    if isinstance(payload, dict):
+        return payload
+    if not isinstance(payload, (list, tuple)) or not payload:
+        raise ValueError("Frame must be a map or a typed array")
+
+    kind = payload[0]
+    if kind == LOCATION_UPDATE:
+        _, driver_id, lat, lon = payload
+        return {
+            'type': 'location_update',
+            'driver_id': driver_id,
+            'latitude': lat / MICRODEGREES,
+            'longitude': lon / MICRODEGREES,
+        }
+    if kind == NEW_RIDE:
+        return {'type': 'new_ride', **dict(zip(NEW_RIDE_FIELDS, payload[1:]))}
+    if kind == LOCATION_BATCH:
+        values = payload[1:]
+        return {
+            'type': 'location_batch',
+            'drivers': [
+                [values[i], values[i + 1] / MICRODEGREES, values[i + 2] / MICRODEGREES]
+                for i in range(0, len(values) - 2, 3)
+            ],
+        }
+    if kind == STATUS_UPDATE:
+        return {'type': 'status_update', 'ride_id': payload[1], 'status': RIDE_STATUSES[payload[2]]}
+    raise ValueError(f"Unknown frame type {kind}")
+
+
+# Prepared frames: an event going to many sockets is encoded once per
+# codec and sent verbatim. A frame may leave one field (the slot) open,
+# such as a driver's own distance_to_pickup. It is then kept as
+# [head, tail], and each recipient's value is encoded in between. Binary
+# codecs need the slot value in wire form already (a number, not a string).
+
+def _cbor_header(major, length):
+    """CBOR initial bytes of an array (4) or map (5) of the given length"""
+    if length < 24:
+        return bytes([major << 5 | length])
+    for info, size in ((24, 1), (25, 2), (26, 4), (27, 8)):
+        if length < 1 << (8 * size):
+            return bytes([major << 5 | info]) + length.to_bytes(size, 'big')
+    raise ValueError("Frame too long")
+
+
+def _split(values, slot):
+    """(header_kind, items before the slot, items after it) of a compacted frame.
+
+    Array frames keep the slot at its position; map frames move it last.
+    """
+    if isinstance(values, dict):
+        items = [item for pair in values.items() if pair[0] != slot for item in pair]
+        return 'map', items + [slot], []
+    if values[0] != NEW_RIDE:
+        raise ValueError("Only new_ride array frames can have a slot")
+    index = 1 + NEW_RIDE_FIELDS.index(slot)
+    return 'array', values[:index], values[index + 1:]
+
+
+class BinaryCodec:
+    """Shared prepare/fill for the binary codecs (see _split)"""
+    binary = True
+
+    def prepare(self, frame, slot=None):
+        if slot is None:
+            return [self.encode(frame)]
+        kind, before, after = _split(compact({**frame, slot: 0}), slot)
+        length = (len(before) + 1) // 2 if kind == 'map' else len(before) + 1 + len(after)
+        return [self.header(kind, length) + self._items(before), self._items(after)]
+
+    def fill(self, parts, value=None):
+        if len(parts) == 1:
+            return parts[0]
+        if type(value) is float:
+            value_data = self.float64 + struct.pack('>d', value)
+        else:
+            value_data = self.encode_value(value)
+        return parts[0] + value_data + parts[1]
+
+    def _items(self, values):
+        """Encoded values back to back: one encode call, minus the array header"""
+        return self.encode_value(values)[len(self.header('array', len(values))):]
+
+
+class JsonCodec:
+    """Default text frames for clients that negotiate no subprotocol"""
+    name = 'json'
+    binary = False
+
+    def encode(self, frame):
+        return json.dumps(frame)
+
+    def prepare(self, frame, slot=None):
+        """The frame as [text], or [head, tail] around the slot field (moved last)"""
+        if slot is None:
+            return [self.encode(frame)]
+        rest = {key: value for key, value in frame.items() if key != slot}
+        text = self.encode(rest)
+        return [text[:-1] + (', ' if rest else '') + f'{json.dumps(slot)}: ', '}']
+
+    def fill(self, parts, value=None):
+        if len(parts) == 1:
+            return parts[0]
+        if type(value) is float and math.isfinite(value):
+            return parts[0] + repr(value) + parts[1]  # what json.dumps would write
+        return parts[0] + json.dumps(value) + parts[1]
+
+    def decode(self, text_data=None, bytes_data=None):
+        return json.loads(text_data if text_data is not None else bytes_data)
+
+
+class MsgpackCodec(BinaryCodec):
+    name = 'taxi.msgpack.v1'
+    float64 = b'\xcb'
+
+    def encode(self, frame):
+        return msgpack.packb(compact(frame), use_bin_type=True)
+
+    def encode_value(self, value):
+        return msgpack.packb(value, use_bin_type=True)
+
+    def header(self, kind, length):
+        packer = msgpack.Packer()
+        return packer.pack_map_header(length) if kind == 'map' else packer.pack_array_header(length)
+
+    def decode(self, text_data=None, bytes_data=None):
+        if bytes_data is None:
+            return json.loads(text_data)
+        return expand(msgpack.unpackb(bytes_data, raw=False))
+
+
+class CborCodec(BinaryCodec):
+    name = 'taxi.cbor.v1'
+    float64 = b'\xfb'
+
+    def encode(self, frame):
+        return cbor2.dumps(compact(frame))
+
+    def encode_value(self, value):
+        return cbor2.dumps(value)
+
+    def header(self, kind, length):
+        return _cbor_header(5 if kind == 'map' else 4, length)
+
+    def decode(self, text_data=None, bytes_data=None):
+        if bytes_data is None:
+            return json.loads(text_data)
+        return expand(cbor2.loads(bytes_data))
+
+
+JSON_CODEC = JsonCodec()
+
+SUBPROTOCOLS = {
+    'taxi.msgpack.v1': MsgpackCodec(),
+    'taxi.cbor.v1': CborCodec(),
+}
+
+CODECS = [JSON_CODEC, *SUBPROTOCOLS.values()]
+
+
+def prepare(frame, slot=None):
+    """Encode a frame once for every codec: {codec name: parts} for a prepared_frame event"""
+    return {codec.name: codec.prepare(frame, slot) for codec in CODECS}
+
+
+def prepared_message(frames, value=None):
+    """Channel-layer message sending prepared frames verbatim (value fills the slot)"""
+    return {'type': 'prepared_frame', 'frames': frames, 'value': value}
+
+
+def negotiate(requested):
+    """Pick the first supported subprotocol the client offered.
+
+    Returns (subprotocol, codec); subprotocol is None for plain JSON.
+    """
+    for subprotocol in requested or ():
+        codec = SUBPROTOCOLS.get(subprotocol)
+        if codec is not None:
+            return subprotocol, codec
+    return None, JSON_CODEC
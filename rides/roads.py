@@ -0,0 +1,318 @@
+import heapq
+import math
+import os
+import zlib
+from threading import Lock
+
+import numpy as np
+
+from .utils import haversine_array
+
+# Files making up a compiled road graph (see `manage.py build_road_graph`)
+GRAPH_FILES = ('node_lat', 'node_lon', 'indptr', 'indices', 'length_m', 'time_s')
+# Search indexes derived from the graph, written next to it so loading never rebuilds them
+INDEX_FILES = ('rev_indptr', 'rev_indices', 'rev_time_s', 'snap_order', 'snap_cells',
+               'snap_starts', 'meta')
+
+# Searches give up past routes this much longer than the straight line,
+# driven at this average speed (km/h)
+MAX_DETOUR_FACTOR = 3
+MIN_SPEED_KMH = 15
+# Points further than this from any road node fall back to straight-line estimates
+MAX_SNAP_KM = 1.0
+# Side of the snap index cells; a point is snapped among the nodes of the cells within MAX_SNAP_KM
+SNAP_CELL_KM = 0.5
+KM_PER_DEG = 111.195
+# The flat projection of the A* bound is kept a little under the true distance
+HEURISTIC_MARGIN = 0.95
+
+
+def _cell_keys(lat, lon, cos_lat, cell_deg):
+    """Sortable int64 key of the snap cell containing each point"""
+    rows = np.floor(np.asarray(lat, dtype=np.float64) / cell_deg).astype(np.int64)
+    cols = np.floor(np.asarray(lon, dtype=np.float64) * cos_lat / cell_deg).astype(np.int64)
+    return (rows + (1 << 20)) * (1 << 22) + (cols + (1 << 21))
+
+
+def build_index(node_lat, node_lon, indptr, indices, length_m, time_s):
+    """The INDEX_FILES arrays for a graph: reverse CSR, snap cells and search constants"""
+    n = len(node_lat)
+
+    # Reverse edges for one-to-many searches towards a destination
+    sources = np.repeat(np.arange(n, dtype=np.int32), np.diff(indptr))
+    order = np.argsort(indices, kind='stable')
+    rev_indptr = np.zeros(n + 1, dtype=np.int32)
+    np.add.at(rev_indptr, np.asarray(indices, dtype=np.int64) + 1, 1)
+    np.cumsum(rev_indptr, out=rev_indptr)
+
+    # Nodes grouped by snap cell: snap_order[snap_starts[i]:snap_starts[i + 1]] lie in snap_cells[i]
+    cos_lat = math.cos(math.radians(float(np.mean(node_lat))))
+    cell_deg = SNAP_CELL_KM / KM_PER_DEG
+    keys = _cell_keys(node_lat, node_lon, cos_lat, cell_deg)
+    snap_order = np.argsort(keys, kind='stable').astype(np.int32)
+    snap_cells, snap_starts = np.unique(keys[snap_order], return_index=True)
+
+    speeds = np.asarray(length_m, dtype=np.float64) / np.asarray(time_s, dtype=np.float64)
+    checksum = 0
+    for array in (node_lat, node_lon, indptr, indices, length_m, time_s):
+        checksum = zlib.crc32(np.ascontiguousarray(array).tobytes(), checksum)
+    return {
+        'rev_indptr': rev_indptr,
+        'rev_indices': sources[order],
+        'rev_time_s': np.asarray(time_s, dtype=np.float64)[order],
+        'snap_order': snap_order,
+        'snap_cells': snap_cells,
+        'snap_starts': np.append(snap_starts, n).astype(np.int64),
+        # cos of the mean latitude, snap cell size in degrees, fastest edge in m/s, CRC32 of the graph
+        'meta': np.array([cos_lat, cell_deg, float(speeds.max()) if len(speeds) else 1.0, checksum]),
+    }
+
+
+class RoadGraph:
+    """Directed road network in CSR form, loaded from memory-mapped .npy files.
+
+    Edge i of node u is indices[indptr[u] + i] with its length in metres
+    and travel time in seconds. The snap index and the reverse edges are
+    stored with the graph, so loading maps files and computes nothing.
+    A single route is an A* search that stops at the destination; ETAs to
+    one pickup are one reverse search that stops once every driver is
+    reached. Both keep their state in dicts sized by the nodes visited,
+    never by the graph, and give up past a time budget derived from the
+    straight-line distance.
+    """
+
+    def __init__(self, node_lat, node_lon, indptr, indices, length_m, time_s, **index):
+        self.node_lat = node_lat
+        self.node_lon = node_lon
+        self.indptr = indptr
+        self.indices = indices
+        self.length_m = length_m
+        self.time_s = time_s
+
+        if not index:
+            index = build_index(node_lat, node_lon, indptr, indices, length_m, time_s)
+        self.rev_indptr = index['rev_indptr']
+        self.rev_indices = index['rev_indices']
+        self.rev_time_s = index['rev_time_s']
+        self.snap_order = index['snap_order']
+        self.snap_cells = index['snap_cells']
+        self.snap_starts = index['snap_starts']
+        self._cos_lat, self._cell_deg, self._max_speed, self._checksum = (
+            float(value) for value in index['meta']
+        )
+        # Same graph, same version in every worker: results computed on it can be shared
+        self.version = f'{len(node_lat)}n{len(indices)}e{int(self._checksum):08x}'
+        # Straight line at the fastest speed on the map never overestimates the time left
+        self._seconds_per_deg = HEURISTIC_MARGIN * KM_PER_DEG * 1000 / self._max_speed
+
+    @classmethod
+    def load(cls, path):
+        """Map a compiled graph; graphs compiled without the index files get them built in memory"""
+        def load_array(name):
+            return np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+
+        arrays = {name: load_array(name) for name in GRAPH_FILES}
+        if all(os.path.exists(os.path.join(path, f'{name}.npy')) for name in INDEX_FILES):
+            arrays.update({name: load_array(name) for name in INDEX_FILES})
+        else:
+            print(f"⚠️ No search index in {path}; rebuild with build_road_graph to skip this at load")
+        return cls(**arrays)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        arrays = {
+            'node_lat': self.node_lat,
+            'node_lon': self.node_lon,
+            'indptr': self.indptr,
+            'indices': self.indices,
+            'length_m': self.length_m,
+            'time_s': self.time_s,
+            'rev_indptr': self.rev_indptr,
+            'rev_indices': self.rev_indices,
+            'rev_time_s': self.rev_time_s,
+            'snap_order': self.snap_order,
+            'snap_cells': self.snap_cells,
+            'snap_starts': self.snap_starts,
+            'meta': np.array([self._cos_lat, self._cell_deg, self._max_speed, self._checksum]),
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(path, f'{name}.npy'), np.ascontiguousarray(array))
+
+    def __len__(self):
+        return len(self.node_lat)
+
+    def nearest_node(self, lat, lon):
+        """(node, distance_km) of the road node closest to a point, or (None, inf) if none is near"""
+        lat, lon = float(lat), float(lon)
+        reach = math.ceil(MAX_SNAP_KM / SNAP_CELL_KM)
+        row_keys = _cell_keys(
+            [lat + offset * self._cell_deg for offset in range(-reach, reach + 1)],
+            lon, self._cos_lat, self._cell_deg
+        )
+
+        # Each row of cells around the point is one contiguous run of keys
+        chunks = []
+        for key in row_keys.tolist():
+            first, last = np.searchsorted(self.snap_cells, [key - reach, key + reach + 1])
+            if first < last:
+                chunks.append(self.snap_order[self.snap_starts[first]:self.snap_starts[last]])
+        if not chunks:
+            return None, math.inf
+
+        candidates = np.concatenate(chunks)
+        distances = haversine_array(lat, lon, self.node_lat[candidates], self.node_lon[candidates])
+        best = int(np.argmin(distances))
+        return int(candidates[best]), float(distances[best])
+
+    def route(self, origin_lat, origin_lon, dest_lat, dest_lon):
+        """Fastest route as (distance_km, duration_min), or None if unroutable"""
+        source, source_snap = self.nearest_node(origin_lat, origin_lon)
+        target, target_snap = self.nearest_node(dest_lat, dest_lon)
+        if source_snap > MAX_SNAP_KM or target_snap > MAX_SNAP_KM:
+            return None
+        if source == target:
+            return 0.0, 0.0
+
+        found = self._fastest_path(source, target, self._time_budget(source, target))
+        if found is None:
+            return None
+        time_s, length_m = found
+        return round(length_m / 1000, 2), round(time_s / 60, 1)
+
+    def durations_to(self, dest_lat, dest_lon, points):
+        """Road travel time in minutes from each (lat, lon) to one destination.
+
+        One reverse search serves every origin; unroutable origins get None.
+        """
+        target, target_snap = self.nearest_node(dest_lat, dest_lon)
+        if target_snap > MAX_SNAP_KM or not points:
+            return [None] * len(points)
+
+        sources = [self.nearest_node(lat, lon) for lat, lon in points]
+        routable = {node for node, snap in sources if snap <= MAX_SNAP_KM}
+        if not routable:
+            return [None] * len(points)
+        budget = max(self._time_budget(node, target) for node in routable)
+        times = self._travel_times(target, routable, budget)
+
+        return [
+            round(times[node] / 60, 1) if snap <= MAX_SNAP_KM and node in times else None
+            for node, snap in sources
+        ]
+
+    def _fastest_path(self, source, target, budget):
+        """A* from source to target: (time_s, length_m), or None if not reachable within budget"""
+        node_lat, node_lon = self.node_lat, self.node_lon
+        target_lat, target_lon = float(node_lat[target]), float(node_lon[target])
+        cos_lat, seconds_per_deg = self._cos_lat, self._seconds_per_deg
+
+        def remaining(node):
+            dlat = float(node_lat[node]) - target_lat
+            dlon = (float(node_lon[node]) - target_lon) * cos_lat
+            return math.sqrt(dlat * dlat + dlon * dlon) * seconds_per_deg
+
+        indptr, indices, time_s = self.indptr, self.indices, self.time_s
+        best = {source: 0.0}
+        via = {}  # node -> (previous node, edge) on the best path found so far
+        settled = set()
+        heap = [(remaining(source), 0.0, source)]
+        while heap:
+            _, elapsed, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            if node == target:
+                length_m = 0.0
+                while node != source:
+                    node, edge = via[node]
+                    length_m += float(self.length_m[edge])
+                return elapsed, length_m
+            settled.add(node)
+
+            start, end = int(indptr[node]), int(indptr[node + 1])
+            for edge, (neighbor, seconds) in enumerate(
+                zip(indices[start:end].tolist(), time_s[start:end].tolist()), start
+            ):
+                arrival = elapsed + seconds
+                if arrival <= budget and arrival < best.get(neighbor, math.inf):
+                    best[neighbor] = arrival
+                    via[neighbor] = (node, edge)
+                    heapq.heappush(heap, (arrival + remaining(neighbor), arrival, neighbor))
+        return None
+
+    def _travel_times(self, target, sources, budget):
+        """Reverse Dijkstra from target until every source is settled: {source: seconds}"""
+        indptr, indices, time_s = self.rev_indptr, self.rev_indices, self.rev_time_s
+        best = {target: 0.0}
+        settled = {}
+        waiting = set(sources)
+        heap = [(0.0, target)]
+        while heap and waiting:
+            elapsed, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled[node] = elapsed
+            waiting.discard(node)
+
+            start, end = int(indptr[node]), int(indptr[node + 1])
+            for neighbor, seconds in zip(indices[start:end].tolist(), time_s[start:end].tolist()):
+                arrival = elapsed + seconds
+                if arrival <= budget and arrival < best.get(neighbor, math.inf):
+                    best[neighbor] = arrival
+                    heapq.heappush(heap, (arrival, neighbor))
+        return {node: settled[node] for node in sources if node in settled}
+
+    def _time_budget(self, source, target):
+        """Search limit in seconds, so a query never floods the whole city"""
+        straight_km = float(haversine_array(
+            self.node_lat[source], self.node_lon[source],
+            self.node_lat[target], self.node_lon[target]
+        ))
+        return max(straight_km * MAX_DETOUR_FACTOR, 2) / MIN_SPEED_KMH * 3600
+
+
+def compile_graph(lats, lons, edges):
+    """RoadGraph from node coordinates and {(u, v): (length_m, time_s)} directed edges"""
+    order = sorted(edges)
+    sources = np.array([u for u, _ in order], dtype=np.int64)
+    indptr = np.zeros(len(lats) + 1, dtype=np.int32)
+    np.add.at(indptr, sources + 1, 1)
+    np.cumsum(indptr, out=indptr)
+
+    return RoadGraph(
+        node_lat=np.array(lats, dtype=np.float64),
+        node_lon=np.array(lons, dtype=np.float64),
+        indptr=indptr,
+        indices=np.array([v for _, v in order], dtype=np.int32),
+        length_m=np.array([edges[pair][0] for pair in order], dtype=np.float32),
+        time_s=np.array([edges[pair][1] for pair in order], dtype=np.float64),
+    )
+
+
+_graph = None
+_graph_loaded = False
+_graph_lock = Lock()
+
+
+def get_road_graph():
+    """The configured road graph, or None if routing is not set up"""
+    global _graph, _graph_loaded
+    if not _graph_loaded:
+        with _graph_lock:
+            if not _graph_loaded:
+                from django.conf import settings
+
+                path = settings.ROAD_GRAPH_PATH
+                if path:
+                    try:
+                        _graph = RoadGraph.load(path)
+                        print(f"✅ Loaded road graph with {len(_graph)} nodes")
+                    except Exception as e:
+                        print(f"❌ Error loading road graph from {path}: {e}")
+                _graph_loaded = True
+    return _graph
+
+
+def routing_version():
+    """What estimate_route routes with right now: 'line', or 'road-<graph version>'"""
+    graph = get_road_graph()
+    return 'line' if graph is None else f'road-{graph.version}'
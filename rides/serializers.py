@@ -22,6 +22,16 @@ class RideSerializer(serializers.ModelSerializer):
         ]
 
 
+class SharedRideSerializer(serializers.ModelSerializer):
+    """A passenger pooled into someone else's shared ride"""
+    passenger = UserSerializer(read_only=True)
+
+    class Meta:
+        model = SharedRide
+        fields = '__all__'
+        read_only_fields = ['ride', 'passenger', 'fare_share']
+
+
 class RideCreateSerializer(serializers.ModelSerializer):
     """Create new ride - minimal fields required"""
     class Meta:
@@ -38,18 +48,20 @@ class RideCreateSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         """Calculate distance and fare automatically"""
-        from .utils import calculate_distance, calculate_fare
+        from .utils import estimate_route, calculate_fare
+        from .surge import surge_multiplier
         
-        # Calculate distance between pickup and dropoff
-        distance = calculate_distance(
+        # Road distance between pickup and dropoff (straight line without a road graph)
+        distance, _ = estimate_route(
             float(validated_data['pickup_latitude']),
             float(validated_data['pickup_longitude']),
             float(validated_data['dropoff_latitude']),
             float(validated_data['dropoff_longitude'])
         )
         
-        # Calculate fare based on distance and ride type
-        fare = calculate_fare(distance, validated_data['ride_type'])
+        # Calculate fare based on distance, ride type and surge at the pickup
+        surge = surge_multiplier(validated_data['pickup_latitude'], validated_data['pickup_longitude'])
+        fare = calculate_fare(distance, validated_data['ride_type'], surge)
         
         # Add calculated fields
         validated_data['distance'] = distance
@@ -95,4 +107,56 @@ class RideEstimateSerializer(serializers.Serializer):
         choices=['solo', 'shared'],
         default='solo',
         help_text="Type of ride: 'solo' or 'shared'"
-    )
\ No newline at end of file
+    )
+
+class NearbyRideRequestsQuerySerializer(serializers.Serializer):
+    """Query parameters for nearby pending ride requests"""
+    radius = serializers.FloatField(
+        min_value=0.1,
+        max_value=50,
+        default=5,
+        help_text="Search radius in kilometers"
+    )
+    limit = serializers.IntegerField(
+        min_value=1,
+        max_value=100,
+        default=20,
+        help_text="Maximum number of rides to return"
+    )
+
+class BatchEstimateDestinationSerializer(serializers.Serializer):
+    """One destination in a batch estimate"""
+    latitude = serializers.DecimalField(max_digits=9, decimal_places=6)
+    longitude = serializers.DecimalField(max_digits=9, decimal_places=6)
+    label = serializers.CharField(
+        required=False,
+        allow_blank=True,
+        max_length=100,
+        help_text="Optional name to echo back (e.g., 'Home', 'Airport')"
+    )
+
+class RideBatchEstimateSerializer(serializers.Serializer):
+    """Estimate fares from one pickup to several destinations and ride types"""
+    pickup_latitude = serializers.DecimalField(
+        max_digits=9, 
+        decimal_places=6,
+        help_text="Pickup location latitude (e.g., 41.299500)"
+    )
+    pickup_longitude = serializers.DecimalField(
+        max_digits=9, 
+        decimal_places=6,
+        help_text="Pickup location longitude (e.g., 69.240100)"
+    )
+    # Items are validated one by one in the view, so a bad one fails alone
+    destinations = serializers.ListField(
+        child=serializers.JSONField(),
+        min_length=1,
+        max_length=20,
+        help_text="List of {latitude, longitude, label?}"
+    )
+    ride_types = serializers.ListField(
+        child=serializers.ChoiceField(choices=['solo', 'shared']),
+        min_length=1,
+        default=['solo', 'shared'],
+        help_text="Ride types to quote for every destination"
+    )
@@ -0,0 +1,49 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from users.models import Driver
+from .availability import get_availability_tracker, sync_driver_availability
+from .dispatch import sync_ride_offers
+from .location_store import (
+    get_driver_store, get_pending_ride_store, sync_driver, sync_pending_ride
+)
+from .models import Ride
+from .pooling import sync_shared_ride
+from .surge import sync_driver_supply
+from .traces import sync_ride_trace
+
+
+@receiver(post_save, sender=Driver)
+def update_driver_store(sender, instance, update_fields=None, **kwargs):
+    """Keep the location store, surge supply and heartbeat tracking in step with driver changes"""
+    sync_driver(instance, update_fields=update_fields)
+    sync_driver_supply(instance)
+    sync_driver_availability(instance)
+
+
+@receiver(post_delete, sender=Driver)
+def remove_from_driver_store(sender, instance, **kwargs):
+    try:
+        get_driver_store().remove(instance.user_id)
+        tracker = get_availability_tracker()
+        if tracker is not None:
+            tracker.clear(instance.user_id)
+    except Exception as e:
+        print(f"❌ Error updating driver location store: {e}")
+
+
+@receiver(post_save, sender=Ride)
+def update_pending_ride_store(sender, instance, created, **kwargs):
+    """Pending pickups are indexed on create and dropped (offers closed) on accept/cancel"""
+    sync_pending_ride(instance)
+    sync_shared_ride(instance, created=created)
+    sync_ride_trace(instance)
+    sync_ride_offers(instance)
+
+
+@receiver(post_delete, sender=Ride)
+def remove_from_pending_ride_store(sender, instance, **kwargs):
+    try:
+        get_pending_ride_store().remove(instance.id)
+    except Exception as e:
+        print(f"❌ Error updating pending ride store: {e}")
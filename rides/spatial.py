@@ -0,0 +1,157 @@
+import math
+from threading import Lock
+
+import numpy as np
+
+from .utils import calculate_distances
+
+KM_PER_DEGREE = 111.32  # Length of one degree of latitude
+
+
+class GridIndex:
+    """In-process spatial index that buckets points into fixed lat/lon cells.
+
+    Radius queries only look at the cells overlapping the search circle
+    instead of scanning every point.
+    """
+
+    def __init__(self, cell_size_km=1.0):
+        self.cell_size_km = cell_size_km
+        self.cell_deg = cell_size_km / KM_PER_DEGREE
+        self._cells = {}    # (row, col) -> {member_id: (lat, lon)}
+        self._members = {}  # member_id -> (row, col)
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._members)
+
+    def __contains__(self, member_id):
+        return member_id in self._members
+
+    def cell_for(self, lat, lon):
+        """Return the (row, col) cell containing a point"""
+        return (
+            int(math.floor(lat / self.cell_deg)),
+            int(math.floor(lon / self.cell_deg)),
+        )
+
+    def upsert(self, member_id, lat, lon):
+        """Add a point or move it to its new position"""
+        lat, lon = float(lat), float(lon)
+        cell = self.cell_for(lat, lon)
+
+        with self._lock:
+            old_cell = self._members.get(member_id)
+            if old_cell is not None and old_cell != cell:
+                self._discard_from_cell(old_cell, member_id)
+
+            self._cells.setdefault(cell, {})[member_id] = (lat, lon)
+            self._members[member_id] = cell
+
+    def remove(self, member_id):
+        """Drop a point from the index (no-op if missing)"""
+        with self._lock:
+            cell = self._members.pop(member_id, None)
+            if cell is not None:
+                self._discard_from_cell(cell, member_id)
+
+    def clear(self):
+        with self._lock:
+            self._cells.clear()
+            self._members.clear()
+
+    def _discard_from_cell(self, cell, member_id):
+        bucket = self._cells.get(cell)
+        if bucket is None:
+            return
+        bucket.pop(member_id, None)
+        if not bucket:
+            del self._cells[cell]
+
+    def cells_in_radius(self, lat, lon, radius_km):
+        """Yield every cell overlapping the bounding box of a search circle"""
+        row, col = self.cell_for(lat, lon)
+
+        lat_span = radius_km / KM_PER_DEGREE
+        # Longitude degrees shrink towards the poles
+        cos_lat = max(math.cos(math.radians(lat)), 0.01)
+        lon_span = radius_km / (KM_PER_DEGREE * cos_lat)
+
+        row_steps = int(math.ceil(lat_span / self.cell_deg))
+        col_steps = int(math.ceil(lon_span / self.cell_deg))
+
+        for r in range(row - row_steps, row + row_steps + 1):
+            for c in range(col - col_steps, col + col_steps + 1):
+                yield (r, c)
+
+    def search(self, lat, lon, radius_km):
+        """Return [(member_id, distance_km)] within radius, closest first"""
+        lat, lon, radius_km = float(lat), float(lon), float(radius_km)
+
+        with self._lock:
+            candidates = []
+            for cell in self.cells_in_radius(lat, lon, radius_km):
+                bucket = self._cells.get(cell)
+                if bucket:
+                    candidates.extend(bucket.items())
+
+        if not candidates:
+            return []
+
+        member_ids = [member_id for member_id, _ in candidates]
+        points = np.array([point for _, point in candidates], dtype=np.float64)
+        distances = calculate_distances(lat, lon, points[:, 0], points[:, 1])
+
+        inside = np.flatnonzero(distances <= radius_km)
+        inside = inside[np.argsort(distances[inside], kind='stable')]
+        return [(member_ids[i], float(distances[i])) for i in inside]
+
+    def nearest(self, lat, lon, k, max_radius_km):
+        """Return the k closest [(member_id, distance_km)] within max_radius_km.
+
+        Cells are scanned ring by ring outward from the query cell; the
+        search stops as soon as k points are closer than any unscanned cell.
+        """
+        lat, lon, max_radius_km = float(lat), float(lon), float(max_radius_km)
+        row, col = self.cell_for(lat, lon)
+
+        # Narrowest side of a cell, so every ring is guaranteed to cover this much
+        cos_lat = max(math.cos(math.radians(lat)), 0.01)
+        cell_km = self.cell_size_km * min(1.0, cos_lat)
+        max_ring = int(math.ceil(max_radius_km / cell_km))
+
+        found = []
+        for ring in range(max_ring + 1):
+            with self._lock:
+                candidates = []
+                for cell in self._ring_cells(row, col, ring):
+                    bucket = self._cells.get(cell)
+                    if bucket:
+                        candidates.extend(bucket.items())
+
+            if candidates:
+                points = np.array([point for _, point in candidates], dtype=np.float64)
+                distances = calculate_distances(lat, lon, points[:, 0], points[:, 1])
+                found.extend(
+                    (float(distances[i]), candidates[i][0])
+                    for i in np.flatnonzero(distances <= max_radius_km)
+                )
+
+            covered_km = ring * cell_km
+            if sum(1 for distance, _ in found if distance <= covered_km) >= k:
+                break
+
+        found.sort(key=lambda item: item[0])
+        return [(member_id, distance) for distance, member_id in found[:k]]
+
+    def _ring_cells(self, row, col, ring):
+        """Cells exactly `ring` steps away from (row, col)"""
+        if ring == 0:
+            yield (row, col)
+            return
+        for c in range(col - ring, col + ring + 1):
+            yield (row - ring, c)
+            yield (row + ring, c)
+        for r in range(row - ring + 1, row + ring):
+            yield (r, col - ring)
+            yield (r, col + ring)
@@ -0,0 +1,251 @@
+import time
+from collections import OrderedDict, deque
+from threading import Lock
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .spatial import GridIndex
+
+
+class BaseSurgeEngine:
+    """Per-cell demand/supply over a sliding window and the surge they imply.
+
+    Demand is ride requests in the last window_seconds, supply is distinct
+    available drivers seen in the cell in the same window. Every event is
+    O(1) and a multiplier lookup never touches the database.
+    """
+
+    def __init__(self, window_seconds=300, bucket_seconds=30, cell_size_km=1.0,
+                 sensitivity=0.5, max_multiplier=2.5, min_requests=3):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.sensitivity = sensitivity
+        self.max_multiplier = max_multiplier
+        self.min_requests = min_requests
+        self.grid = GridIndex(cell_size_km=cell_size_km)  # used for cell math only
+
+    def cell(self, lat, lon):
+        row, col = self.grid.cell_for(float(lat), float(lon))
+        return f'{row}:{col}'
+
+    def record_request(self, lat, lon, now=None):
+        raise NotImplementedError
+
+    def record_driver(self, driver_id, lat, lon, available, now=None):
+        """Count an available driver in its cell; moves or removes it otherwise"""
+        raise NotImplementedError
+
+    def counts(self, lat, lon, now=None):
+        """Return (requests, drivers) in the window for the point's cell"""
+        raise NotImplementedError
+
+    def multiplier(self, lat, lon, now=None):
+        requests, drivers = self.counts(lat, lon, now)
+        return self.multiplier_for(requests, drivers)
+
+    def multiplier_for(self, requests, drivers):
+        """1.0 until demand outstrips supply, then rises in 0.1 steps up to the cap"""
+        if requests < self.min_requests:
+            return 1.0
+        ratio = requests / max(drivers, 1)
+        if ratio <= 1:
+            return 1.0
+        multiplier = 1 + self.sensitivity * (ratio - 1)
+        return min(round(multiplier, 1), self.max_multiplier)
+
+
+class InMemorySurgeEngine(BaseSurgeEngine):
+    """Per-process surge state (tests, single-node)"""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self._requests = {}  # cell -> [deque of [bucket, count], total]
+        self._drivers = OrderedDict()  # driver_id -> (cell, seen_at), oldest first
+        self._supply = {}  # cell -> available drivers seen in the window
+        self._lock = Lock()
+
+    def record_request(self, lat, lon, now=None):
+        now = time.time() if now is None else now
+        bucket = int(now // self.bucket_seconds)
+        cell = self.cell(lat, lon)
+
+        with self._lock:
+            window = self._requests.setdefault(cell, [deque(), 0])
+            self._expire_requests(window, now)
+            buckets = window[0]
+            if buckets and buckets[-1][0] == bucket:
+                buckets[-1][1] += 1
+            else:
+                buckets.append([bucket, 1])
+            window[1] += 1
+
+    def record_driver(self, driver_id, lat, lon, available, now=None):
+        now = time.time() if now is None else now
+        cell = self.cell(lat, lon) if available else None
+
+        with self._lock:
+            self._expire_drivers(now)
+            previous = self._drivers.pop(driver_id, None)
+            if previous is not None:
+                self._decrement(previous[0])
+            if cell is not None:
+                self._drivers[driver_id] = (cell, now)
+                self._supply[cell] = self._supply.get(cell, 0) + 1
+
+    def counts(self, lat, lon, now=None):
+        now = time.time() if now is None else now
+        cell = self.cell(lat, lon)
+
+        with self._lock:
+            self._expire_drivers(now)
+            window = self._requests.get(cell)
+            requests = 0
+            if window is not None:
+                self._expire_requests(window, now)
+                requests = window[1]
+                if not requests:
+                    del self._requests[cell]
+            return requests, self._supply.get(cell, 0)
+
+    def _expire_requests(self, window, now):
+        oldest = int((now - self.window_seconds) // self.bucket_seconds)
+        buckets = window[0]
+        while buckets and buckets[0][0] <= oldest:
+            window[1] -= buckets.popleft()[1]
+
+    def _expire_drivers(self, now):
+        # Drivers are kept in last-seen order, so stale ones sit at the front
+        oldest = now - self.window_seconds
+        while self._drivers:
+            driver_id, (cell, seen_at) = next(iter(self._drivers.items()))
+            if seen_at > oldest:
+                break
+            del self._drivers[driver_id]
+            self._decrement(cell)
+
+    def _decrement(self, cell):
+        count = self._supply.get(cell, 0) - 1
+        if count > 0:
+            self._supply[cell] = count
+        else:
+            self._supply.pop(cell, None)
+
+
+class RedisSurgeEngine(BaseSurgeEngine):
+    """Surge state shared by all workers.
+
+    Requests are INCRs on per-cell time-bucket keys that expire with the
+    window; supply is a per-cell sorted set of driver ids scored by when
+    they were last seen. Each driver's current cell is a key that expires
+    with the window too, so drivers who vanish without going offline
+    leave nothing behind.
+    """
+
+    def __init__(self, url, **options):
+        super().__init__(**options)
+        import redis
+
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+
+    def _request_key(self, cell, bucket):
+        return f'surge:requests:{cell}:{bucket}'
+
+    def _supply_key(self, cell):
+        return f'surge:supply:{cell}'
+
+    def _driver_cell_key(self, driver_id):
+        return f'surge:driver_cell:{driver_id}'
+
+    def record_request(self, lat, lon, now=None):
+        now = time.time() if now is None else now
+        key = self._request_key(self.cell(lat, lon), int(now // self.bucket_seconds))
+
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.incr(key)
+        pipe.expire(key, self.window_seconds + self.bucket_seconds)
+        pipe.execute()
+
+    def record_driver(self, driver_id, lat, lon, available, now=None):
+        now = time.time() if now is None else now
+        cell = self.cell(lat, lon) if available else None
+        key = self._driver_cell_key(driver_id)
+        previous = self.redis.get(key)
+
+        pipe = self.redis.pipeline(transaction=False)
+        if previous and previous != cell:
+            pipe.zrem(self._supply_key(previous), driver_id)
+        if cell is not None:
+            pipe.set(key, cell, ex=self.window_seconds)
+            pipe.zadd(self._supply_key(cell), {driver_id: now})
+            pipe.expire(self._supply_key(cell), self.window_seconds)
+        else:
+            pipe.delete(key)
+        pipe.execute()
+
+    def counts(self, lat, lon, now=None):
+        now = time.time() if now is None else now
+        cell = self.cell(lat, lon)
+        current = int(now // self.bucket_seconds)
+        oldest = int((now - self.window_seconds) // self.bucket_seconds)
+        keys = [self._request_key(cell, bucket) for bucket in range(oldest + 1, current + 1)]
+
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.mget(keys)
+        pipe.zremrangebyscore(self._supply_key(cell), '-inf', now - self.window_seconds)
+        pipe.zcard(self._supply_key(cell))
+        buckets, _, drivers = pipe.execute()
+
+        requests = sum(int(count) for count in buckets if count)
+        return requests, drivers
+
+
+_engine = None
+
+
+def get_surge_engine():
+    """The configured surge engine, or None if surge pricing is off"""
+    global _engine
+    if _engine is None and settings.SURGE['ENABLED']:
+        backend = import_string(settings.SURGE['BACKEND'])
+        _engine = backend(**settings.SURGE.get('OPTIONS', {}))
+    return _engine
+
+
+def surge_multiplier(lat, lon):
+    """Current multiplier at a pickup point; 1.0 if surge is off or unavailable"""
+    engine = get_surge_engine()
+    if engine is None:
+        return 1.0
+    try:
+        return engine.multiplier(lat, lon)
+    except Exception as e:
+        print(f"⚠️ Surge lookup failed, using 1.0: {e}")
+        return 1.0
+
+
+def record_ride_request(lat, lon):
+    engine = get_surge_engine()
+    if engine is None:
+        return
+    try:
+        engine.record_request(lat, lon)
+    except Exception as e:
+        print(f"❌ Error recording surge demand: {e}")
+
+
+def sync_driver_supply(driver):
+    """Count a driver towards supply in its cell while it is available"""
+    engine = get_surge_engine()
+    if engine is None:
+        return
+    located = driver.current_latitude is not None and driver.current_longitude is not None
+    try:
+        engine.record_driver(
+            driver.user_id,
+            driver.current_latitude,
+            driver.current_longitude,
+            available=(located and driver.status == 'available'),
+        )
+    except Exception as e:
+        print(f"❌ Error recording surge supply: {e}")
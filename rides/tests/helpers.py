@@ -0,0 +1,109 @@
+from decimal import Decimal
+from itertools import count
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+
+from users.models import Driver, User
+
+# Process-wide singletons of the fast tier, rebuilt from settings on next use
+SINGLETONS = {
+    'rides.availability': '_tracker',
+    'rides.broadcaster': '_broadcaster',
+    'rides.dispatch': ('_offer_book', '_worker'),
+    'rides.estimates': '_cache',
+    'rides.fanout': '_grid',
+    'rides.ingestion': '_filter',
+    'rides.outbox': '_relay',
+    'rides.pooling': '_engine',
+    'rides.roads': '_graph',
+    'rides.surge': '_engine',
+    'rides.traces': '_recorder',
+}
+
+
+def reset_fast_tier():
+    """Forget every in-process store, buffer and worker"""
+    import importlib
+
+    for module_name, names in SINGLETONS.items():
+        module = importlib.import_module(module_name)
+        for name in (names,) if isinstance(names, str) else names:
+            setattr(module, name, None)
+
+    from rides import location_buffer, location_store
+    location_buffer._buffers.clear()
+    location_store._stores.clear()
+    location_store._warmed.clear()
+
+
+class FastTierTestCase(TestCase):
+    """Database tests with fresh in-memory backends (REDIS_URL unset) and no background threads"""
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(override_settings(
+            PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+            LOCATION_BUFFER={**settings.LOCATION_BUFFER, 'FLUSH_IN_PROCESS': False},
+            DRIVER_AVAILABILITY={**settings.DRIVER_AVAILABILITY, 'SWEEP_IN_PROCESS': False},
+        ))
+        reset_fast_tier()
+        self.addCleanup(reset_fast_tier)
+
+
+_phones = count(1000000)
+
+
+def make_user(username, user_type='passenger', **fields):
+    return User.objects.create_user(
+        username=username,
+        password='secret-pass-123',
+        user_type=user_type,
+        phone_number=fields.pop('phone_number', f'+99890{next(_phones)}'),
+        first_name=fields.pop('first_name', username.title()),
+        **fields
+    )
+
+
+def make_driver(username, lat=None, lon=None, status='available'):
+    """A driver with a complete profile at (lat, lon)"""
+    user = make_user(username, user_type='driver')
+    return Driver.objects.create(
+        user=user,
+        license_number='AA1234567',
+        vehicle_type='sedan',
+        vehicle_model='Cobalt',
+        vehicle_number='01A123BC',
+        vehicle_color='white',
+        status=status,
+        current_latitude=None if lat is None else Decimal(f'{lat:.6f}'),
+        current_longitude=None if lon is None else Decimal(f'{lon:.6f}'),
+    )
+
+
+def make_ride(passenger, pickup=(41.311, 69.279), dropoff=(41.330, 69.300), **fields):
+    from rides.models import Ride
+
+    return Ride.objects.create(
+        passenger=passenger,
+        pickup_latitude=Decimal(f'{pickup[0]:.6f}'),
+        pickup_longitude=Decimal(f'{pickup[1]:.6f}'),
+        pickup_address=fields.pop('pickup_address', 'Pickup'),
+        dropoff_latitude=Decimal(f'{dropoff[0]:.6f}'),
+        dropoff_longitude=Decimal(f'{dropoff[1]:.6f}'),
+        dropoff_address=fields.pop('dropoff_address', 'Dropoff'),
+        **fields
+    )
+
+
+def connect_socket(user, subprotocols=None):
+    """A WebsocketCommunicator on the location consumer, authenticated as user"""
+    from channels.testing import WebsocketCommunicator
+
+    from rides.consumers import LocationConsumer
+
+    communicator = WebsocketCommunicator(
+        LocationConsumer.as_asgi(), '/ws/location/', subprotocols=subprotocols
+    )
+    communicator.scope['user'] = user
+    return communicator
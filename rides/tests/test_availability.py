@@ -0,0 +1,170 @@
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.test import override_settings
+
+from users.models import Driver
+
+from rides import availability
+from rides.availability import (
+    InMemoryAvailabilityTracker, RedisAvailabilityTracker, driver_heartbeat,
+    expire_drivers, get_availability_tracker, live_driver_ids
+)
+from rides.location_store import get_driver_store
+
+from .helpers import FastTierTestCase, make_driver
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class InMemoryTrackerTests(FastTierTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tracker = InMemoryAvailabilityTracker(ttl_seconds=90, batch_size=2)
+
+    def test_deadlines_expire_in_order_and_once(self):
+        self.tracker.heartbeat(1, now=0)
+        self.tracker.heartbeat(2, now=50)
+        self.assertEqual(self.tracker.pop_expired(now=100), [1])
+        self.assertEqual(self.tracker.pop_expired(now=100), [])
+        self.assertEqual(self.tracker.pop_expired(now=140), [2])
+        self.assertEqual(self.tracker.tracked_count(), 0)
+
+    def test_heartbeat_pushes_the_deadline_back(self):
+        self.tracker.heartbeat(1, now=0)
+        self.tracker.heartbeat(1, now=60)
+        self.assertEqual(self.tracker.pop_expired(now=100), [])
+        self.assertEqual(self.tracker.alive([1, 2], now=100), {1, 2})
+        self.assertEqual(self.tracker.alive([1], now=151), set())
+        self.assertEqual(self.tracker.pop_expired(now=151), [1])
+
+    def test_cleared_driver_never_expires(self):
+        self.tracker.heartbeat(1, now=0)
+        self.tracker.clear(1)
+        self.assertEqual(self.tracker.pop_expired(now=1000), [])
+
+    def test_track_many_keeps_existing_deadlines(self):
+        self.tracker.heartbeat(1, now=0)
+        self.tracker.track_many([1, 2], now=80)
+        self.assertEqual(self.tracker.pop_expired(now=100), [1])
+        self.assertEqual(self.tracker.pop_expired(now=170), [2])
+
+    def test_sweep_takes_overdue_drivers_offline_in_batches(self):
+        drivers = [make_driver(f'late{i}', 41.311, 69.279 + i / 1000) for i in range(3)]
+        fresh = make_driver('fresh', 41.320, 69.290)
+        for driver in drivers:
+            self.tracker.heartbeat(driver.user_id, now=0)
+        self.tracker.heartbeat(fresh.user_id, now=50)
+
+        with mock.patch.object(availability, 'expire_drivers', wraps=expire_drivers) as expire:
+            self.assertEqual(self.tracker.sweep(now=100), 3)
+        self.assertEqual(expire.call_count, 2)
+
+        statuses = dict(Driver.objects.values_list('user_id', 'status'))
+        self.assertEqual({statuses[driver.user_id] for driver in drivers}, {'offline'})
+        self.assertEqual(statuses[fresh.user_id], 'available')
+
+
+class ExpireDriversTests(FastTierTestCase):
+    def test_only_available_drivers_are_taken_offline(self):
+        idle = make_driver('idle', 41.311, 69.279)
+        busy = make_driver('busy', 41.312, 69.280, status='on_trip')
+
+        self.assertEqual(expire_drivers([idle.user_id, busy.user_id]), 1)
+        idle.refresh_from_db()
+        busy.refresh_from_db()
+        self.assertEqual((idle.status, busy.status), ('offline', 'on_trip'))
+
+    def test_expired_driver_leaves_the_location_store(self):
+        driver = make_driver('gone', 41.311, 69.279)
+        store = get_driver_store()
+        self.assertEqual([member for member, _ in store.search(41.311, 69.279, 1)], [driver.user_id])
+
+        expire_drivers([driver.user_id])
+        self.assertEqual(store.search(41.311, 69.279, 1), [])
+
+    def test_nothing_to_expire(self):
+        driver = make_driver('parked', 41.311, 69.279, status='offline')
+        self.assertEqual(expire_drivers([driver.user_id, 999999]), 0)
+
+
+class PerProcessTrackerTests(FastTierTestCase):
+    """Without Redis a worker must never expire drivers whose pings it never saw"""
+
+    def test_not_warmed_from_the_database(self):
+        make_driver('elsewhere', 41.311, 69.279)
+        self.assertEqual(get_availability_tracker().tracked_count(), 0)
+
+    def test_status_change_alone_starts_no_deadline(self):
+        driver = make_driver('switching', 41.311, 69.279, status='offline')
+        driver.status = 'available'
+        driver.save(update_fields=['status'])
+        self.assertEqual(get_availability_tracker().tracked_count(), 0)
+
+        driver_heartbeat(driver.user_id)
+        self.assertEqual(get_availability_tracker().tracked_count(), 1)
+
+        driver.status = 'on_trip'
+        driver.save(update_fields=['status'])
+        self.assertEqual(get_availability_tracker().tracked_count(), 0)
+
+    def test_sweeper_thread_is_off_by_default(self):
+        config = {**settings.DRIVER_AVAILABILITY}
+        config.pop('SWEEP_IN_PROCESS')
+        with override_settings(DRIVER_AVAILABILITY=config), \
+                mock.patch.object(InMemoryAvailabilityTracker, 'start') as start:
+            get_availability_tracker()
+        start.assert_not_called()
+
+    def test_overdue_drivers_are_hidden_from_searches(self):
+        driver_heartbeat(7)
+        tracker = get_availability_tracker()
+        tracker._deadlines[7] = 0
+        self.assertEqual(live_driver_ids([7, 8]), {8})
+
+
+@skipUnless(fakeredis, 'fakeredis is not installed')
+class RedisTrackerTests(FastTierTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = fakeredis.FakeServer()
+        self.tracker = self.make_tracker()
+
+    def make_tracker(self):
+        tracker = RedisAvailabilityTracker('redis://localhost:6379/0', ttl_seconds=90, loaded_ttl=60)
+        tracker.redis = fakeredis.FakeRedis(server=self.server, decode_responses=True)
+        return tracker
+
+    def test_expired_drivers_are_popped_by_one_sweeper_only(self):
+        self.tracker.heartbeat(1, now=0)
+        self.tracker.heartbeat(2, now=50)
+        other = self.make_tracker()
+        self.assertEqual(other.alive(['1', '2', '3'], now=100), {'2', '3'})
+        self.assertEqual(self.tracker.pop_expired(now=100), [1])
+        self.assertEqual(other.pop_expired(now=100), [])
+
+    def test_track_many_keeps_existing_deadlines(self):
+        self.tracker.heartbeat(1, now=0)
+        self.tracker.track_many([1, 2], now=80)
+        self.assertEqual(self.tracker.pop_expired(now=100), [1])
+
+    def test_loaded_flag_expires(self):
+        self.assertTrue(self.tracker.mark_loaded())
+        self.assertFalse(self.make_tracker().mark_loaded())
+        self.assertEqual(self.tracker.redis.ttl(self.tracker.loaded_key), 60)
+
+    def test_shared_tracker_is_warmed_from_the_database(self):
+        config = {
+            **settings.DRIVER_AVAILABILITY,
+            'BACKEND': 'rides.availability.RedisAvailabilityTracker',
+            'OPTIONS': {**settings.DRIVER_AVAILABILITY['OPTIONS'], 'url': 'redis://localhost:6379/0'},
+        }
+        with override_settings(DRIVER_AVAILABILITY=config), \
+                mock.patch.object(RedisAvailabilityTracker, 'mark_loaded', return_value=True), \
+                mock.patch.object(availability, '_load_available_drivers') as load:
+            availability._tracker = None
+            tracker = get_availability_tracker()
+        load.assert_called_once_with(tracker)
@@ -0,0 +1,153 @@
+import asyncio
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.test import SimpleTestCase, override_settings
+
+from rides.broadcaster import LocationBroadcaster
+from rides.fanout import location_groups_around
+
+from .helpers import FastTierTestCase, connect_socket, make_driver, make_user
+
+
+class LocationBroadcasterTests(SimpleTestCase):
+    def test_publish_is_refused_until_the_tick_runs(self):
+        broadcaster = LocationBroadcaster()
+        self.assertFalse(broadcaster.publish('location_0_0', 1, 41.3, 69.2))
+        self.assertEqual(broadcaster.drain(), [])
+
+    def drain_after(self, broadcaster, updates):
+        async def publish_and_drain():
+            broadcaster.ensure_running()
+            try:
+                for group, driver_id, lat, lon in updates:
+                    self.assertTrue(broadcaster.publish(group, driver_id, lat, lon))
+                return broadcaster.drain()
+            finally:
+                broadcaster._task.cancel()
+
+        return async_to_sync(publish_and_drain)()
+
+    def test_last_position_per_driver_wins(self):
+        broadcaster = LocationBroadcaster(tick_seconds=60)
+        frames = self.drain_after(broadcaster, [
+            ('location_0_0', 1, 41.3, 69.2),
+            ('location_0_0', 2, 41.4, 69.3),
+            ('location_0_0', 1, 41.3000004, 69.2000001),
+            ('location_0_1', 1, 41.5, 69.4),
+        ])
+        self.assertEqual(frames, [
+            ('location_0_0', {
+                'type': 'location_batch', 'drivers': [[1, 41.3, 69.2], [2, 41.4, 69.3]],
+            }),
+            ('location_0_1', {'type': 'location_batch', 'drivers': [[1, 41.5, 69.4]]}),
+        ])
+        self.assertEqual((broadcaster.updates, broadcaster.coalesced), (4, 1))
+        self.assertEqual(broadcaster.drain(), [])
+
+    def test_frames_are_split_at_the_driver_cap(self):
+        broadcaster = LocationBroadcaster(tick_seconds=60, max_drivers_per_frame=2)
+        frames = self.drain_after(broadcaster, [
+            ('location_0_0', driver_id, 41.3, 69.2) for driver_id in range(5)
+        ])
+        self.assertEqual(
+            [[entry[0] for entry in message['drivers']] for _, message in frames],
+            [[0, 1], [2, 3], [4]],
+        )
+
+    def test_each_tick_sends_one_message_per_group(self):
+        async def tick():
+            layer = get_channel_layer()
+            channel = await layer.new_channel()
+            await layer.group_add('location_9_9', channel)
+
+            broadcaster = LocationBroadcaster(tick_seconds=0.02)
+            broadcaster.ensure_running()
+            try:
+                broadcaster.publish('location_9_9', 1, 41.3, 69.2)
+                broadcaster.publish('location_9_9', 1, 41.31, 69.21)
+                message = await asyncio.wait_for(layer.receive(channel), 1)
+                with self.assertRaises(asyncio.TimeoutError):
+                    await asyncio.wait_for(layer.receive(channel), 0.1)
+            finally:
+                broadcaster._task.cancel()
+                await layer.group_discard('location_9_9', channel)
+            return broadcaster, message
+
+        broadcaster, message = async_to_sync(tick)()
+        self.assertEqual(message, {'type': 'location_batch', 'drivers': [[1, 41.31, 69.21]]})
+        self.assertEqual(broadcaster.stats()['messages'], 1)
+        self.assertGreater(broadcaster.stats()['ticks'], 1)
+
+
+class LocationBatchConsumerTests(FastTierTestCase):
+    point = (41.311, 69.279)
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(override_settings(LOCATION_BROADCAST_TICK_MS=50))
+        self.groups = sorted(location_groups_around(*self.point))
+
+    async def watch(self, user, batches):
+        """Subscribe to the area, deliver (group, drivers) batches and collect the frames"""
+        layer = get_channel_layer()
+        communicator = connect_socket(user)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        try:
+            await communicator.send_json_to({
+                'type': 'subscribe_area', 'latitude': self.point[0], 'longitude': self.point[1],
+            })
+            await communicator.receive_nothing(0.05)
+            for group, drivers in batches:
+                await layer.group_send(group, {'type': 'location_batch', 'drivers': drivers})
+            frames = []
+            while not await communicator.receive_nothing(0.2):
+                frames.append(await communicator.receive_json_from())
+            return frames
+        finally:
+            await communicator.disconnect()
+
+    def test_batches_of_every_group_leave_in_one_frame(self):
+        frames = async_to_sync(self.watch)(make_user('watcher'), [
+            (self.groups[0], [[1, 41.3, 69.2], [2, 41.4, 69.3]]),
+            (self.groups[1], [[3, 41.5, 69.4], [1, 41.31, 69.21]]),
+        ])
+        self.assertEqual(frames, [{
+            'type': 'location_batch',
+            'drivers': [[1, 41.31, 69.21], [2, 41.4, 69.3], [3, 41.5, 69.4]],
+        }])
+
+    def test_merged_frame_is_split_at_the_driver_cap(self):
+        with override_settings(LOCATION_BATCH_MAX_DRIVERS=2):
+            frames = async_to_sync(self.watch)(make_user('watcher'), [
+                (group, [[index, 41.3, 69.2]]) for index, group in enumerate(self.groups[:3])
+            ])
+        self.assertEqual([len(frame['drivers']) for frame in frames], [2, 1])
+
+    def test_driver_pings_reach_watchers_on_the_next_tick(self):
+        mover = make_driver('mover', *self.point)
+
+        async def ping_and_watch():
+            watcher = connect_socket(await database_sync_to_async(make_user)('watcher'))
+            driver = connect_socket(mover.user)
+            await watcher.connect()
+            await driver.connect()
+            try:
+                await watcher.send_json_to({
+                    'type': 'subscribe_area', 'latitude': self.point[0], 'longitude': self.point[1],
+                })
+                await watcher.receive_nothing(0.05)
+                await driver.send_json_to({
+                    'type': 'location_update', 'latitude': 41.3115, 'longitude': 69.2795,
+                })
+                return await watcher.receive_json_from(timeout=1)
+            finally:
+                await watcher.disconnect()
+                await driver.disconnect()
+
+        frame = async_to_sync(ping_and_watch)()
+        self.assertEqual(frame, {
+            'type': 'location_batch', 'drivers': [[mover.user_id, 41.3115, 69.2795]],
+        })
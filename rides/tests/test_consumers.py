@@ -0,0 +1,169 @@
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from rides.fanout import (
+    driver_location_group, location_cell, location_group, location_groups_around, ride_group
+)
+from rides.spatial import KM_PER_DEGREE
+
+from .helpers import FastTierTestCase, connect_socket, make_driver, make_ride, make_user
+
+HERE = (41.3105, 69.2795)
+NEXT_CELL_NORTH = (HERE[0] + 1.0 / KM_PER_DEGREE, HERE[1])
+
+
+class SocketTestCase(FastTierTestCase):
+    async def reachable(self, communicator, groups):
+        """The groups among these whose broadcasts reach the socket (each probed once)"""
+        groups = sorted(groups)
+        layer = get_channel_layer()
+        for index, group in enumerate(groups):
+            await layer.group_send(group, {
+                'type': 'location_broadcast', 'driver_id': index, 'latitude': 0, 'longitude': 0,
+            })
+        received = []
+        while not await communicator.receive_nothing(0.05):
+            received.append(groups[(await communicator.receive_json_from())['driver_id']])
+        self.assertEqual(len(received), len(set(received)), 'a group was delivered twice')
+        return set(received)
+
+    async def subscribe(self, communicator, point, message_type='subscribe_area'):
+        await communicator.send_json_to({
+            'type': message_type, 'latitude': point[0], 'longitude': point[1],
+        })
+        await communicator.receive_nothing(0.05)
+
+    def run_socket(self, user, scenario):
+        async def connected():
+            communicator = connect_socket(user)
+            self.assertTrue((await communicator.connect())[0])
+            try:
+                return await scenario(communicator)
+            finally:
+                await communicator.disconnect()
+
+        return async_to_sync(connected)()
+
+
+class AreaSubscriptionTests(SocketTestCase):
+    def setUp(self):
+        super().setUp()
+        self.here = location_groups_around(*HERE)
+        self.north = location_groups_around(*NEXT_CELL_NORTH)
+
+    def test_crossing_a_cell_boundary_swaps_only_the_edge_groups(self):
+        self.assertEqual(location_cell(*NEXT_CELL_NORTH)[0], location_cell(*HERE)[0] + 1)
+
+        async def scenario(communicator):
+            everywhere = self.here | self.north
+            self.assertEqual(await self.reachable(communicator, everywhere), set())
+            await self.subscribe(communicator, HERE)
+            before = await self.reachable(communicator, everywhere)
+            await self.subscribe(communicator, NEXT_CELL_NORTH)
+            after = await self.reachable(communicator, everywhere)
+            return before, after
+
+        before, after = self.run_socket(make_user('rider'), scenario)
+        self.assertEqual(before, self.here)
+        self.assertEqual(after, self.north)
+        self.assertTrue(self.here - self.north and self.north - self.here)
+
+    def test_location_updates_move_the_subscription_too(self):
+        async def scenario(communicator):
+            await self.subscribe(communicator, HERE, message_type='location_update')
+            return await self.reachable(communicator, self.here | self.north)
+
+        self.assertEqual(self.run_socket(make_user('rider'), scenario), self.here)
+
+    def test_subscribe_area_needs_a_point(self):
+        async def scenario(communicator):
+            await communicator.send_json_to({'type': 'subscribe_area', 'latitude': HERE[0]})
+            return await communicator.receive_json_from()
+
+        self.assertEqual(self.run_socket(make_user('rider'), scenario), {
+            'type': 'error', 'message': 'Latitude and longitude are required',
+        })
+
+
+class RideGroupTests(SocketTestCase):
+    def setUp(self):
+        super().setUp()
+        self.passenger = make_user('rider')
+        self.driver = make_driver('taker', *HERE)
+        self.ride = make_ride(self.passenger)
+        self.area = location_groups_around(*HERE)
+        self.groups = self.area | {ride_group(self.ride.id)}
+
+    async def join_and_leave(self, communicator):
+        layer = get_channel_layer()
+        user_id = communicator.scope['user'].id
+        await self.subscribe(communicator, HERE)
+        subscribed = await self.reachable(communicator, self.groups)
+
+        await layer.group_send(f'user_{user_id}', {'type': 'ride_group_join', 'ride_id': self.ride.id})
+        started = await communicator.receive_json_from()
+        on_ride = await self.reachable(communicator, self.groups)
+        await self.subscribe(communicator, NEXT_CELL_NORTH)
+        await self.subscribe(communicator, HERE)
+        still_on_ride = await self.reachable(communicator, self.groups)
+
+        await layer.group_send(ride_group(self.ride.id), {
+            'type': 'ride_group_leave', 'ride_id': self.ride.id, 'status': 'completed',
+        })
+        ended = await communicator.receive_json_from()
+        left = await self.reachable(communicator, self.groups)
+        await self.subscribe(communicator, HERE)
+        resubscribed = await self.reachable(communicator, self.groups)
+        return {
+            'subscribed': subscribed, 'started': started, 'on_ride': on_ride,
+            'still_on_ride': still_on_ride, 'ended': ended, 'left': left,
+            'resubscribed': resubscribed,
+        }
+
+    def test_passenger_leaves_the_area_while_on_a_ride(self):
+        steps = self.run_socket(self.passenger, self.join_and_leave)
+        ride = {ride_group(self.ride.id)}
+
+        self.assertEqual(steps['subscribed'], self.area)
+        self.assertEqual(steps['started'], {'type': 'ride_tracking_started', 'ride_id': self.ride.id})
+        self.assertEqual(steps['on_ride'], ride)
+        self.assertEqual(steps['still_on_ride'], ride)
+        self.assertEqual(steps['ended'], {
+            'type': 'ride_tracking_ended', 'ride_id': self.ride.id, 'status': 'completed',
+        })
+        self.assertEqual(steps['left'], set())
+        self.assertEqual(steps['resubscribed'], self.area)
+
+    def test_driver_keeps_watching_the_area_on_a_ride(self):
+        steps = self.run_socket(self.driver.user, self.join_and_leave)
+        self.assertEqual(steps['on_ride'], self.groups)
+        self.assertEqual(steps['left'], self.area)
+
+    def test_rides_in_progress_are_rejoined_on_connect(self):
+        self.ride.status, self.ride.driver = 'accepted', self.driver.user
+        self.ride.save()
+
+        async def scenario(communicator):
+            await self.subscribe(communicator, HERE)
+            return await self.reachable(communicator, self.groups)
+
+        self.assertEqual(self.run_socket(self.passenger, scenario), {ride_group(self.ride.id)})
+
+
+class DriverLocationGroupTests(FastTierTestCase):
+    def test_drivers_on_a_ride_broadcast_to_its_group_only(self):
+        driver = make_driver('taker', *HERE)
+        self.assertEqual(driver_location_group(driver.user_id, *HERE), location_group(*HERE))
+
+        ride = make_ride(make_user('rider'), status='accepted', driver=driver.user)
+        self.assertEqual(driver_location_group(driver.user_id, *HERE), ride_group(ride.id))
+
+        ride.status = 'completed'
+        ride.save()
+        self.assertEqual(driver_location_group(driver.user_id, *HERE), location_group(*HERE))
+
+    def test_lookup_errors_fall_back_to_the_cell(self):
+        with mock.patch('rides.traces.InMemoryTraceRecorder.active_ride', side_effect=RuntimeError):
+            self.assertEqual(driver_location_group(7, *HERE), location_group(*HERE))
@@ -0,0 +1,220 @@
+import asyncio
+import os
+import time
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+from rides.dispatch import DispatchWorker, dispatch_ride, get_offer_book, match_ride
+
+from .helpers import FastTierTestCase, make_driver, make_ride, make_user
+
+PICKUP = (41.311, 69.279)
+
+
+@override_settings(DISPATCH_MODE='waves')
+class WaveDispatchTests(FastTierTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ride = make_ride(make_user('rider'), pickup=PICKUP)
+        # Five drivers, each a little further from the pickup than the last
+        self.drivers = [
+            make_driver(f'driver{i}', PICKUP[0] + 0.002 * (i + 1), PICKUP[1]) for i in range(5)
+        ]
+        self.worker = DispatchWorker(
+            concurrency=1, waves={'size': 2, 'window': 0.05, 'max_waves': 4}
+        )
+        self.waves = []
+
+    def user_ids(self, drivers):
+        return [driver.user_id for driver in drivers]
+
+    def run_waves(self, on_send=None):
+        async def send(pairs):
+            self.waves.append([int(group.split('_')[1]) for group, _ in pairs])
+            if on_send is not None:
+                await database_sync_to_async(on_send)(len(self.waves))
+
+        async def run():
+            self.worker.ensure_running()
+            await self.worker.dispatch(self.ride.id, time.perf_counter())
+            while self.ride.id in self.worker._closed:
+                await asyncio.sleep(0.01)
+            for task in self.worker._tasks:
+                task.cancel()
+
+        with mock.patch('rides.dispatch.group_send_many', side_effect=send):
+            async_to_sync(run)()
+
+    def test_waves_reach_the_closest_drivers_first(self):
+        self.run_waves()
+        self.assertEqual(self.waves, [
+            self.user_ids(self.drivers[:2]),
+            self.user_ids(self.drivers[2:4]),
+            self.user_ids(self.drivers[4:]),
+        ])
+        self.assertFalse(get_offer_book().is_open(self.ride.id))
+        self.assertEqual(self.worker.offers, 5)
+
+    def test_no_wave_after_the_ride_is_accepted(self):
+        def accept_after_first_wave(wave):
+            if wave == 1:
+                self.ride.status = 'accepted'
+                self.ride.driver = self.drivers[0].user
+                self.ride.save()
+
+        self.run_waves(on_send=accept_after_first_wave)
+        self.assertEqual(self.waves, [self.user_ids(self.drivers[:2])])
+
+    def test_match_ride_skips_offered_and_busy_drivers(self):
+        self.drivers[1].status = 'on_trip'
+        self.drivers[1].save()
+        offers = match_ride(self.ride.id, limit=2, exclude={self.drivers[0].user_id})
+        self.assertEqual([driver_id for driver_id, _ in offers], self.user_ids(self.drivers[2:4]))
+        self.assertEqual(offers[0][1]['type'], 'prepared_frame')
+
+        self.ride.status = 'cancelled'
+        self.ride.save()
+        self.assertEqual(match_ride(self.ride.id), [])
+
+
+class DispatchQueueTests(FastTierTestCase):
+    def setUp(self):
+        super().setUp()
+        self.worker = DispatchWorker(queue_size=1, concurrency=1, max_retries=3, retry_backoff=0.01)
+
+    def test_full_queue_falls_back_to_inline_dispatch(self):
+        release = asyncio.Event()
+        dispatched = []
+
+        async def slow_dispatch(ride_id, submitted_at):
+            dispatched.append(ride_id)
+            await release.wait()
+
+        async def run():
+            self.worker.ensure_running()
+            accepted = []
+            for ride_id in (1, 2, 3):
+                accepted.append(self.worker.submit(ride_id))
+                for _ in range(3):
+                    await asyncio.sleep(0)  # let the worker take ride 1 and ride 2 reach the queue
+            release.set()
+            while self.worker._queue.qsize() or len(dispatched) < 2:
+                await asyncio.sleep(0.01)
+            for task in self.worker._tasks:
+                task.cancel()
+            return accepted
+
+        with mock.patch.object(self.worker, 'dispatch', side_effect=slow_dispatch):
+            accepted = async_to_sync(run)()
+        self.assertEqual(accepted, [True, True, False])
+        self.assertEqual(dispatched, [1, 2])
+        stats = self.worker.stats()
+        self.assertEqual((stats['submitted'], stats['rejected'], stats['max_depth']), (2, 1, 1))
+
+    def test_rejected_ride_is_offered_from_the_request(self):
+        ride = make_ride(make_user('rider'), pickup=PICKUP)
+        with mock.patch('rides.dispatch.get_dispatch_worker', return_value=self.worker), \
+                mock.patch('rides.dispatch.notify_nearby_drivers') as notify:
+            dispatch_ride(ride)  # the worker was never started
+        notify.assert_called_once_with(ride.id, limit=None)
+        self.assertEqual(self.worker.rejected, 1)
+
+    def test_failed_sends_are_retried_with_backoff(self):
+        attempts = []
+
+        async def flaky_send(pairs):
+            attempts.append(len(pairs))
+            if len(attempts) < 3:
+                raise ConnectionError('layer down')
+
+        with mock.patch('rides.dispatch.group_send_many', side_effect=flaky_send), \
+                mock.patch('rides.dispatch.asyncio.sleep', new=mock.AsyncMock()) as sleep:
+            delivered = async_to_sync(self.worker._send)([('user_1', {}), ('user_2', {})], 'ride #1')
+        self.assertTrue(delivered)
+        self.assertEqual(attempts, [2, 2, 2])
+        self.assertEqual([call.args[0] for call in sleep.await_args_list], [0.01, 0.02])
+        self.assertEqual((self.worker.retries, self.worker.failed_sends), (2, 0))
+
+    def test_gives_up_after_max_retries(self):
+        send = mock.AsyncMock(side_effect=ConnectionError('layer down'))
+        with mock.patch('rides.dispatch.group_send_many', new=send), \
+                mock.patch('rides.dispatch.asyncio.sleep', new=mock.AsyncMock()) as sleep:
+            delivered = async_to_sync(self.worker._send)([('user_1', {}), ('user_2', {})], 'ride #1')
+        self.assertFalse(delivered)
+        self.assertEqual(send.await_count, 4)
+        self.assertEqual([call.args[0] for call in sleep.await_args_list], [0.01, 0.02, 0.04])
+        self.assertEqual((self.worker.retries, self.worker.failed_sends), (3, 2))
+
+    def test_a_failed_dispatch_does_not_stop_the_worker(self):
+        dispatched = []
+
+        async def dispatch(ride_id, submitted_at):
+            dispatched.append(ride_id)
+            if ride_id == 1:
+                raise RuntimeError('matching failed')
+
+        async def run():
+            self.worker.ensure_running()
+            for ride_id in (1, 2):
+                self.worker.submit(ride_id)
+                while len(dispatched) < ride_id:
+                    await asyncio.sleep(0.01)
+            running = self.worker.running
+            for task in self.worker._tasks:
+                task.cancel()
+            return running
+
+        with mock.patch.object(self.worker, 'dispatch', side_effect=dispatch):
+            self.assertTrue(async_to_sync(run)())
+        self.assertEqual(dispatched, [1, 2])
+
+    def test_ensure_running_restarts_dead_tasks_once(self):
+        async def run():
+            self.worker.ensure_running()
+            first = list(self.worker._tasks)
+            self.worker.ensure_running()
+            same = self.worker._tasks == first
+
+            for task in first:
+                task.cancel()
+            await asyncio.sleep(0)
+            stopped = not self.worker.running
+            self.worker.ensure_running()
+            restarted = self.worker.running and self.worker._tasks != first
+            for task in self.worker._tasks:
+                task.cancel()
+            return same, stopped, restarted
+
+        self.assertEqual(async_to_sync(run)(), (True, True, True))
+
+    def test_new_event_loop_gets_its_own_queue(self):
+        async def start():
+            self.worker.ensure_running()
+            return self.worker._queue
+
+        first = async_to_sync(start)()  # that loop is gone once async_to_sync returns
+        self.assertFalse(self.worker.running)
+        self.assertFalse(self.worker.submit(1))
+        self.assertIsNot(async_to_sync(start)(), first)
+
+
+class RuntimeStatsViewTests(FastTierTestCase):
+    url = '/api/rides/stats/'
+
+    def test_admin_sees_the_dispatch_counters(self):
+        client = APIClient()
+        client.force_authenticate(make_user('ops', is_staff=True))
+        response = client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['pid'], os.getpid())
+        self.assertIn('queue_depth', response.data['dispatch'])
+        self.assertIn('rejected', response.data['dispatch'])
+
+    def test_other_users_are_refused(self):
+        client = APIClient()
+        client.force_authenticate(make_user('rider'))
+        self.assertEqual(client.get(self.url).status_code, 403)
@@ -0,0 +1,132 @@
+import tempfile
+from unittest import mock, skipUnless
+
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+from rides import estimates, roads
+from rides.estimates import EstimateCache, estimate_trip, get_estimate_cache
+
+from .helpers import FastTierTestCase, make_user
+from .test_roads import NODES, tiny_graph
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class EstimateCacheTests(FastTierTestCase):
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = EstimateCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)  # b is now the oldest
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+        self.assertEqual(cache.stats()['size'], 2)
+
+    def test_entries_expire_after_the_ttl(self):
+        cache = EstimateCache(ttl_seconds=300)
+        with mock.patch('rides.estimates.time.monotonic', return_value=1000.0):
+            cache.set('a', 1)
+        with mock.patch('rides.estimates.time.monotonic', return_value=1299.0):
+            self.assertEqual(cache.get('a'), 1)
+        with mock.patch('rides.estimates.time.monotonic', return_value=1301.0):
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['size'], 0)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_nearby_pins_share_an_entry(self):
+        cache = EstimateCache(cell_size_m=100)
+        self.assertEqual(
+            cache.key(41.31101, 69.27901, 41.33001, 69.30001, 'solo'),
+            cache.key(41.31104, 69.27904, 41.33004, 69.30004, 'solo'),
+        )
+        self.assertNotEqual(
+            cache.key(41.311, 69.279, 41.330, 69.300, 'solo'),
+            cache.key(41.311, 69.279, 41.330, 69.300, 'solo', routing='road-abc'),
+        )
+
+    def test_repeated_estimate_is_served_from_the_cache(self):
+        with mock.patch('rides.estimates.estimate_route', return_value=(3.0, 6.0)) as route:
+            first = estimate_trip(41.311, 69.279, 41.330, 69.300)
+            second = estimate_trip(41.311, 69.279, 41.330, 69.300)
+        route.assert_called_once()
+        self.assertEqual(first, second)
+        self.assertEqual(get_estimate_cache().stats()['hits'], 1)
+
+
+class EstimateRoutingKeyTests(FastTierTestCase):
+    def setUp(self):
+        super().setUp()
+        self.path = self.enterContext(tempfile.TemporaryDirectory())
+        tiny_graph().save(self.path)
+        self.addCleanup(setattr, roads, '_graph_loaded', False)
+        self.addCleanup(setattr, roads, '_graph', None)
+
+    def load_graph(self, path):
+        roads._graph, roads._graph_loaded = None, False
+        return self.enterContext(override_settings(ROAD_GRAPH_PATH=path))
+
+    def test_straight_line_estimates_are_not_served_once_the_graph_loads(self):
+        self.load_graph('')
+        line = estimate_trip(*NODES[0], *NODES[2])
+
+        self.load_graph(self.path)
+        road = estimate_trip(*NODES[0], *NODES[2])
+        self.assertEqual((road['distance'], road['duration']), tiny_graph().route(*NODES[0], *NODES[2]))
+        self.assertNotEqual(road['duration'], line['duration'])
+        self.assertEqual(get_estimate_cache().stats()['misses'], 2)
+
+    def test_graph_version_follows_its_contents(self):
+        self.assertEqual(roads.RoadGraph.load(self.path).version, tiny_graph().version)
+        self.load_graph(self.path)
+        self.assertEqual(roads.routing_version(), f'road-{tiny_graph().version}')
+
+
+@skipUnless(fakeredis, 'fakeredis is not installed')
+class RedisEstimateCacheTests(FastTierTestCase):
+    def make_cache(self, server):
+        cache = EstimateCache(redis_url='redis://localhost:6379/0')
+        cache.redis = fakeredis.FakeRedis(server=server, decode_responses=True)
+        return cache
+
+    def test_local_miss_is_filled_from_redis(self):
+        server = fakeredis.FakeServer()
+        self.make_cache(server).set('a', {'fare': 1})
+        other = self.make_cache(server)
+        self.assertEqual(other.get('a'), {'fare': 1})
+        self.assertEqual(other.get('a'), {'fare': 1})
+        self.assertEqual((other.redis_hits, other.hits, other.misses), (1, 1, 0))
+
+    def test_miss_in_both_tiers(self):
+        cache = self.make_cache(fakeredis.FakeServer())
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual((cache.redis_hits, cache.misses), (0, 1))
+
+    def test_redis_outage_falls_back_to_computing(self):
+        cache = EstimateCache()
+        cache.redis = mock.Mock(**{
+            'get.side_effect': ConnectionError('redis down'),
+            'set.side_effect': ConnectionError('redis down'),
+        })
+        estimates._cache = cache
+        with mock.patch('rides.estimates.estimate_route', return_value=(3.0, 6.0)) as route:
+            estimate = estimate_trip(41.311, 69.279, 41.330, 69.300)
+            estimate_trip(41.311, 69.279, 41.330, 69.300)
+        self.assertEqual(estimate['distance'], 3.0)
+        route.assert_called_once()  # the local tier still caches
+        self.assertEqual((cache.misses, cache.hits), (1, 1))
+
+
+class EstimateStatsTests(FastTierTestCase):
+    def test_admin_stats_include_the_estimate_cache(self):
+        estimate_trip(41.311, 69.279, 41.330, 69.300)
+        client = APIClient()
+        client.force_authenticate(make_user('ops', is_staff=True))
+        response = client.get('/api/rides/stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['estimates']['misses'], 1)
+        self.assertEqual(response.data['estimates']['size'], 1)
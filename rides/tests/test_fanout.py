@@ -0,0 +1,98 @@
+import asyncio
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase
+
+from rides import fanout
+from rides.fanout import group_send_many
+
+try:
+    import fakeredis
+    from channels_redis.core import RedisChannelLayer
+except ImportError:
+    fakeredis = None
+
+
+@skipUnless(fakeredis, 'fakeredis and channels_redis are required')
+class RedisGroupSendManyTests(SimpleTestCase):
+    """The batched Redis path must queue exactly what per-message group_send does"""
+
+    hosts = ['redis://redis-a:6379/0', 'redis://redis-b:6379/0']
+
+    def make_layers(self, servers, **options):
+        # Two workers (different client prefixes) sharing the same two Redis hosts
+        layers = [RedisChannelLayer(hosts=self.hosts, **options) for _ in range(2)]
+        for layer in layers:
+            clients = [fakeredis.FakeAsyncRedis(server=server) for server in servers]
+            layer.connection = clients.__getitem__
+        return layers
+
+    async def deliver(self, send, pairs, **options):
+        """Subscribe channels of both workers, send, and return what each channel received"""
+        servers = [fakeredis.FakeServer(), fakeredis.FakeServer()]
+        sender, other = self.make_layers(servers, **options)
+
+        channels = {}
+        for name, layer, groups in [
+            ('a', sender, ['g0', 'g1']),
+            ('b', sender, ['g0']),
+            ('c', other, ['g0', 'g2']),
+            ('d', other, ['g3']),
+        ]:
+            channel = await layer.new_channel()
+            channels[name] = (layer, channel)
+            for group in groups:
+                await layer.group_add(group, channel)
+
+        await send(sender, pairs)
+
+        received = {}
+        for name, (layer, channel) in channels.items():
+            messages = []
+            while True:
+                try:
+                    message = await asyncio.wait_for(layer.receive(channel), 0.1)
+                except asyncio.TimeoutError:
+                    break
+                messages.append((message['type'], message['n']))
+            received[name] = messages
+        return received
+
+    @staticmethod
+    async def plain_send(layer, pairs):
+        for group, message in pairs:
+            await layer.group_send(group, message)
+
+    def compare(self, pairs, **options):
+        expected = async_to_sync(self.deliver)(self.plain_send, pairs, **options)
+        actual = async_to_sync(self.deliver)(
+            lambda layer, pairs: group_send_many(pairs, channel_layer=layer), pairs, **options
+        )
+        self.assertEqual(actual, expected)
+        return actual
+
+    def test_batch_matches_group_send(self):
+        pairs = [
+            ('g0', {'type': 'offer', 'n': 1}),
+            ('g1', {'type': 'offer', 'n': 2}),
+            ('g2', {'type': 'offer', 'n': 3}),
+            ('g0', {'type': 'offer', 'n': 4}),
+            ('empty', {'type': 'offer', 'n': 5}),
+        ]
+        received = self.compare(pairs)
+        self.assertEqual(received['a'], [('offer', 1), ('offer', 2), ('offer', 4)])
+        self.assertEqual(received['c'], [('offer', 1), ('offer', 3), ('offer', 4)])
+        self.assertEqual(received['d'], [])
+
+    def test_channel_capacity_is_honoured_the_same_way(self):
+        pairs = [('g0', {'type': 'offer', 'n': n}) for n in range(5)]
+        received = self.compare(pairs, capacity=2)
+        self.assertEqual(received['c'], [('offer', 0), ('offer', 1)])
+
+    def test_uses_the_batch_path_on_the_verified_release(self):
+        layer = RedisChannelLayer(hosts=self.hosts)
+        self.assertTrue(fanout._is_redis_layer(layer))
+        with mock.patch('channels_redis.__version__', '9.9.9'), \
+                mock.patch.object(fanout, '_version_warned', True):
+            self.assertFalse(fanout._is_redis_layer(layer))
@@ -0,0 +1,144 @@
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+from rest_framework.test import APIClient
+
+from rides import ingestion
+from rides.ingestion import (
+    ACCEPTED, KEEPALIVE, RATE_LIMITED, STATIONARY, STATUS_CHANGE,
+    InMemoryIngestionFilter, RedisIngestionFilter, should_ingest,
+)
+
+from .helpers import FastTierTestCase, make_user
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+START = (41.3, 69.25)
+DEGREES_PER_METER = 1 / 111195
+
+
+def north(meters, origin=START):
+    return origin[0] + meters * DEGREES_PER_METER, origin[1]
+
+
+class IngestionFilterTests(SimpleTestCase):
+    """Decision table for a driver whose last passed ping was START, available, at t=0"""
+
+    options = {'min_distance_m': 15.0, 'keepalive_seconds': 30.0, 'min_interval_seconds': 1.0}
+
+    def make_filter(self):
+        return InMemoryIngestionFilter(**self.options)
+
+    def setUp(self):
+        self.filter = self.make_filter()
+        self.assertEqual(self.filter.check(7, *START, status='available', now=0), ACCEPTED)
+
+    def test_decision_table(self):
+        cases = [
+            # (seconds later, metres moved, status, decision)
+            (5, 100, None, ACCEPTED),
+            (5, 100, 'available', ACCEPTED),
+            (5, 5, None, STATIONARY),
+            (29, 14, 'available', STATIONARY),
+            (30, 5, None, KEEPALIVE),
+            (0.5, 100, None, RATE_LIMITED),
+            (0.5, 100, 'available', RATE_LIMITED),
+            (0.5, 0, 'busy', STATUS_CHANGE),
+            (5, 5, 'offline', STATUS_CHANGE),
+        ]
+        for seconds, meters, status, decision in cases:
+            with self.subTest(seconds=seconds, meters=meters, status=status):
+                ping_filter = self.make_filter()
+                ping_filter.check(7, *START, status='available', now=0)
+                self.assertEqual(
+                    ping_filter.check(7, *north(meters), status=status, now=seconds), decision
+                )
+
+    def test_dropped_pings_do_not_move_the_reference(self):
+        # Slow drift: each step is short, but the total from the last passed ping is not
+        self.assertEqual(self.filter.check(7, *north(10), now=5), STATIONARY)
+        self.assertEqual(self.filter.check(7, *north(20), now=10), ACCEPTED)
+        self.assertEqual(self.filter.check(7, *north(30), now=15), STATIONARY)
+        self.assertEqual(self.filter.check(7, *north(30), now=35), STATIONARY)
+        self.assertEqual(self.filter.check(7, *north(30), now=40), KEEPALIVE)
+
+    def test_passed_pings_keep_the_last_known_status(self):
+        self.filter.check(7, *north(100), now=5)
+        self.assertEqual(self.filter.check(7, *north(100), status='available', now=10), STATIONARY)
+        self.assertEqual(self.filter.check(7, *north(100), status='busy', now=10.5), STATUS_CHANGE)
+        self.assertEqual(self.filter.check(7, *north(100), status='busy', now=11), RATE_LIMITED)
+
+    def test_drivers_are_filtered_independently(self):
+        self.assertEqual(self.filter.check(8, *START, now=0.5), ACCEPTED)
+        self.filter.forget(7)
+        self.assertEqual(self.filter.check(7, *START, now=0.5), ACCEPTED)
+
+    def test_counters(self):
+        for seconds, meters in [(0.5, 0), (5, 0), (6, 0), (30, 0), (35, 100)]:
+            self.filter.check(7, *north(meters), now=seconds)
+        self.filter.check(7, *north(100), status='busy', now=36)
+
+        self.assertEqual(self.filter.stats(), {
+            ACCEPTED: 2,
+            STATUS_CHANGE: 1,
+            KEEPALIVE: 1,
+            STATIONARY: 2,
+            RATE_LIMITED: 1,
+            'total': 7,
+            'suppressed': 3,
+            'suppressed_ratio': 0.429,
+        })
+
+    def test_summary_is_logged_every_n_decisions(self):
+        ping_filter = InMemoryIngestionFilter(log_every=3, **self.options)
+        with mock.patch.object(ping_filter, 'log') as log:
+            for seconds in range(7):
+                ping_filter.check(7, *START, now=seconds * 5)
+        self.assertEqual(log.call_count, 2)
+
+
+@skipUnless(fakeredis, 'fakeredis is required')
+class RedisIngestionFilterTests(IngestionFilterTests):
+    def make_filter(self):
+        ping_filter = RedisIngestionFilter('redis://redis:6379/0', **self.options)
+        ping_filter.redis = fakeredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+        return ping_filter
+
+    def test_driver_state_expires_after_twice_the_keepalive(self):
+        self.assertEqual(self.filter.redis.ttl(self.filter._key(7)), 60)
+
+
+class ShouldIngestTests(SimpleTestCase):
+    def setUp(self):
+        ingestion._filter = None
+        self.addCleanup(setattr, ingestion, '_filter', None)
+
+    def test_everything_passes_while_the_filter_is_off(self):
+        with override_settings(LOCATION_INGESTION={**settings.LOCATION_INGESTION, 'ENABLED': False}):
+            self.assertTrue(should_ingest(7, *START))
+            self.assertTrue(should_ingest(7, *START))
+
+    def test_filter_errors_let_the_ping_through(self):
+        self.assertTrue(should_ingest(7, *START))
+        self.assertFalse(should_ingest(7, *START))
+        with mock.patch.object(InMemoryIngestionFilter, 'decide', side_effect=RuntimeError('boom')):
+            self.assertTrue(should_ingest(7, *START))
+
+
+class IngestionStatsViewTests(FastTierTestCase):
+    def test_counters_are_served_to_admins(self):
+        should_ingest(7, *START)
+        should_ingest(7, *START)
+
+        client = APIClient()
+        client.force_authenticate(make_user('ops', is_staff=True))
+        stats = client.get('/api/rides/stats/').data['ingestion']
+        self.assertEqual((stats['total'], stats['suppressed']), (2, 1))
+
+        with override_settings(LOCATION_INGESTION={**settings.LOCATION_INGESTION, 'ENABLED': False}):
+            ingestion._filter = None
+            self.assertIsNone(client.get('/api/rides/stats/').data['ingestion'])
@@ -0,0 +1,126 @@
+from decimal import Decimal
+from unittest import mock
+
+from rest_framework.test import APIClient
+
+from users.models import Driver, User
+
+from rides.location_buffer import (
+    InMemoryLocationBuffer, buffer_driver_location, get_location_buffer, pending_location
+)
+from rides.location_store import get_driver_store
+
+from .helpers import FastTierTestCase, make_driver, make_ride, make_user
+
+
+class LocationBufferTests(FastTierTestCase):
+    def setUp(self):
+        super().setUp()
+        self.driver = make_driver('pinger', 41.311, 69.279)
+        self.buffer = get_location_buffer('drivers')
+
+    def test_latest_ping_wins_and_is_flushed_once(self):
+        self.buffer.record(self.driver.pk, 41.3, 69.2)
+        self.buffer.record(self.driver.pk, 41.4, 69.3)
+        self.assertEqual(pending_location('drivers', self.driver.pk), (41.4, 69.3))
+
+        self.assertEqual(self.buffer.flush(), 1)
+        self.driver.refresh_from_db()
+        self.assertEqual(self.driver.current_latitude, Decimal('41.400000'))
+        self.assertEqual(self.driver.current_longitude, Decimal('69.300000'))
+        self.assertIsNone(pending_location('drivers', self.driver.pk))
+        self.assertEqual(self.buffer.flush(), 0)
+
+        stats = self.buffer.stats()
+        self.assertEqual((stats['recorded'], stats['coalesced'], stats['flushed']), (2, 1, 1))
+
+    def test_user_flush_sets_location_timestamp(self):
+        user = make_user('walker')
+        buffer = get_location_buffer('users')
+        buffer.record(user.pk, 41.3, 69.2, timestamp=1_700_000_000)
+        buffer.flush()
+        user = User.objects.get(pk=user.pk)
+        self.assertEqual(user.current_latitude, Decimal('41.300000'))
+        self.assertEqual(int(user.location_updated_at.timestamp()), 1_700_000_000)
+
+    def test_invalid_coordinates_are_rejected(self):
+        for lat, lon in [(91, 0), (0, -181), ('north', 0)]:
+            with self.subTest(lat=lat, lon=lon), self.assertRaises(ValueError):
+                self.buffer.record(self.driver.pk, lat, lon)
+        self.assertEqual(self.buffer.pending_count(), 0)
+
+    def test_failed_flush_requeues_without_overwriting_newer_pings(self):
+        other = make_driver('other', 41.320, 69.290)
+        self.buffer.record(self.driver.pk, 41.3, 69.2)
+        self.buffer.record(other.pk, 41.5, 69.5)
+
+        def write_fails(records):
+            # A ping arriving mid-flush is newer than the batch being written
+            self.buffer.record(self.driver.pk, 41.35, 69.25)
+            raise RuntimeError('database down')
+
+        with mock.patch.object(self.buffer, '_write', side_effect=write_fails):
+            self.assertEqual(self.buffer.flush(), 0)
+
+        self.assertEqual(self.buffer.stats()['failed_flushes'], 1)
+        self.assertEqual(pending_location('drivers', self.driver.pk), (41.35, 69.25))
+        self.assertEqual(pending_location('drivers', other.pk), (41.5, 69.5))
+
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(
+            dict(Driver.objects.values_list('pk', 'current_latitude')),
+            {self.driver.pk: Decimal('41.350000'), other.pk: Decimal('41.500000')},
+        )
+
+    def test_full_buffer_drops_new_rows_but_keeps_updating_old_ones(self):
+        buffer = InMemoryLocationBuffer('drivers', max_pending=1)
+        buffer.record(1, 41.3, 69.2)
+        buffer.record(2, 41.3, 69.2)
+        buffer.record(1, 41.4, 69.3)
+        self.assertIsNone(buffer.pending(2))
+        self.assertEqual(buffer.pending(1)['latitude'], 41.4)
+        self.assertEqual(buffer.stats()['dropped'], 1)
+
+
+class StaleDriverSaveTests(FastTierTestCase):
+    """Status saves must not write back a position the buffer already replaced"""
+
+    def setUp(self):
+        super().setUp()
+        self.driver = make_driver('mover', 41.311, 69.279, status='on_trip')
+        passenger = make_user('rider')
+        self.ride = make_ride(passenger, status='accepted', driver=self.driver.user)
+
+    def ping(self, lat, lon):
+        driver = Driver.objects.get(pk=self.driver.pk)
+        driver.current_latitude, driver.current_longitude = Decimal(str(lat)), Decimal(str(lon))
+        buffer_driver_location(driver)
+
+    def assert_position(self, lat, lon):
+        driver = Driver.objects.get(pk=self.driver.pk)
+        self.assertEqual((driver.current_latitude, driver.current_longitude),
+                         (Decimal(f'{lat:.6f}'), Decimal(f'{lon:.6f}')))
+        position = get_driver_store().position(self.driver.user_id)
+        self.assertEqual((float(position['latitude']), float(position['longitude'])), (lat, lon))
+
+    def test_row_read_before_the_flush_keeps_the_flushed_position(self):
+        stale = Driver.objects.get(pk=self.driver.pk)
+        self.ping(41.35, 69.25)
+        get_location_buffer('drivers').flush()
+
+        stale.status = 'available'
+        stale.save(update_fields=['status', 'updated_at'])
+        self.assert_position(41.35, 69.25)
+        self.assertEqual(get_driver_store().position(self.driver.user_id)['status'], 'available')
+
+    def test_completing_a_ride_after_a_buffered_ping_keeps_the_newer_position(self):
+        self.ping(41.35, 69.25)
+        client = APIClient()
+        client.force_authenticate(self.driver.user)
+        response = client.patch(f'/api/rides/{self.ride.id}/status/', {'status': 'completed'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        get_location_buffer('drivers').flush()
+        self.assert_position(41.35, 69.25)
+        driver = Driver.objects.get(pk=self.driver.pk)
+        self.assertEqual((driver.status, driver.total_rides), ('available', 1))
@@ -0,0 +1,35 @@
+from unittest import mock
+
+from rides import location_store
+from rides.location_store import InMemoryLocationStore, get_driver_store
+
+from .helpers import FastTierTestCase, make_driver, reset_fast_tier
+
+
+class DriverStoreWarmupTests(FastTierTestCase):
+    def test_store_is_loaded_from_the_database(self):
+        driver = make_driver('loaded', 41.311, 69.279)
+        offline = make_driver('offline', 41.312, 69.280, status='offline')
+        reset_fast_tier()
+
+        store = get_driver_store()
+        self.assertEqual([member for member, _ in store.search(41.311, 69.279, 1)], [driver.user_id])
+        self.assertEqual(store.position(offline.user_id)['status'], 'offline')
+
+    def test_loaded_flag_is_checked_once_per_process(self):
+        with mock.patch.object(InMemoryLocationStore, 'mark_loaded', autospec=True,
+                               return_value=True) as mark_loaded, \
+                mock.patch.object(location_store, '_load_drivers') as load:
+            for _ in range(3):
+                get_driver_store()
+        self.assertEqual(mark_loaded.call_count, 1)
+        self.assertEqual(load.call_count, 1)
+
+    def test_worker_that_loses_the_flag_skips_loading(self):
+        with mock.patch.object(InMemoryLocationStore, 'mark_loaded', autospec=True,
+                               return_value=False) as mark_loaded, \
+                mock.patch.object(location_store, '_load_drivers') as load:
+            get_driver_store()
+            get_driver_store()
+        self.assertEqual(mark_loaded.call_count, 1)
+        load.assert_not_called()
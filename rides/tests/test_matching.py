@@ -0,0 +1,61 @@
+from itertools import permutations
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from rides.location_store import get_driver_store
+from rides.matching import UNREACHABLE, BatchMatcher, build_cost_matrix, solve_assignment
+
+from .helpers import FastTierTestCase, make_driver, make_ride, make_user
+
+
+class AssignmentTests(SimpleTestCase):
+    def test_minimises_total_pickup_distance(self):
+        rng = np.random.default_rng(5)
+        lats, lons = 41.311 + rng.uniform(-0.05, 0.05, (2, 6)), 69.279 + rng.uniform(-0.05, 0.05, (2, 6))
+        cost = build_cost_matrix(lats[0], lons[0], lats[1], lons[1], max_pickup_km=100)
+
+        pairs = solve_assignment(cost)
+        best = min(sum(cost[i, j] for i, j in enumerate(perm)) for perm in permutations(range(6)))
+        self.assertEqual(len(pairs), 6)
+        self.assertAlmostEqual(sum(cost[i, j] for i, j in pairs), best, places=6)
+
+    def test_unreachable_pairs_are_left_out(self):
+        cost = build_cost_matrix(
+            np.array([41.311, 41.311]), np.array([69.279, 69.279]),
+            np.array([41.312, 42.0]), np.array([69.280, 70.0]),
+            max_pickup_km=5,
+        )
+        self.assertEqual(cost[0, 1], UNREACHABLE)
+        self.assertEqual(len(solve_assignment(cost)), 1)
+        self.assertEqual(solve_assignment(np.empty((0, 3))), [])
+
+
+class BatchMatcherTests(FastTierTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ride = make_ride(make_user('rider'), pickup=(41.311, 69.279))
+        self.close = make_driver('close', 41.330, 69.300)
+        self.other = make_driver('other', 41.320, 69.290)
+        self.matcher = BatchMatcher(max_pickup_km=5, offer_timeout=30)
+
+    def run_round(self):
+        with mock.patch('rides.matching.send_many') as send_many:
+            sent = self.matcher.run_round()
+        return sent, [group for group, _ in send_many.call_args.args[0]] if sent else []
+
+    def test_uses_store_positions_over_stale_columns(self):
+        # A ping not yet flushed: the store has it, the drivers table does not
+        get_driver_store().update(self.close.user_id, 41.3115, 69.2795, status='available')
+        self.assertEqual(self.run_round(), (1, [f'user_{self.close.user_id}']))
+
+    def test_drivers_past_their_heartbeat_are_skipped(self):
+        get_driver_store().update(self.close.user_id, 41.3115, 69.2795, status='available')
+        with mock.patch('rides.availability.live_driver_ids',
+                        side_effect=lambda ids: set(ids) - {self.close.user_id}):
+            self.assertEqual(self.run_round(), (1, [f'user_{self.other.user_id}']))
+
+    def test_offered_ride_is_held_until_timeout(self):
+        self.assertEqual(self.run_round()[0], 1)
+        self.assertEqual(self.run_round()[0], 0)
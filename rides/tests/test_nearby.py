@@ -0,0 +1,74 @@
+from unittest import mock
+
+from rides.location_store import get_driver_store
+from rides.utils import (
+    calculate_distance, find_nearby_drivers, find_nearby_drivers_db, rank_drivers_by_eta,
+)
+
+from .helpers import FastTierTestCase, make_driver
+
+CENTER = (41.311, 69.279)
+
+
+class FindNearbyDriversTests(FastTierTestCase):
+    def setUp(self):
+        super().setUp()
+        self.near = make_driver('near', 41.312, 69.280)
+        self.middle = make_driver('middle', 41.320, 69.290)
+        self.far = make_driver('far', 41.400, 69.400)
+        self.busy = make_driver('busy', 41.3115, 69.2795, status='on_trip')
+        self.nowhere = make_driver('nowhere')
+
+    def ids(self, results):
+        return [item['driver'].pk for item in results]
+
+    def test_store_returns_available_drivers_closest_first(self):
+        results = find_nearby_drivers(*CENTER, radius_km=5)
+        self.assertEqual(self.ids(results), [self.near.pk, self.middle.pk])
+        for item in results:
+            driver = item['driver']
+            expected = calculate_distance(
+                *CENTER, float(driver.current_latitude), float(driver.current_longitude)
+            )
+            self.assertAlmostEqual(item['distance'], expected, places=2)
+
+    def test_limit_keeps_the_closest(self):
+        results = find_nearby_drivers(*CENTER, radius_km=50, limit=2)
+        self.assertEqual(self.ids(results), [self.near.pk, self.middle.pk])
+
+    def test_store_follows_status_changes(self):
+        self.near.status = 'offline'
+        self.near.save()
+        self.busy.status = 'available'
+        self.busy.save()
+        self.assertEqual(self.ids(find_nearby_drivers(*CENTER, radius_km=5)),
+                         [self.busy.pk, self.middle.pk])
+
+    def test_database_search_matches_store(self):
+        for radius, limit in [(1, None), (5, None), (50, None), (50, 1)]:
+            with self.subTest(radius=radius, limit=limit):
+                self.assertEqual(
+                    self.ids(find_nearby_drivers_db(*CENTER, radius_km=radius, limit=limit)),
+                    self.ids(find_nearby_drivers(*CENTER, radius_km=radius, limit=limit)),
+                )
+
+    def test_results_carry_the_store_position(self):
+        # A ping not yet flushed to the drivers table
+        get_driver_store().update(self.middle.user_id, 41.3111, 69.2791, status='available')
+        results = find_nearby_drivers(*CENTER, radius_km=5)
+        self.assertEqual(self.ids(results), [self.middle.pk, self.near.pk])
+        self.assertEqual((results[0]['latitude'], results[0]['longitude']), (41.3111, 69.2791))
+
+    def test_eta_ranking_routes_from_the_store_position(self):
+        get_driver_store().update(self.middle.user_id, 41.3111, 69.2791, status='available')
+        results = find_nearby_drivers(*CENTER, radius_km=5)
+
+        graph = mock.Mock()
+        graph.durations_to.return_value = [4.0, None]
+        with mock.patch('rides.roads.get_road_graph', return_value=graph):
+            ranked = rank_drivers_by_eta(results, *CENTER)
+
+        graph.durations_to.assert_called_once_with(
+            *CENTER, [(41.3111, 69.2791), (41.312, 69.28)]
+        )
+        self.assertEqual([item['eta'] for item in ranked], [4.0, None])
@@ -0,0 +1,193 @@
+import asyncio
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from rides.models import OutboxCursor, OutboxEvent, Ride
+from rides.outbox import CURSOR, OutboxRelay, get_outbox_relay, publish
+
+from .helpers import FastTierTestCase, make_driver, make_ride, make_user
+
+
+def add_event(event_id, age=0.0, group='user_1'):
+    event = OutboxEvent.objects.create(id=event_id, group=group, message={'type': 'ping', 'n': event_id})
+    OutboxEvent.objects.filter(id=event_id).update(
+        created_at=timezone.now() - timedelta(seconds=age)
+    )
+    return event
+
+
+class OutboxRelayTests(FastTierTestCase):
+    def setUp(self):
+        super().setUp()
+        self.relay = OutboxRelay(batch_size=10, gap_timeout=5)
+
+    def claimed_ids(self, relay=None):
+        claimed = (relay or self.relay)._claim()
+        return None if claimed is None else [event[0] for event in claimed[1]]
+
+    def relay_batch(self, relay=None):
+        return async_to_sync((relay or self.relay).relay_batch)()
+
+    def position(self):
+        return OutboxCursor.objects.get(name=CURSOR).position
+
+    def test_waits_at_a_young_gap(self):
+        for event_id in (1, 2, 4):
+            add_event(event_id)
+        self.assertEqual(self.claimed_ids(), [1, 2])
+
+        self.assertEqual(self.relay_batch(), 2)
+        self.assertEqual(self.position(), 2)
+        self.assertEqual(list(OutboxEvent.objects.values_list('id', flat=True)), [4])
+        self.assertEqual(self.relay_batch(), 0)
+
+    def test_skips_a_gap_once_the_next_event_is_old(self):
+        add_event(1)
+        add_event(3, age=6)
+        add_event(4)
+        self.assertEqual(self.claimed_ids(), [1, 3, 4])
+        self.assertEqual(self.relay.gaps_skipped, 1)
+
+    def test_gap_at_the_cursor_blocks_until_timeout(self):
+        add_event(2)
+        self.assertEqual(self.claimed_ids(), [])
+        OutboxEvent.objects.filter(id=2).update(created_at=timezone.now() - timedelta(seconds=6))
+        self.assertEqual(self.claimed_ids(), [2])
+
+    def test_only_the_lease_holder_relays(self):
+        add_event(1)
+        other = OutboxRelay(batch_size=10)
+        self.assertEqual(self.claimed_ids(), [1])
+        self.assertIsNone(self.claimed_ids(other))
+
+        OutboxCursor.objects.filter(name=CURSOR).update(
+            leased_until=timezone.now() - timedelta(seconds=1)
+        )
+        self.assertEqual(self.claimed_ids(other), [1])
+        self.assertIsNone(self.claimed_ids())
+
+    def test_lost_lease_does_not_move_the_mark(self):
+        add_event(1)
+        self.claimed_ids()
+        OutboxCursor.objects.filter(name=CURSOR).update(leased_by='someone-else')
+        self.assertFalse(self.relay._advance(1, [1]))
+        self.assertEqual(self.position(), 0)
+        self.assertTrue(OutboxEvent.objects.filter(id=1).exists())
+
+    def test_late_commit_under_the_mark_is_sent_before_deletion(self):
+        add_event(1, group='user_7')
+        add_event(3, age=6, group='user_7')
+        self.relay_batch()
+        self.assertEqual(self.position(), 3)
+        add_event(2, group='user_7')  # committed after its gap was skipped
+        add_event(4, group='user_7')
+
+        with mock.patch('rides.outbox.group_send_many') as send:
+            self.assertEqual(self.relay_batch(), 2)
+        self.assertEqual([message['n'] for _, message in send.call_args.args[0]], [2, 4])
+        self.assertEqual((self.relay.late, self.relay.relayed), (1, 4))
+        self.assertEqual(self.position(), 4)
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_row_committing_during_the_send_is_kept_for_the_next_pass(self):
+        add_event(1)
+        add_event(3, age=6)
+
+        async def late_commit(pairs):
+            await database_sync_to_async(add_event)(2)
+
+        with mock.patch('rides.outbox.group_send_many', side_effect=late_commit):
+            self.relay_batch()
+        self.assertEqual(list(OutboxEvent.objects.values_list('id', flat=True)), [2])
+
+        with mock.patch('rides.outbox.group_send_many') as send:
+            self.relay_batch()
+        self.assertEqual([message['n'] for _, message in send.call_args.args[0]], [2])
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_old_events_are_sent_unless_max_age_is_set(self):
+        add_event(1, age=3600)
+        with mock.patch('rides.outbox.group_send_many') as send:
+            self.relay_batch()
+        self.assertEqual(len(send.call_args.args[0]), 1)
+        self.assertEqual((self.relay.relayed, self.relay.dropped), (1, 0))
+
+        relay = OutboxRelay(batch_size=10, max_age=300)
+        OutboxCursor.objects.filter(name=CURSOR).update(leased_until=None)
+        add_event(2, age=3600)
+        add_event(3)
+        with mock.patch('rides.outbox.group_send_many') as send:
+            self.assertEqual(self.relay_batch(relay), 2)
+        self.assertEqual([message['n'] for _, message in send.call_args.args[0]], [3])
+        self.assertEqual(relay.stats()['dropped'], 1)
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_events_reach_the_channel_layer_in_order(self):
+        async def relay_and_receive():
+            layer = get_channel_layer()
+            channel = await layer.new_channel()
+            await layer.group_add('user_7', channel)
+            moved = await self.relay.relay_batch()
+            received = [await asyncio.wait_for(layer.receive(channel), 1) for _ in range(3)]
+            await layer.group_discard('user_7', channel)
+            return moved, received
+
+        for event_id in (1, 2, 3):
+            add_event(event_id, group='user_7')
+        moved, received = async_to_sync(relay_and_receive)()
+        self.assertEqual(moved, 3)
+        self.assertEqual([message['n'] for message in received], [1, 2, 3])
+        self.assertEqual((self.relay.relayed, self.relay.dropped), (3, 0))
+
+    def test_publish_wakes_the_relay_on_commit(self):
+        with mock.patch.object(get_outbox_relay(), 'wake') as wake, \
+                self.captureOnCommitCallbacks(execute=True):
+            publish([('user_1', {'type': 'ping'})])
+            wake.assert_not_called()
+        wake.assert_called_once()
+        self.assertEqual(OutboxEvent.objects.count(), 1)
+
+
+class RideAcceptTests(FastTierTestCase):
+    def setUp(self):
+        super().setUp()
+        self.passenger = make_user('rider')
+        self.ride = make_ride(self.passenger)
+        self.first = make_driver('first', 41.312, 69.280)
+        self.second = make_driver('second', 41.313, 69.281)
+
+    def accept(self, driver):
+        client = APIClient()
+        client.force_authenticate(driver.user)
+        return client.post(f'/api/rides/{self.ride.id}/accept/')
+
+    def test_second_driver_gets_a_conflict(self):
+        self.assertEqual(self.accept(self.first).status_code, 200)
+        events = OutboxEvent.objects.count()
+
+        response = self.accept(self.second)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(OutboxEvent.objects.count(), events)
+
+        self.ride.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual((self.ride.status, self.ride.driver_id), ('accepted', self.first.user_id))
+        self.assertEqual(self.second.status, 'available')
+
+    def test_accept_publishes_to_passenger_and_driver(self):
+        self.accept(self.first)
+        self.assertEqual(
+            sorted(OutboxEvent.objects.values_list('group', 'message__type')),
+            sorted([
+                (f'user_{self.passenger.id}', 'ride_accepted_notification'),
+                (f'user_{self.passenger.id}', 'ride_group_join'),
+                (f'user_{self.first.user_id}', 'ride_group_join'),
+            ]),
+        )
+        self.assertEqual(Ride.objects.get(id=self.ride.id).status, 'accepted')
@@ -0,0 +1,112 @@
+from decimal import Decimal
+
+from django.db import transaction
+
+from rides.models import SharedRide
+from rides.pooling import get_pooling_engine, pool_shared_request
+
+from .helpers import FastTierTestCase, make_ride, make_user
+
+PICKUP = (41.311, 69.279)
+DROPOFF = (41.340, 69.310)
+
+
+def request_data(pickup, dropoff):
+    return {
+        'pickup_latitude': Decimal(f'{pickup[0]:.6f}'),
+        'pickup_longitude': Decimal(f'{pickup[1]:.6f}'),
+        'dropoff_latitude': Decimal(f'{dropoff[0]:.6f}'),
+        'dropoff_longitude': Decimal(f'{dropoff[1]:.6f}'),
+    }
+
+
+class PoolingTests(FastTierTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = make_user('owner')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ride = make_ride(self.owner, pickup=PICKUP, dropoff=DROPOFF, ride_type='shared')
+
+    def pool(self, passenger, pickup=(41.312, 69.280), dropoff=(41.339, 69.309)):
+        with self.captureOnCommitCallbacks(execute=True):
+            return pool_shared_request(passenger, request_data(pickup, dropoff))
+
+    def candidates(self, pickup=PICKUP, dropoff=DROPOFF):
+        engine = get_pooling_engine()
+        return engine.index.candidates(pickup, dropoff, self.ride.requested_at.timestamp(),
+                                       engine.max_pickup_km, engine.max_dropoff_km)
+
+    def test_compatible_request_joins_the_open_ride(self):
+        shared = self.pool(make_user('joiner'))
+        self.assertEqual(shared.ride_id, self.ride.id)
+        self.assertGreater(shared.fare_share, 0)
+
+    def test_incompatible_requests_are_not_pooled(self):
+        # Opposite direction, and a trip that starts too far away
+        self.assertIsNone(self.pool(make_user('reverse'), pickup=DROPOFF, dropoff=PICKUP))
+        self.assertIsNone(self.pool(make_user('elsewhere'), pickup=(41.40, 69.40)))
+        self.assertFalse(SharedRide.objects.exists())
+
+    def test_passenger_is_never_pooled_into_their_own_ride(self):
+        self.assertIsNone(self.pool(self.owner))
+        joiner = make_user('joiner')
+        self.assertIsNotNone(self.pool(joiner))
+        self.assertIsNone(self.pool(joiner))
+        self.assertEqual(SharedRide.objects.count(), 1)
+
+    def test_ride_stops_taking_passengers_when_full(self):
+        engine = get_pooling_engine()
+        for i in range(engine.max_passengers - 1):
+            self.assertIsNotNone(self.pool(make_user(f'seat{i}')))
+        self.assertIsNone(self.pool(make_user('one-too-many')))
+
+    def test_rolled_back_seat_leaves_ride_and_index_untouched(self):
+        index = get_pooling_engine().index
+        entries = list(index._entries[self.ride.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.assertIsNotNone(pool_shared_request(
+                        make_user('rolled-back'), request_data((41.312, 69.280), (41.339, 69.309))
+                    ))
+                    raise RuntimeError('payment failed')
+            except RuntimeError:
+                pass
+
+        self.assertFalse(SharedRide.objects.exists())
+        self.assertEqual(index._entries[self.ride.id], entries)
+
+    def test_seat_stops_are_indexed_after_commit(self):
+        # Nothing near this pickup until a pooled passenger boards there
+        self.assertEqual(self.candidates(pickup=(41.290, 69.250)), set())
+        self.assertIsNotNone(
+            self.pool(make_user('joiner'), pickup=(41.300, 69.265), dropoff=(41.339, 69.309))
+        )
+        self.assertEqual(self.candidates(pickup=(41.290, 69.250)), {self.ride.id})
+
+    def test_closed_rides_leave_the_index(self):
+        self.assertEqual(self.candidates(), {self.ride.id})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ride.status = 'cancelled'
+            self.ride.save()
+        self.assertEqual(self.candidates(), set())
+
+    def test_stale_index_entry_is_rechecked_against_the_database(self):
+        # Closed without the signal, so only the database knows
+        type(self.ride).objects.filter(id=self.ride.id).update(status='completed')
+        self.assertEqual(self.candidates(), {self.ride.id})
+        self.assertIsNone(self.pool(make_user('joiner')))
+
+    def test_route_is_rebuilt_from_seats_in_the_database(self):
+        joiner = make_user('joiner')
+        self.pool(joiner)
+        engine = get_pooling_engine()
+        trip = engine.trip_for(self.ride, SharedRide.objects.filter(ride=self.ride))
+        self.assertEqual(set(trip.direct_km), {self.owner.id, joiner.id})
+        self.assertEqual([stop[1] for stop in trip.stops], ['pickup', 'pickup', 'dropoff', 'dropoff'])
+
+        self.ride.status = 'picked_up'
+        trip = engine.trip_for(self.ride, SharedRide.objects.filter(ride=self.ride))
+        self.assertEqual(trip.start, PICKUP)
+        self.assertNotIn((self.owner.id, 'pickup'), [stop[:2] for stop in trip.stops])
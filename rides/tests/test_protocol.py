@@ -0,0 +1,121 @@
+import json
+
+from django.test import SimpleTestCase
+
+from rides.protocol import (
+    CODECS, JSON_CODEC, SUBPROTOCOLS, compact, expand, negotiate, prepare, prepared_message,
+)
+
+NEW_RIDE = {
+    'type': 'new_ride',
+    'ride_id': 42,
+    'passenger_name': 'Aziza K',
+    'passenger_phone': '+998901234567',
+    'pickup_address': 'Amir Temur Square',
+    'dropoff_address': 'Airport',
+    'distance_to_pickup': 1.25,
+    'fare': 17500.0,
+    'estimated_distance': 4.17,
+    'ride_type': 'solo',
+}
+
+FRAMES = [
+    {'type': 'location_update', 'driver_id': 7, 'latitude': 41.311151, 'longitude': 69.279737},
+    NEW_RIDE,
+    {'type': 'status_update', 'ride_id': 42, 'status': 'picked_up'},
+    {'type': 'location_batch', 'drivers': [[7, 41.311151, 69.279737], [8, -33.5, 151.25]]},
+    {'type': 'ride_tracking_started', 'ride_id': 42},
+    {'type': 'status_update', 'ride_id': 42, 'status': 'unknown'},
+]
+
+
+class CodecTests(SimpleTestCase):
+    def round_trip(self, codec, frame):
+        data = codec.encode(frame)
+        if codec.binary:
+            return codec.decode(bytes_data=data)
+        return codec.decode(text_data=data)
+
+    def test_every_frame_survives_every_codec(self):
+        for codec in CODECS:
+            for frame in FRAMES:
+                with self.subTest(codec=codec.name, frame=frame['type']):
+                    self.assertEqual(self.round_trip(codec, frame), frame)
+
+    def test_binary_frames_are_smaller_than_json(self):
+        for codec in SUBPROTOCOLS.values():
+            for frame in FRAMES[:4]:
+                with self.subTest(codec=codec.name, frame=frame['type']):
+                    self.assertLess(len(codec.encode(frame)), len(json.dumps(frame).encode()))
+
+    def test_coordinates_travel_as_microdegrees(self):
+        self.assertEqual(
+            compact({'type': 'location_update', 'latitude': '41.3111514', 'longitude': 69.2797366}),
+            [1, 0, 41311151, 69279737],
+        )
+        self.assertEqual(
+            compact({'type': 'location_batch', 'drivers': [[1, 41.3, 69.2]]}),
+            [4, 1, 41300000, 69200000],
+        )
+
+    def test_new_ride_numbers_are_sent_as_numbers(self):
+        values = compact({**NEW_RIDE, 'fare': '17500.00', 'distance_to_pickup': None})
+        self.assertEqual(values[6:9], [None, 17500.0, 4.17])
+
+    def test_extra_fields_fall_back_to_a_map(self):
+        frame = {'type': 'location_update', 'latitude': 1.0, 'longitude': 2.0, 'heading': 90}
+        self.assertIs(compact(frame), frame)
+
+    def test_clients_can_send_maps_or_arrays(self):
+        codec = SUBPROTOCOLS['taxi.msgpack.v1']
+        self.assertEqual(expand([1, 0, 41311151, 69279737])['latitude'], 41.311151)
+        self.assertEqual(codec.decode(text_data='{"type": "ping"}'), {'type': 'ping'})
+        for payload in ([], 'text', [99, 1]):
+            with self.subTest(payload=payload), self.assertRaises(ValueError):
+                expand(payload)
+
+    def test_negotiate_picks_the_first_supported_subprotocol(self):
+        self.assertEqual(negotiate(['graphql-ws', 'taxi.cbor.v1', 'taxi.msgpack.v1'])[0], 'taxi.cbor.v1')
+        self.assertEqual(negotiate(['graphql-ws']), (None, JSON_CODEC))
+        self.assertEqual(negotiate(None), (None, JSON_CODEC))
+
+
+class PreparedFrameTests(SimpleTestCase):
+    def decode(self, codec, data):
+        return codec.decode(bytes_data=data) if codec.binary else codec.decode(text_data=data)
+
+    def test_filled_slot_decodes_like_a_full_encode(self):
+        frames = prepare(NEW_RIDE, slot='distance_to_pickup')
+        for codec in CODECS:
+            for value in (0.0, 1.25, 12345.678, 3, None, 10**12):
+                with self.subTest(codec=codec.name, value=value):
+                    data = codec.fill(frames[codec.name], value)
+                    self.assertEqual(self.decode(codec, data),
+                                     {**NEW_RIDE, 'distance_to_pickup': value})
+
+    def test_map_frames_move_the_slot_last(self):
+        frame = {'type': 'offer', 'ride_id': 1, **{f'extra_{i}': i for i in range(30)}}
+        for codec in CODECS:
+            for value in (2.5, 'near', None):
+                with self.subTest(codec=codec.name, value=value):
+                    parts = codec.prepare(frame, slot='distance')
+                    self.assertEqual(self.decode(codec, codec.fill(parts, value)),
+                                     {**frame, 'distance': value})
+
+    def test_json_slot_in_an_otherwise_empty_frame(self):
+        parts = JSON_CODEC.prepare({}, slot='value')
+        self.assertEqual(json.loads(JSON_CODEC.fill(parts, 1.5)), {'value': 1.5})
+
+    def test_frames_without_a_slot_are_sent_as_is(self):
+        frame = {'type': 'status_update', 'ride_id': 42, 'status': 'accepted'}
+        frames = prepare(frame)
+        for codec in CODECS:
+            with self.subTest(codec=codec.name):
+                self.assertEqual(codec.fill(frames[codec.name]), codec.encode(frame))
+        self.assertEqual(prepared_message(frames)['type'], 'prepared_frame')
+
+    def test_only_new_ride_arrays_can_have_a_slot(self):
+        for codec in SUBPROTOCOLS.values():
+            with self.subTest(codec=codec.name), self.assertRaises(ValueError):
+                codec.prepare({'type': 'status_update', 'ride_id': 1, 'status': 'accepted'},
+                              slot='ride_id')
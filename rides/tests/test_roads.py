@@ -0,0 +1,121 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from rides import roads
+from rides.roads import INDEX_FILES, MAX_SNAP_KM, RoadGraph, compile_graph
+from rides.utils import calculate_distance, estimate_route, rank_drivers_by_eta
+
+# A street running north from node 0 to node 2 (two-way, 30 km/h), a fast one-way bypass
+# 0 -> 3 -> 2 (60 km/h), and nodes 4-5 on a separate island of roads
+NODES = [
+    (41.300, 69.250),
+    (41.305, 69.250),
+    (41.310, 69.250),
+    (41.305, 69.256),
+    (41.350, 69.300),
+    (41.352, 69.300),
+]
+
+
+def edge(u, v, speed_kmh):
+    length_m = calculate_distance(*NODES[u], *NODES[v]) * 1000
+    return length_m, length_m / (speed_kmh / 3.6)
+
+
+def tiny_graph():
+    edges = {}
+    for u, v in [(0, 1), (1, 2), (4, 5)]:
+        edges[(u, v)] = edges[(v, u)] = edge(u, v, 30)
+    edges[(0, 3)] = edge(0, 3, 60)
+    edges[(3, 2)] = edge(3, 2, 60)
+    return compile_graph([lat for lat, _ in NODES], [lon for _, lon in NODES], edges)
+
+
+class RoadGraphTests(SimpleTestCase):
+    def setUp(self):
+        self.graph = tiny_graph()
+
+    def test_points_snap_to_the_closest_node(self):
+        self.assertEqual(self.graph.nearest_node(41.3049, 69.2502)[0], 1)
+        self.assertEqual(self.graph.nearest_node(41.3051, 69.2555)[0], 3)
+        node, distance = self.graph.nearest_node(41.400, 69.400)
+        self.assertIsNone(node)
+        self.assertGreater(distance, MAX_SNAP_KM)
+
+    def test_fastest_route_takes_the_bypass(self):
+        distance_km, duration_min = self.graph.route(*NODES[0], *NODES[2])
+        bypass = [edge(0, 3, 60), edge(3, 2, 60)]
+        self.assertAlmostEqual(distance_km, sum(length for length, _ in bypass) / 1000, places=2)
+        self.assertAlmostEqual(duration_min, sum(seconds for _, seconds in bypass) / 60, places=1)
+
+    def test_one_way_streets_are_not_driven_backwards(self):
+        distance_km, duration_min = self.graph.route(*NODES[2], *NODES[0])
+        street = [edge(2, 1, 30), edge(1, 0, 30)]
+        self.assertAlmostEqual(distance_km, sum(length for length, _ in street) / 1000, places=2)
+        self.assertAlmostEqual(duration_min, sum(seconds for _, seconds in street) / 60, places=1)
+
+    def test_disconnected_points_have_no_route(self):
+        self.assertIsNone(self.graph.route(*NODES[0], *NODES[4]))
+        self.assertEqual(self.graph.route(*NODES[4], *NODES[4]), (0.0, 0.0))
+
+    def test_durations_to_one_destination(self):
+        etas = self.graph.durations_to(*NODES[2], [NODES[0], NODES[1], NODES[5], (41.4, 69.4)])
+        self.assertEqual(etas[:2], [
+            round((edge(0, 3, 60)[1] + edge(3, 2, 60)[1]) / 60, 1),
+            round(edge(1, 2, 30)[1] / 60, 1),
+        ])
+        self.assertEqual(etas[2:], [None, None])
+
+    def test_saved_graph_is_mapped_with_its_index(self):
+        with tempfile.TemporaryDirectory() as path:
+            self.graph.save(path)
+            for name in INDEX_FILES:
+                self.assertTrue(os.path.exists(os.path.join(path, f'{name}.npy')), name)
+
+            with mock.patch.object(roads, 'build_index') as build:
+                loaded = RoadGraph.load(path)
+            build.assert_not_called()
+            self.assertEqual(loaded.route(*NODES[0], *NODES[2]), self.graph.route(*NODES[0], *NODES[2]))
+
+            # Graphs compiled before the index was stored still load
+            os.remove(os.path.join(path, 'snap_cells.npy'))
+            self.assertEqual(RoadGraph.load(path).nearest_node(*NODES[3])[0], 3)
+
+
+class RoadRoutingFallbackTests(SimpleTestCase):
+    def setUp(self):
+        self.path = self.enterContext(tempfile.TemporaryDirectory())
+        tiny_graph().save(self.path)
+        self.enterContext(override_settings(ROAD_GRAPH_PATH=self.path))
+        roads._graph, roads._graph_loaded = None, False
+        self.addCleanup(setattr, roads, '_graph_loaded', False)
+        self.addCleanup(setattr, roads, '_graph', None)
+
+    def straight_line(self, a, b):
+        distance = calculate_distance(*a, *b)
+        return distance, round(distance / 30 * 60, 1)
+
+    def test_estimates_follow_the_roads(self):
+        self.assertEqual(estimate_route(*NODES[0], *NODES[2]), tiny_graph().route(*NODES[0], *NODES[2]))
+
+    def test_unroutable_trips_fall_back_to_the_straight_line(self):
+        self.assertEqual(estimate_route(*NODES[0], *NODES[4]), self.straight_line(NODES[0], NODES[4]))
+        off_road = (41.300, 69.400)
+        self.assertEqual(estimate_route(*off_road, *NODES[2]), self.straight_line(off_road, NODES[2]))
+
+    def test_routing_errors_fall_back_to_the_straight_line(self):
+        with mock.patch.object(RoadGraph, 'route', side_effect=RuntimeError('corrupt graph')):
+            self.assertEqual(estimate_route(*NODES[0], *NODES[2]), self.straight_line(NODES[0], NODES[2]))
+
+    def test_drivers_are_ranked_by_road_eta(self):
+        nearby = [
+            {'driver': 'island', 'latitude': NODES[5][0], 'longitude': NODES[5][1]},
+            {'driver': 'street', 'latitude': NODES[0][0], 'longitude': NODES[0][1]},
+            {'driver': 'next door', 'latitude': NODES[1][0], 'longitude': NODES[1][1]},
+        ]
+        ranked = rank_drivers_by_eta(nearby, *NODES[2])
+        self.assertEqual([item['driver'] for item in ranked], ['next door', 'street', 'island'])
+        self.assertIsNone(ranked[-1]['eta'])
@@ -0,0 +1,77 @@
+import random
+
+from django.test import SimpleTestCase
+
+from rides.spatial import GridIndex
+from rides.utils import calculate_distance
+
+CENTER = (41.311, 69.279)
+
+
+def scatter(count, span=0.1, seed=7):
+    """Random points around the city center, keyed 1..count"""
+    rng = random.Random(seed)
+    return {
+        member_id: (CENTER[0] + rng.uniform(-span, span), CENTER[1] + rng.uniform(-span, span))
+        for member_id in range(1, count + 1)
+    }
+
+
+class GridIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.points = scatter(500)
+        self.index = GridIndex(cell_size_km=1.0)
+        for member_id, (lat, lon) in self.points.items():
+            self.index.upsert(member_id, lat, lon)
+
+    def brute_force(self, lat, lon, radius_km):
+        found = [
+            (member_id, calculate_distance(lat, lon, *point))
+            for member_id, point in self.points.items()
+        ]
+        return sorted((item for item in found if item[1] <= radius_km), key=lambda item: item[1])
+
+    def test_search_matches_a_full_scan(self):
+        for radius_km in (0.5, 2, 5):
+            found = self.index.search(*CENTER, radius_km)
+            expected = self.brute_force(*CENTER, radius_km)
+            self.assertEqual({member for member, _ in found}, {member for member, _ in expected})
+            self.assertEqual([d for _, d in found], sorted(d for _, d in found))
+
+    def test_search_finds_points_across_cell_borders(self):
+        index = GridIndex(cell_size_km=1.0)
+        lat, lon = CENTER
+        # A few metres apart but in different cells
+        edge = (int(lat / index.cell_deg) + 1) * index.cell_deg
+        index.upsert(1, edge - 0.00001, lon)
+        index.upsert(2, edge + 0.00001, lon)
+        self.assertNotEqual(index.cell_for(edge - 0.00001, lon), index.cell_for(edge + 0.00001, lon))
+        self.assertEqual({member for member, _ in index.search(edge, lon, 0.1)}, {1, 2})
+
+    def test_upsert_moves_and_remove_drops(self):
+        self.index.upsert(1, 10.0, 10.0)
+        self.assertEqual(self.index.search(10.0, 10.0, 1), [(1, 0.0)])
+        self.assertNotIn(1, {member for member, _ in self.index.search(*self.points[1], 0.01)})
+
+        self.index.remove(1)
+        self.index.remove(1)  # no-op when missing
+        self.assertNotIn(1, self.index)
+        self.assertEqual(self.index.search(10.0, 10.0, 1), [])
+        self.assertEqual(len(self.index), len(self.points) - 1)
+
+    def test_nearest_is_the_closest_k(self):
+        for k in (1, 5, 20):
+            found = self.index.nearest(*CENTER, k, 10)
+            expected = self.brute_force(*CENTER, 10)[:k]
+            self.assertEqual(len(found), k)
+            # Ties may come out in either order; the distances must agree
+            self.assertEqual([d for _, d in found], [d for _, d in expected])
+
+    def test_nearest_stops_at_the_max_radius(self):
+        found = self.index.nearest(*CENTER, 1000, 1.5)
+        expected = self.brute_force(*CENTER, 1.5)
+        self.assertEqual(len(found), len(expected))
+        self.assertTrue(all(distance <= 1.5 for _, distance in found))
+
+    def test_nearest_in_an_empty_area(self):
+        self.assertEqual(self.index.nearest(0.0, 0.0, 3, 5), [])
@@ -0,0 +1,105 @@
+from unittest import skipUnless
+
+from django.test import SimpleTestCase
+
+from rides import surge
+from rides.surge import InMemorySurgeEngine, RedisSurgeEngine
+
+from .helpers import FastTierTestCase, make_driver
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+POINT = (41.311, 69.279)
+NEIGHBOUR = (41.331, 69.299)  # a couple of cells away
+T0 = 1_700_000_010  # not on a bucket boundary
+
+
+class SurgeWindowTests(SimpleTestCase):
+    def setUp(self):
+        self.engine = InMemorySurgeEngine(window_seconds=300, bucket_seconds=30,
+                                          sensitivity=0.5, max_multiplier=2.5, min_requests=3)
+
+    def test_requests_leave_the_window_bucket_by_bucket(self):
+        for offset in (0, 10, 40):
+            self.engine.record_request(*POINT, now=T0 + offset)
+        self.engine.record_request(*NEIGHBOUR, now=T0)
+
+        self.assertEqual(self.engine.counts(*POINT, now=T0 + 40), (3, 0))
+        # The first bucket (T0, T0 + 10) ages out together, the later one stays
+        self.assertEqual(self.engine.counts(*POINT, now=T0 + 320), (1, 0))
+        self.assertEqual(self.engine.counts(*POINT, now=T0 + 400), (0, 0))
+        self.assertEqual(self.engine.counts(*NEIGHBOUR, now=T0 + 40), (1, 0))
+
+    def test_drivers_count_once_and_expire(self):
+        self.engine.record_driver(1, *POINT, available=True, now=T0)
+        self.engine.record_driver(2, *POINT, available=True, now=T0 + 50)
+        self.engine.record_driver(1, *POINT, available=True, now=T0 + 100)
+        self.assertEqual(self.engine.counts(*POINT, now=T0 + 100)[1], 2)
+
+        # Driver 2 was last seen at T0 + 50, driver 1 at T0 + 100
+        self.assertEqual(self.engine.counts(*POINT, now=T0 + 360)[1], 1)
+        self.assertEqual(self.engine.counts(*POINT, now=T0 + 401)[1], 0)
+
+    def test_drivers_move_between_cells_and_go_offline(self):
+        self.engine.record_driver(1, *POINT, available=True, now=T0)
+        self.engine.record_driver(1, *NEIGHBOUR, available=True, now=T0 + 1)
+        self.assertEqual(self.engine.counts(*POINT, now=T0 + 1)[1], 0)
+        self.assertEqual(self.engine.counts(*NEIGHBOUR, now=T0 + 1)[1], 1)
+
+        self.engine.record_driver(1, *NEIGHBOUR, available=False, now=T0 + 2)
+        self.assertEqual(self.engine.counts(*NEIGHBOUR, now=T0 + 2)[1], 0)
+
+    def test_multiplier_follows_demand_over_supply(self):
+        engine = self.engine
+        self.assertEqual(engine.multiplier_for(2, 0), 1.0)   # below min_requests
+        self.assertEqual(engine.multiplier_for(4, 4), 1.0)
+        self.assertEqual(engine.multiplier_for(6, 4), 1.2)   # 1 + 0.5 * 0.5, in 0.1 steps
+        self.assertEqual(engine.multiplier_for(6, 0), 2.5)   # capped
+
+        for _ in range(6):
+            engine.record_request(*POINT, now=T0)
+        for driver_id in range(3):
+            engine.record_driver(driver_id, *POINT, available=True, now=T0)
+        self.assertEqual(engine.multiplier(*POINT, now=T0 + 1), 1.5)
+
+
+@skipUnless(fakeredis, 'fakeredis is required')
+class RedisSurgeSupplyTests(FastTierTestCase):
+    def setUp(self):
+        super().setUp()
+        self.engine = RedisSurgeEngine('redis://redis:6379/0', window_seconds=300)
+        self.engine.redis = fakeredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+        surge._engine = self.engine
+
+    def driver_cell(self, driver_id):
+        return self.engine.redis.get(self.engine._driver_cell_key(driver_id))
+
+    def test_drivers_move_between_cells_and_go_offline(self):
+        self.engine.record_driver(1, *POINT, available=True, now=T0)
+        self.engine.record_driver(1, *NEIGHBOUR, available=True, now=T0 + 1)
+        self.assertEqual(self.engine.counts(*POINT, now=T0 + 1)[1], 0)
+        self.assertEqual(self.engine.counts(*NEIGHBOUR, now=T0 + 1)[1], 1)
+        self.assertEqual(self.driver_cell(1), self.engine.cell(*NEIGHBOUR))
+
+        self.engine.record_driver(1, *NEIGHBOUR, available=False, now=T0 + 2)
+        self.assertEqual(self.engine.counts(*NEIGHBOUR, now=T0 + 2)[1], 0)
+        self.assertIsNone(self.driver_cell(1))
+
+    def test_silent_drivers_expire_with_the_window(self):
+        self.engine.record_driver(1, *POINT, available=True, now=T0)
+        key = self.engine._driver_cell_key(1)
+        self.assertEqual(self.engine.redis.ttl(key), 300)
+        self.assertEqual(self.engine.counts(*POINT, now=T0 + 301)[1], 0)
+
+    def test_leaving_available_drops_the_driver_cell(self):
+        driver = make_driver('parker', *POINT)
+        self.assertEqual(self.driver_cell(driver.user_id), self.engine.cell(*POINT))
+
+        driver.status = 'offline'
+        driver.save(update_fields=['status', 'updated_at'])
+        self.assertIsNone(self.driver_cell(driver.user_id))
+        self.assertEqual(self.engine.counts(*POINT)[1], 0)
+        self.assertEqual(self.engine.redis.keys('surge:driver_cell:*'), [])
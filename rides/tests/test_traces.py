@@ -0,0 +1,86 @@
+import random
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from rides import traces
+from rides.models import RideTraceChunk
+from rides.traces import (
+    InMemoryTraceRecorder, decode_points, encode_points, get_trace_recorder, to_point,
+    trace_distance,
+)
+from rides.utils import calculate_distance
+
+from .helpers import FastTierTestCase, make_driver, make_ride, make_user, reset_fast_tier
+
+
+class VarintEncodingTests(SimpleTestCase):
+    def test_round_trip(self):
+        rng = random.Random(3)
+        points = [to_point(41.3 + rng.uniform(-0.05, 0.05), 69.2 + rng.uniform(-0.05, 0.05),
+                           1_700_000_000 + i * rng.randint(1, 10))
+                  for i in range(500)]
+        self.assertEqual(decode_points(encode_points(points)), points)
+
+    def test_round_trip_of_extremes(self):
+        points = [
+            (0, 0, 0),
+            (-90_000_000, -180_000_000, 0),
+            (90_000_000, 180_000_000, 2**40),
+            (-1, 1, 2**40 - 1),
+            (-90_000_000, 180_000_000, 0),
+        ]
+        self.assertEqual(decode_points(encode_points(points)), points)
+        self.assertEqual(decode_points(encode_points([])), [])
+
+    def test_consecutive_pings_are_small(self):
+        first = to_point(41.311, 69.279, 1_700_000_000)
+        second = to_point(41.3112, 69.2787, 1_700_000_004)
+        blob = encode_points([first, second])
+        self.assertLessEqual(len(blob) - len(encode_points([first])), 6)
+
+    def test_trace_distance_sums_legs(self):
+        coords = [(41.311, 69.279), (41.315, 69.285), (41.320, 69.280)]
+        points = [to_point(lat, lon, i) for i, (lat, lon) in enumerate(coords)]
+        expected = sum(calculate_distance(*a, *b) for a, b in zip(coords, coords[1:]))
+        self.assertAlmostEqual(trace_distance(points), expected, places=2)
+        self.assertEqual(trace_distance(points[:1]), 0.0)
+
+
+class TraceRecorderTests(FastTierTestCase):
+    def setUp(self):
+        super().setUp()
+        self.driver = make_driver('tracer', 41.311, 69.279)
+        self.ride = make_ride(make_user('rider'), driver=self.driver.user, status='accepted')
+
+    def test_pings_are_written_in_chunks(self):
+        recorder = get_trace_recorder()
+        recorder.batch_size = 4
+        for i in range(10):
+            recorder.record(self.driver.user_id, 41.311 + i * 0.001, 69.279, 1_700_000_000 + i)
+
+        self.assertEqual(
+            list(RideTraceChunk.objects.filter(ride=self.ride).values_list('point_count', flat=True)),
+            [4, 4],
+        )
+        self.assertEqual(len(recorder.pending(self.ride.id)), 2)
+        self.assertEqual([point[2] for point in recorder.points(self.ride.id)],
+                         [1_700_000_000 + i for i in range(10)])
+
+        self.ride.status = 'completed'
+        self.ride.save()
+        self.assertEqual(recorder.pending(self.ride.id), [])
+        self.assertIsNone(recorder.active_ride(self.driver.user_id))
+        self.assertEqual(len(recorder.points(self.ride.id)), 10)
+
+    def test_rides_in_progress_are_loaded_once_per_process(self):
+        reset_fast_tier()
+        with mock.patch.object(InMemoryTraceRecorder, 'mark_loaded', autospec=True,
+                               return_value=True) as mark_loaded, \
+                mock.patch.object(traces, '_load_active_rides',
+                                  wraps=traces._load_active_rides) as load:
+            for _ in range(3):
+                recorder = get_trace_recorder()
+        self.assertEqual(mark_loaded.call_count, 1)
+        self.assertEqual(load.call_count, 1)
+        self.assertEqual(recorder.active_ride(self.driver.user_id), self.ride.id)
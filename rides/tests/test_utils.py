@@ -0,0 +1,55 @@
+import random
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from rides.utils import (
+    bounding_box, calculate_distance, calculate_distances, calculate_fare, calculate_fares,
+    distance_matrix, haversine_array,
+)
+
+
+def random_points(count, seed=11):
+    rng = random.Random(seed)
+    return [(rng.uniform(-80, 80), rng.uniform(-179, 179)) for _ in range(count)]
+
+
+class HaversineTests(SimpleTestCase):
+    def test_known_distances(self):
+        self.assertEqual(calculate_distance(41.311, 69.279, 41.311, 69.279), 0)
+        # One degree of latitude along a meridian
+        self.assertAlmostEqual(calculate_distance(0, 0, 1, 0), 111.19, places=2)
+        # Tashkent to Samarkand
+        self.assertAlmostEqual(calculate_distance(41.2995, 69.2401, 39.6542, 66.9597), 266, delta=2)
+
+    def test_vectorized_matches_scalar(self):
+        origin = (41.311, 69.279)
+        points = random_points(200)
+        lats, lons = [p[0] for p in points], [p[1] for p in points]
+        expected = [calculate_distance(*origin, lat, lon) for lat, lon in points]
+
+        np.testing.assert_allclose(calculate_distances(*origin, lats, lons), expected, atol=0.011)
+        np.testing.assert_allclose(haversine_array(*origin, lats, lons), expected, atol=0.006)
+
+    def test_distance_matrix_matches_pairs(self):
+        rows, cols = random_points(7, seed=1), random_points(5, seed=2)
+        matrix = distance_matrix([p[0] for p in rows], [p[1] for p in rows],
+                                 [p[0] for p in cols], [p[1] for p in cols])
+        self.assertEqual(matrix.shape, (7, 5))
+        for i, a in enumerate(rows):
+            for j, b in enumerate(cols):
+                self.assertAlmostEqual(matrix[i, j], calculate_distance(*a, *b), delta=0.011)
+
+    def test_bounding_box_contains_the_circle(self):
+        for lat, lon in [(41.311, 69.279), (0, 0), (-60, 10)]:
+            min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, 5)
+            for edge in [(min_lat, lon), (max_lat, lon), (lat, min_lon), (lat, max_lon)]:
+                self.assertAlmostEqual(calculate_distance(lat, lon, *edge), 5, delta=0.05)
+
+    def test_vectorized_fares_match_scalar(self):
+        distances = [0, 1.5, 12.34]
+        for ride_type in ('solo', 'shared'):
+            np.testing.assert_allclose(
+                calculate_fares(distances, ride_type, surge=1.3),
+                [calculate_fare(d, ride_type, surge=1.3) for d in distances],
+            )
@@ -0,0 +1,94 @@
+from unittest import mock
+
+from rest_framework.test import APIClient
+
+from rides.models import Ride
+from rides.utils import calculate_distance, calculate_fare
+
+from .helpers import FastTierTestCase, make_driver, make_ride, make_user
+
+
+class NearbyRideRequestsViewTests(FastTierTestCase):
+    url = '/api/rides/nearby-requests/'
+
+    def setUp(self):
+        super().setUp()
+        self.driver = make_driver('looker', 41.311, 69.279)
+        self.client = APIClient()
+        self.client.force_authenticate(self.driver.user)
+        passenger = make_user('rider')
+        self.rides = [
+            make_ride(passenger, pickup=(41.311 + 0.001 * i, 69.279)) for i in range(1, 5)
+        ]
+
+    def ride_ids(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [item['ride']['id'] for item in response.data]
+
+    def test_closest_pending_rides_first(self):
+        self.assertEqual(self.ride_ids(limit=2), [ride.id for ride in self.rides[:2]])
+
+    def test_limit_applies_after_dropping_rides_already_taken(self):
+        # update() skips the signal, so the store still lists the two closest rides
+        Ride.objects.filter(id__in=[self.rides[0].id, self.rides[1].id]).update(status='accepted')
+        self.assertEqual(self.ride_ids(limit=2), [ride.id for ride in self.rides[2:]])
+
+
+class RideBatchEstimateViewTests(FastTierTestCase):
+    url = '/api/rides/estimate/batch/'
+    pickup = (41.2995, 69.2401)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('planner'))
+
+    def estimate(self, destinations, **data):
+        return self.client.post(self.url, {
+            'pickup_latitude': self.pickup[0],
+            'pickup_longitude': self.pickup[1],
+            'destinations': destinations,
+            **data,
+        }, format='json')
+
+    def test_invalid_destinations_fail_alone(self):
+        response = self.estimate([
+            {'latitude': 41.311151, 'longitude': 69.279737, 'label': 'Square'},
+            {'latitude': 'north', 'longitude': 69.28},
+            {'latitude': 41.2579},
+            {'latitude': 41.2579, 'longitude': 69.2811, 'label': 'Airport'},
+        ], ride_types=['solo'])
+        self.assertEqual(response.status_code, 200)
+        quotes = response.data['quotes']
+        self.assertEqual([quote['index'] for quote in quotes], [0, 1, 2, 3])
+        self.assertEqual([quote.get('label') for quote in quotes], ['Square', None, None, 'Airport'])
+        self.assertIn('latitude', quotes[1]['error'])
+        self.assertIn('longitude', quotes[2]['error'])
+        self.assertNotIn('fare', quotes[1])
+
+    def test_oversize_batch_is_rejected(self):
+        destination = {'latitude': 41.311151, 'longitude': 69.279737}
+        self.assertEqual(self.estimate([destination] * 20).status_code, 200)
+        response = self.estimate([destination] * 21)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('destinations', response.data)
+        self.assertEqual(self.estimate([]).status_code, 400)
+
+    def test_fares_match_single_trip_pricing_with_surge(self):
+        destinations = [(41.311151, 69.279737), (41.2579, 69.2811), (41.3502, 69.2013)]
+        with mock.patch('rides.surge.surge_multiplier', return_value=1.7):
+            response = self.estimate(
+                [{'latitude': lat, 'longitude': lon} for lat, lon in destinations]
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['surge_multiplier'], 1.7)
+
+        quotes = response.data['quotes']
+        self.assertEqual(len(quotes), len(destinations) * 2)
+        for quote in quotes:
+            distance = calculate_distance(*self.pickup, *destinations[quote['index']])
+            self.assertEqual(quote['distance'], f"{distance:.2f}")
+            self.assertEqual(
+                quote['fare'], f"{calculate_fare(distance, quote['ride_type'], 1.7):.2f}"
+            )
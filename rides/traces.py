@@ -0,0 +1,337 @@
+import time
+from datetime import datetime, timezone as dt_timezone
+from threading import Lock
+
+import numpy as np
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .utils import haversine_array
+
+# Statuses during which the driver's pings are recorded
+TRACED_STATUSES = ('accepted', 'picked_up')
+
+MICRODEGREES = 1_000_000
+
+
+# Trace format: each point is (lat, lon) in integer microdegrees plus a
+# whole-second epoch timestamp. The first point of a chunk is stored as is,
+# every later one as the difference to its predecessor; values are zigzag
+# encoded varints, so a typical ping costs 4-6 bytes instead of 24.
+
+def _write_varint(out, value):
+    value = (value << 1) ^ (value >> 63)  # zigzag: small negatives stay small
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def encode_points(points):
+    """Encode [(lat_e6, lon_e6, ts)] integer points into a compact blob"""
+    out = bytearray()
+    previous = (0, 0, 0)
+    for point in points:
+        for value, before in zip(point, previous):
+            _write_varint(out, value - before)
+        previous = point
+    return bytes(out)
+
+
+def decode_points(data):
+    """Inverse of encode_points"""
+    values = []
+    value = shift = 0
+    for byte in bytes(data):
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        values.append((value >> 1) ^ -(value & 1))
+        value = shift = 0
+
+    points = []
+    lat = lon = ts = 0
+    for i in range(0, len(values) - 2, 3):
+        lat += values[i]
+        lon += values[i + 1]
+        ts += values[i + 2]
+        points.append((lat, lon, ts))
+    return points
+
+
+def to_point(lat, lon, timestamp=None):
+    timestamp = time.time() if timestamp is None else timestamp
+    return (
+        round(float(lat) * MICRODEGREES),
+        round(float(lon) * MICRODEGREES),
+        int(timestamp),
+    )
+
+
+def encode_polyline(points, precision=5):
+    """Google encoded polyline of [(lat_e6, lon_e6, ...)] points"""
+    factor = 10 ** precision
+    out = []
+    previous = (0, 0)
+    for point in points:
+        current = (
+            round(point[0] / MICRODEGREES * factor),
+            round(point[1] / MICRODEGREES * factor),
+        )
+        for value, before in zip(current, previous):
+            delta = value - before
+            delta = ~(delta << 1) if delta < 0 else delta << 1
+            while delta >= 0x20:
+                out.append(chr((0x20 | (delta & 0x1F)) + 63))
+                delta >>= 5
+            out.append(chr(delta + 63))
+        previous = current
+    return ''.join(out)
+
+
+def trace_distance(points):
+    """Length in km of the path through the points"""
+    if len(points) < 2:
+        return 0.0
+    coords = np.asarray(points, dtype=np.float64)[:, :2] / MICRODEGREES
+    return float(haversine_array(
+        coords[:-1, 0], coords[:-1, 1], coords[1:, 0], coords[1:, 1]
+    ).sum())
+
+
+class BaseTraceRecorder:
+    """Collects driver pings for rides in progress and appends them in chunks.
+
+    Points are buffered per ride and written as one RideTraceChunk every
+    batch_size points, and when the ride ends.
+    """
+
+    def __init__(self, batch_size=30):
+        self.batch_size = batch_size
+
+    def start(self, ride_id, driver_id):
+        raise NotImplementedError
+
+    def stop(self, ride_id, driver_id):
+        """Flush what is left of a trace and stop recording the driver"""
+        self.flush(ride_id)
+        self._unassign(driver_id, ride_id)
+
+    def record(self, driver_id, lat, lon, timestamp=None):
+        """Buffer a ping if the driver has a ride in progress"""
+        ride_id = self.active_ride(driver_id)
+        if ride_id is None:
+            return
+        if self._append(ride_id, to_point(lat, lon, timestamp)) >= self.batch_size:
+            self.flush(ride_id)
+
+    def flush(self, ride_id):
+        from .models import RideTraceChunk
+
+        points = self._take(ride_id)
+        if not points:
+            return
+        points.sort(key=lambda point: point[2])
+        RideTraceChunk.objects.create(
+            ride_id=ride_id,
+            started_at=datetime.fromtimestamp(points[0][2], tz=dt_timezone.utc),
+            ended_at=datetime.fromtimestamp(points[-1][2], tz=dt_timezone.utc),
+            point_count=len(points),
+            points=encode_points(points),
+        )
+
+    def points(self, ride_id):
+        """Every recorded point of a ride, flushed or not, in time order"""
+        from .models import RideTraceChunk
+
+        points = []
+        for chunk in RideTraceChunk.objects.filter(ride_id=ride_id).only('points'):
+            points.extend(decode_points(chunk.points))
+        points.extend(self.pending(ride_id))
+        points.sort(key=lambda point: point[2])
+        return points
+
+    def active_ride(self, driver_id):
+        raise NotImplementedError
+
+    def pending(self, ride_id):
+        raise NotImplementedError
+
+    def mark_loaded(self):
+        """Return True only for the first caller, so warm-up runs once"""
+        raise NotImplementedError
+
+    def _unassign(self, driver_id, ride_id):
+        raise NotImplementedError
+
+    def _append(self, ride_id, point):
+        """Buffer a point and return how many are buffered for the ride"""
+        raise NotImplementedError
+
+    def _take(self, ride_id):
+        """Remove and return the ride's buffered points"""
+        raise NotImplementedError
+
+
+class InMemoryTraceRecorder(BaseTraceRecorder):
+    """Per-process recorder (tests, single-node)"""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self._active = {}  # driver_id -> ride_id
+        self._points = {}  # ride_id -> [point]
+        self._loaded = False
+        self._lock = Lock()
+
+    def start(self, ride_id, driver_id):
+        with self._lock:
+            self._active[driver_id] = ride_id
+
+    def active_ride(self, driver_id):
+        return self._active.get(driver_id)
+
+    def pending(self, ride_id):
+        with self._lock:
+            return list(self._points.get(ride_id, ()))
+
+    def mark_loaded(self):
+        with self._lock:
+            if self._loaded:
+                return False
+            self._loaded = True
+            return True
+
+    def _unassign(self, driver_id, ride_id):
+        with self._lock:
+            if self._active.get(driver_id) == ride_id:
+                del self._active[driver_id]
+
+    def _append(self, ride_id, point):
+        with self._lock:
+            points = self._points.setdefault(ride_id, [])
+            points.append(point)
+            return len(points)
+
+    def _take(self, ride_id):
+        with self._lock:
+            return self._points.pop(ride_id, [])
+
+
+class RedisTraceRecorder(BaseTraceRecorder):
+    """Recorder shared by all workers; pings buffer in a Redis list per ride"""
+
+    def __init__(self, url, loaded_ttl=3600, **options):
+        super().__init__(**options)
+        import redis
+
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.loaded_ttl = loaded_ttl
+        self.active_key = 'ride_traces:active'
+        self.loaded_key = 'ride_traces:loaded'
+
+    def _points_key(self, ride_id):
+        return f'ride_traces:points:{ride_id}'
+
+    def start(self, ride_id, driver_id):
+        self.redis.hset(self.active_key, driver_id, ride_id)
+
+    def active_ride(self, driver_id):
+        ride_id = self.redis.hget(self.active_key, driver_id)
+        return int(ride_id) if ride_id else None
+
+    def pending(self, ride_id):
+        return self._parse(self.redis.lrange(self._points_key(ride_id), 0, -1))
+
+    def mark_loaded(self):
+        return bool(self.redis.set(self.loaded_key, 1, nx=True, ex=self.loaded_ttl))
+
+    def _unassign(self, driver_id, ride_id):
+        if self.active_ride(driver_id) == ride_id:
+            self.redis.hdel(self.active_key, driver_id)
+
+    def _append(self, ride_id, point):
+        return self.redis.rpush(self._points_key(ride_id), ','.join(map(str, point)))
+
+    def _take(self, ride_id):
+        # MULTI/EXEC so no ping lands between the read and the delete
+        pipe = self.redis.pipeline()
+        pipe.lrange(self._points_key(ride_id), 0, -1)
+        pipe.delete(self._points_key(ride_id))
+        raw, _ = pipe.execute()
+        return self._parse(raw)
+
+    def _parse(self, raw):
+        return [tuple(int(value) for value in item.split(',')) for item in raw]
+
+
+_recorder = None
+_recorder_lock = Lock()
+
+
+def get_trace_recorder():
+    """The configured recorder, warmed with rides already in progress"""
+    global _recorder
+    if _recorder is None:
+        with _recorder_lock:
+            if _recorder is None:
+                config = settings.RIDE_TRACE
+                recorder = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+                if recorder.mark_loaded():
+                    _load_active_rides(recorder)
+                _recorder = recorder
+    return _recorder
+
+
+def _load_active_rides(recorder):
+    from .models import Ride
+
+    rows = Ride.objects.filter(
+        status__in=TRACED_STATUSES, driver__isnull=False
+    ).values_list('id', 'driver_id')
+    for ride_id, driver_id in rows:
+        recorder.start(ride_id, driver_id)
+
+
+def sync_ride_trace(ride):
+    """Start recording when a driver takes a ride, stop when it ends"""
+    if ride.driver_id is None:
+        return
+    try:
+        recorder = get_trace_recorder()
+        if ride.status in TRACED_STATUSES:
+            recorder.start(ride.id, ride.driver_id)
+        elif ride.status in ('completed', 'cancelled'):
+            recorder.stop(ride.id, ride.driver_id)
+    except Exception as e:
+        print(f"❌ Error updating ride trace: {e}")
+
+
+def record_trace_point(driver_id, lat, lon):
+    try:
+        get_trace_recorder().record(driver_id, lat, lon)
+    except Exception as e:
+        print(f"❌ Error recording ride trace: {e}")
+
+
+def trip_summary(ride, completed_at):
+    """Actual (distance_km, duration_min) from the trace, or None without one.
+
+    Only the part after pickup counts when the pickup time is known.
+    """
+    recorder = get_trace_recorder()
+    recorder.flush(ride.id)
+    points = recorder.points(ride.id)
+
+    started_at = ride.picked_up_at or ride.accepted_at
+    if ride.picked_up_at:
+        since = int(ride.picked_up_at.timestamp())
+        points = [point for point in points if point[2] >= since]
+    if len(points) < 2:
+        return None
+
+    distance = trace_distance(points)
+    if started_at is None:
+        started_at = datetime.fromtimestamp(points[0][2], tz=dt_timezone.utc)
+    duration = max(0, round((completed_at - started_at).total_seconds() / 60))
+    return round(distance, 2), duration
@@ -3,7 +3,7 @@ from .views import (
     RideCreateView, RideListView, RideDetailView,
     RideAcceptView, RideStatusUpdateView, RideRatingView,
     ActiveRideView, NearbyRideRequestsView, RideEstimateView,
-    RideAnalyticsView
+    RideAnalyticsView, RideBatchEstimateView, RideTraceView, RuntimeStatsView
 )
 
 urlpatterns = [
@@ -13,8 +13,11 @@ urlpatterns = [
     path('<int:ride_id>/accept/', RideAcceptView.as_view(), name='ride-accept'),
     path('<int:ride_id>/status/', RideStatusUpdateView.as_view(), name='ride-status'),
     path('<int:ride_id>/rate/', RideRatingView.as_view(), name='ride-rate'),
+    path('<int:ride_id>/trace/', RideTraceView.as_view(), name='ride-trace'),
     path('active/', ActiveRideView.as_view(), name='active-ride'),
     path('nearby-requests/', NearbyRideRequestsView.as_view(), name='nearby-requests'),  # ← NEW!
     path('estimate/', RideEstimateView.as_view(), name='ride-estimate'), # <- NEW!
+    path('estimate/batch/', RideBatchEstimateView.as_view(), name='ride-estimate-batch'),
     path('analytics/', RideAnalyticsView.as_view(), name='ride-analytics'),
+    path('stats/', RuntimeStatsView.as_view(), name='ride-runtime-stats'),
 ]
\ No newline at end of file
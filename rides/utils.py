@@ -1,8 +1,17 @@
 import math
 
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+AVERAGE_SPEED_KMH = 30  # Used for ETAs when no road graph is configured
+
+BASE_FARE = 5000           # 5000 UZS base fare
+PER_KM = 3000              # 3000 UZS per km
+SHARED_FARE_FACTOR = 0.7   # 30% discount for shared rides
+
 def calculate_distance(lat1, lon1, lat2, lon2):
     """Calculate distance using Haversine formula (km)"""
-    R = 6371
+    R = EARTH_RADIUS_KM
     lat1_rad = math.radians(lat1)
     lat2_rad = math.radians(lat2)
     delta_lat = math.radians(lat2 - lat1)
@@ -15,42 +24,177 @@ def calculate_distance(lat1, lon1, lat2, lon2):
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
     return round(R * c, 2)
 
-def calculate_fare(distance, ride_type='solo'):
-    """Calculate ride fare"""     
-    BASE_FARE = 5000  # 5000 UZS base fare
-    PER_KM = 3000     # 3000 UZS per km
-    
+def haversine_array(lat1, lon1, lat2, lon2):
+    """Vectorized Haversine (km, unrounded); inputs broadcast like NumPy arrays"""
+    lat1 = np.radians(np.asarray(lat1, dtype=np.float64))
+    lon1 = np.radians(np.asarray(lon1, dtype=np.float64))
+    lat2 = np.radians(np.asarray(lat2, dtype=np.float64))
+    lon2 = np.radians(np.asarray(lon2, dtype=np.float64))
+
+    a = (np.sin((lat2 - lat1) / 2) ** 2 +
+         np.cos(lat1) * np.cos(lat2) *
+         np.sin((lon2 - lon1) / 2) ** 2)
+
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return EARTH_RADIUS_KM * c
+
+def calculate_distances(origin_lat, origin_lon, lats, lons):
+    """Distances from one origin to N points in a single call (km, 2 decimals)"""
+    return np.round(haversine_array(origin_lat, origin_lon, lats, lons), 2)
+
+def distance_matrix(lats1, lons1, lats2, lons2):
+    """N x M matrix of distances between two point sets (km, 2 decimals)"""
+    lats1 = np.asarray(lats1, dtype=np.float64)[:, np.newaxis]
+    lons1 = np.asarray(lons1, dtype=np.float64)[:, np.newaxis]
+    return np.round(haversine_array(lats1, lons1, lats2, lons2), 2)
+
+def bounding_box(lat, lon, radius_km):
+    """(min_lat, max_lat, min_lon, max_lon) enclosing a circle of radius_km"""
+    lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+    # Longitude degrees shrink towards the poles
+    cos_lat = max(math.cos(math.radians(lat)), 0.01)
+    lon_delta = lat_delta / cos_lat
+    return lat - lat_delta, lat + lat_delta, lon - lon_delta, lon + lon_delta
+
+def calculate_fare(distance, ride_type='solo', surge=1.0):
+    """Calculate ride fare (surge is the pickup cell's multiplier, see rides.surge)"""     
     fare = BASE_FARE + (distance * PER_KM)
     
     # Discount for shared rides
     if ride_type == 'shared':
-        fare = fare * 0.7  # 30% discount
+        fare = fare * SHARED_FARE_FACTOR
+    
+    return round(fare * surge, 2)
+
+def calculate_fares(distances, ride_type='solo', surge=1.0):
+    """Vectorized calculate_fare over an array of distances"""
+    fares = BASE_FARE + np.asarray(distances, dtype=np.float64) * PER_KM
+    if ride_type == 'shared':
+        fares = fares * SHARED_FARE_FACTOR
+    return np.round(fares * surge, 2)
+
+def estimate_route(pickup_lat, pickup_lon, dropoff_lat, dropoff_lon):
+    """Trip (distance_km, duration_min) over the road graph, straight line as fallback"""
+    from .roads import get_road_graph
+    
+    graph = get_road_graph()
+    if graph is not None:
+        try:
+            route = graph.route(pickup_lat, pickup_lon, dropoff_lat, dropoff_lon)
+            if route is not None:
+                return route
+        except Exception as e:
+            print(f"⚠️ Routing failed, using straight line: {e}")
+    
+    distance = calculate_distance(pickup_lat, pickup_lon, dropoff_lat, dropoff_lon)
+    return distance, round(distance / AVERAGE_SPEED_KMH * 60, 1)
+
+def rank_drivers_by_eta(nearby_drivers, pickup_lat, pickup_lon):
+    """Re-order find_nearby_drivers results by road ETA to the pickup (if routing is set up)"""
+    from .roads import get_road_graph
+    
+    graph = get_road_graph()
+    if graph is None or not nearby_drivers:
+        return nearby_drivers
     
-    return round(fare, 2)
+    try:
+        # From where the search found each driver, not the lagging table columns
+        etas = graph.durations_to(pickup_lat, pickup_lon, [
+            (item['latitude'], item['longitude']) for item in nearby_drivers
+        ])
+    except Exception as e:
+        print(f"⚠️ Routing failed, keeping straight-line order: {e}")
+        return nearby_drivers
+    
+    for item, eta in zip(nearby_drivers, etas):
+        item['eta'] = eta
+    # Unroutable drivers go last, in their straight-line order
+    return sorted(nearby_drivers, key=lambda x: (x['eta'] is None, x['eta'] or 0))
+
+def find_nearby_drivers(passenger_lat, passenger_lon, radius_km=5, limit=None):
+    """Find available drivers within radius (only the `limit` closest if given).
 
-def find_nearby_drivers(passenger_lat, passenger_lon, radius_km=5):
-    """Find available drivers within radius"""
+    Returns [{'driver', 'distance', 'latitude', 'longitude'}] closest first,
+    with each driver at the position the search found them.
+    """
     from users.models import Driver
+    from .availability import live_driver_ids
+    from .location_store import get_driver_store
     
-    available_drivers = Driver.objects.filter(
-        status='available',
-        current_latitude__isnull=False,
-        current_longitude__isnull=False
+    # Searched in the shared location store instead of the drivers table
+    try:
+        store = get_driver_store()
+        if limit:
+            matches = store.nearest(passenger_lat, passenger_lon, limit, radius_km)
+        else:
+            matches = store.search(passenger_lat, passenger_lon, radius_km)
+        positions = store.positions([user_id for user_id, _ in matches])
+    except Exception as e:
+        print(f"⚠️ Location store unavailable, searching database: {e}")
+        return find_nearby_drivers_db(passenger_lat, passenger_lon, radius_km, limit)
+    
+    # Drivers past their heartbeat deadline but not swept yet are skipped
+    live = live_driver_ids([user_id for user_id, _ in matches])
+    matches = [(user_id, distance) for user_id, distance in matches if user_id in live]
+    if not matches:
+        return []
+    
+    drivers = Driver.objects.select_related('user').in_bulk(
+        [user_id for user_id, _ in matches],
+        field_name='user_id'
     )
     
     nearby_drivers = []
-    for driver in available_drivers:
-        distance = calculate_distance(
-            passenger_lat, passenger_lon,
-            float(driver.current_latitude),
-            float(driver.current_longitude)
-        )
+    for user_id, distance in matches:
+        driver = drivers.get(user_id)
+        position = positions.get(user_id)
+        if driver is None or driver.status != 'available' or position is None:
+            continue
         
-        if distance <= radius_km:
-            nearby_drivers.append({
-                'driver': driver,
-                'distance': distance
-            })
+        nearby_drivers.append({
+            'driver': driver,
+            'distance': distance,
+            'latitude': position['latitude'],
+            'longitude': position['longitude']
+        })
+    
+    return nearby_drivers
+
+def find_nearby_drivers_db(passenger_lat, passenger_lon, radius_km=5, limit=None):
+    """Find available drivers within radius straight from the drivers table"""
+    from decimal import Decimal
+    from users.models import Driver
+    from .availability import live_driver_ids
+    
+    passenger_lat, passenger_lon = float(passenger_lat), float(passenger_lon)
+    radius_km = float(radius_km)
+    # Pad by the 0.01 km that distance rounding can hide
+    min_lat, max_lat, min_lon, max_lon = bounding_box(passenger_lat, passenger_lon, radius_km + 0.01)
+    
+    # Bounding box is answered by driver_status_location_idx; only the
+    # survivors get the exact Haversine check
+    candidates = list(Driver.objects.filter(
+        status='available',
+        current_latitude__range=(Decimal(f"{min_lat:.6f}"), Decimal(f"{max_lat:.6f}")),
+        current_longitude__range=(Decimal(f"{min_lon:.6f}"), Decimal(f"{max_lon:.6f}"))
+    ).select_related('user'))
+    live = live_driver_ids([driver.user_id for driver in candidates])
+    candidates = [driver for driver in candidates if driver.user_id in live]
+    if not candidates:
+        return []
+    
+    distances = calculate_distances(
+        passenger_lat, passenger_lon,
+        [float(driver.current_latitude) for driver in candidates],
+        [float(driver.current_longitude) for driver in candidates]
+    )
+    
+    nearby_drivers = [{
+        'driver': candidates[i],
+        'distance': float(distances[i]),
+        'latitude': float(candidates[i].current_latitude),
+        'longitude': float(candidates[i].current_longitude)
+    } for i in np.flatnonzero(distances <= radius_km)]
     
     nearby_drivers.sort(key=lambda x: x['distance'])
-    return nearby_drivers
\ No newline at end of file
+    return nearby_drivers[:limit] if limit else nearby_drivers
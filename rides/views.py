@@ -4,17 +4,18 @@ from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404, render
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from django.utils import timezone
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from django.conf import settings
 from drf_spectacular.utils import extend_schema, OpenApiExample #* for api 
 from .models import Ride
 from .serializers import (
     RideSerializer, RideCreateSerializer, 
-    RideStatusUpdateSerializer, RideRatingSerializer, RideEstimateSerializer  
+    RideStatusUpdateSerializer, RideRatingSerializer, RideEstimateSerializer,
+    NearbyRideRequestsQuerySerializer, SharedRideSerializer,
+    RideBatchEstimateSerializer, BatchEstimateDestinationSerializer
 )
 
 from django.db.models import Count, Sum, Avg, Q
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
 
 def home(request):
     return render(request, 'rides/main.html')
@@ -35,6 +36,32 @@ class RideCreateView(generics.CreateAPIView):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
+        # Every request counts towards demand in its pickup cell
+        from .surge import record_ride_request
+        record_ride_request(
+            serializer.validated_data['pickup_latitude'],
+            serializer.validated_data['pickup_longitude']
+        )
+        
+        # Shared requests first try to join a compatible open shared ride
+        if serializer.validated_data.get('ride_type') == 'shared':
+            from django.db import transaction
+            from .pooling import pool_shared_request
+            
+            # The driver's notification is saved in the same transaction as the seat
+            with transaction.atomic():
+                shared = pool_shared_request(request.user, serializer.validated_data)
+                if shared:
+                    self.notify_shared_passenger(shared)
+            if shared:
+                return Response(
+                    {
+                        **RideSerializer(shared.ride).data,
+                        'shared_ride': SharedRideSerializer(shared).data,
+                    },
+                    status=status.HTTP_201_CREATED
+                )
+        
         # Create the ride
         ride = serializer.save()
         
@@ -49,59 +76,48 @@ class RideCreateView(generics.CreateAPIView):
         )
     
     def notify_nearby_drivers(self, ride):
-        """Send WebSocket notification to nearby drivers"""
-        from users.models import Driver
-        from .utils import find_nearby_drivers
+        """Queue the ride for the dispatch worker, which offers it to nearby drivers"""
+        from django.db import transaction
+        from .dispatch import dispatch_ride
         
-        try:
-            # Find drivers within 5km
-            nearby = find_nearby_drivers(
-                float(ride.pickup_latitude),
-                float(ride.pickup_longitude),
-                radius_km=5
-            )
-            
-            if not nearby:
-                print(f"⚠️ No drivers found near ride #{ride.id}")
-                return
-            
-            # Get channel layer
-            channel_layer = get_channel_layer()
-            
-            # Send notification to each nearby driver
-            notification_count = 0
-            for driver_info in nearby:
-                driver = driver_info['driver']
-                distance = driver_info['distance']
-                
-                # Only notify available drivers
-                if driver.status != 'available':
-                    continue
-                
-                print(f"📢 Notifying driver {driver.user.username} about ride #{ride.id}")
-                
-                # Send WebSocket message to this specific driver
-                async_to_sync(channel_layer.group_send)(
-                    f'user_{driver.user.id}',  # Driver's personal channel
-                    {
-                        'type': 'new_ride_notification',
-                        'ride_id': ride.id,
-                        'passenger_name': f"{ride.passenger.first_name} {ride.passenger.last_name}",
-                        'passenger_phone': ride.passenger.phone_number,
-                        'pickup_address': ride.pickup_address,
-                        'dropoff_address': ride.dropoff_address,
-                        'distance_to_pickup': round(distance, 2),
-                        'fare': str(ride.fare),
-                        'estimated_distance': str(ride.distance),
-                        'ride_type': ride.ride_type,
-                    }
-                )
-                notification_count += 1
-            
-            print(f"✅ Notified {notification_count} drivers about ride #{ride.id}")
-            
-        except Exception as e:
-            print(f"❌ Error notifying drivers: {e}")
+        # Batch mode: the matcher (manage.py run_matcher) offers the ride
+        if settings.DISPATCH_MODE == 'batch':
+            return
+        
+        # Matching and the WebSocket fan-out happen after the response is sent
+        transaction.on_commit(lambda: dispatch_ride(ride))
+
+    def notify_shared_passenger(self, shared):
+        """Tell the ride's driver about a pooled passenger (via the outbox)"""
+        ride = shared.ride
+        if not ride.driver_id:
+            return
+        
+        from .outbox import publish
+        
+        messages = [(
+            f'user_{ride.driver_id}',
+            {
+                'type': 'shared_passenger_notification',
+                'ride_id': ride.id,
+                'passenger_name': f"{shared.passenger.first_name} {shared.passenger.last_name}",
+                'passenger_phone': shared.passenger.phone_number,
+                'pickup_latitude': str(shared.pickup_latitude),
+                'pickup_longitude': str(shared.pickup_longitude),
+                'dropoff_latitude': str(shared.dropoff_latitude),
+                'dropoff_longitude': str(shared.dropoff_longitude),
+                'fare_share': str(shared.fare_share),
+            }
+        )]
+        
+        # Already under way: the new passenger follows the driver through the ride group
+        if ride.status in ('accepted', 'picked_up'):
+            messages.append((
+                f'user_{shared.passenger_id}',
+                {'type': 'ride_group_join', 'ride_id': ride.id}
+            ))
+        
+        publish(messages)
 
 class RideListView(generics.ListAPIView):
     """Get user's ride history"""
@@ -137,7 +153,7 @@ class RideAcceptView(APIView):
     @extend_schema(
         request=None, 
         responses={200: RideSerializer},
-        description="Driver accepts a pending ride request",
+        description="Driver accepts a pending ride request (409 if another driver took it first)",
         parameters=[
             OpenApiParameter(
                 name='ride_id',
@@ -154,7 +170,7 @@ class RideAcceptView(APIView):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        ride = get_object_or_404(Ride, id=ride_id, status='pending')
+        get_object_or_404(Ride, id=ride_id)
         
         # Check if driver profile is complete
         driver_profile = request.user.driver_profile
@@ -164,52 +180,62 @@ class RideAcceptView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Check if driver is available
-        if driver_profile.status != 'available':
-            return Response(
-                {'error': 'Driver not available'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Accept the ride
-        ride.driver = request.user
-        ride.status = 'accepted'
-        ride.accepted_at = timezone.now()
-        ride.save()
-        
-        # Update driver status
-        driver_profile.status = 'on_trip'
-        driver_profile.save()
+        from django.db import transaction
+        from users.models import Driver
         
-        # ✅ Notify passenger via WebSocket
-        self.notify_passenger(ride)
+        with transaction.atomic():
+            # Claim the ride under a row lock, so of two drivers accepting at
+            # once the second sees it taken and nothing is published for it
+            ride = Ride.objects.select_for_update().get(id=ride_id)
+            if ride.status != 'pending':
+                return Response(
+                    {'error': 'Ride is no longer available'}, 
+                    status=status.HTTP_409_CONFLICT
+                )
+            
+            # Check if driver is available (locked too, so one driver cannot take two rides)
+            driver_profile = Driver.objects.select_for_update().get(pk=driver_profile.pk)
+            if driver_profile.status != 'available':
+                return Response(
+                    {'error': 'Driver not available'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            # Accept the ride
+            ride.driver = request.user
+            ride.status = 'accepted'
+            ride.accepted_at = timezone.now()
+            ride.save()
+            
+            # Update driver status
+            driver_profile.status = 'on_trip'
+            driver_profile.save(update_fields=['status', 'updated_at'])
+            
+            # ✅ Notify passenger via WebSocket once this commits; passenger(s) and
+            # driver switch to the ride's own tracking group in the same batch
+            self.notify_passenger(ride)
         
         return Response(RideSerializer(ride).data)
     
     def notify_passenger(self, ride):
-        """Notify passenger that driver accepted"""
-        try:
-            channel_layer = get_channel_layer()
-            
-            async_to_sync(channel_layer.group_send)(
-                f'user_{ride.passenger.id}',
-                {
-                    'type': 'ride_accepted_notification',
-                    'ride_id': ride.id,
-                    'driver_name': f"{ride.driver.first_name} {ride.driver.last_name}",
-                    'driver_phone': ride.driver.phone_number,
-                    'vehicle_type': ride.driver.driver_profile.vehicle_type,
-                    'vehicle_model': ride.driver.driver_profile.vehicle_model,
-                    'vehicle_number': ride.driver.driver_profile.vehicle_number,
-                    'vehicle_color': ride.driver.driver_profile.vehicle_color,
-                    'driver_rating': str(ride.driver.driver_profile.rating),
-                }
-            )
-            
-            print(f"✅ Notified passenger {ride.passenger.username} - ride accepted")
-            
-        except Exception as e:
-            print(f"❌ Error notifying passenger: {e}")
+        """Notify passenger that driver accepted (via the outbox)"""
+        from .fanout import ride_group_join_messages
+        from .outbox import publish
+        
+        publish([(
+            f'user_{ride.passenger.id}',
+            {
+                'type': 'ride_accepted_notification',
+                'ride_id': ride.id,
+                'driver_name': f"{ride.driver.first_name} {ride.driver.last_name}",
+                'driver_phone': ride.driver.phone_number,
+                'vehicle_type': ride.driver.driver_profile.vehicle_type,
+                'vehicle_model': ride.driver.driver_profile.vehicle_model,
+                'vehicle_number': ride.driver.driver_profile.vehicle_number,
+                'vehicle_color': ride.driver.driver_profile.vehicle_color,
+                'driver_rating': str(ride.driver.driver_profile.rating),
+            }
+        ), *ride_group_join_messages(ride)])
 
 class RideStatusUpdateView(APIView):
     """Update ride status"""
@@ -242,60 +268,123 @@ class RideStatusUpdateView(APIView):
         serializer.is_valid(raise_exception=True)
         
         new_status = serializer.validated_data['status']
-        ride.status = new_status
         
-        # Update timestamps based on status
-        if new_status == 'picked_up':
-            ride.picked_up_at = timezone.now()
+        from django.db import transaction
+        
+        with transaction.atomic():
+            ride.status = new_status
             
-        elif new_status == 'completed':
-            ride.completed_at = timezone.now()
+            # Update timestamps based on status
+            if new_status == 'picked_up':
+                ride.picked_up_at = timezone.now()
             
-            # Update driver stats
-            if ride.driver:
-                ride.driver.driver_profile.status = 'available'
-                ride.driver.driver_profile.total_rides += 1
-                ride.driver.driver_profile.save()
+            elif new_status == 'completed':
+                ride.completed_at = timezone.now()
             
-            # Update passenger stats
-            if hasattr(ride.passenger, 'passenger_profile'):
-                ride.passenger.passenger_profile.total_rides += 1
-                ride.passenger.passenger_profile.save()
-        
-        elif new_status == 'cancelled':
-            # Make driver available again
-            if ride.driver:
-                ride.driver.driver_profile.status = 'available'
-                ride.driver.driver_profile.save()
-        
-        ride.save()
-        
-        # ✅ Notify other party about status change
-        self.notify_status_change(ride, new_status)
+                # Actual distance and duration from the recorded GPS trace
+                from .traces import trip_summary
+                summary = trip_summary(ride, ride.completed_at)
+                if summary:
+                    ride.distance, ride.duration = summary
+            
+                # Update driver stats
+                if ride.driver:
+                    ride.driver.driver_profile.status = 'available'
+                    ride.driver.driver_profile.total_rides += 1
+                    ride.driver.driver_profile.save(update_fields=['status', 'total_rides', 'updated_at'])
+            
+                # Update passenger stats
+                if hasattr(ride.passenger, 'passenger_profile'):
+                    ride.passenger.passenger_profile.total_rides += 1
+                    ride.passenger.passenger_profile.save()
+            
+            elif new_status == 'cancelled':
+                # Make driver available again
+                if ride.driver:
+                    ride.driver.driver_profile.status = 'available'
+                    ride.driver.driver_profile.save(update_fields=['status', 'updated_at'])
+            
+            ride.save()
+            
+            # ✅ Notify other party once this commits (tracking ends with the ride)
+            self.notify_status_change(ride, new_status)
         
         return Response(RideSerializer(ride).data)
     
     def notify_status_change(self, ride, new_status):
-        """Notify passenger or driver about status change"""
-        try:
-            channel_layer = get_channel_layer()
-            
-            # Determine who to notify
-            if ride.driver:
-                # Notify passenger about status change
-                async_to_sync(channel_layer.group_send)(
-                    f'user_{ride.passenger.id}',
-                    {
-                        'type': 'ride_status_update',
-                        'ride_id': ride.id,
-                        'status': new_status,
-                    }
-                )
-            
-            print(f"✅ Notified about status change: {new_status}")
-            
-        except Exception as e:
-            print(f"❌ Error notifying status change: {e}")
+        """Notify passenger or driver about status change (via the outbox)"""
+        from .fanout import ride_group_leave_message
+        from .outbox import publish
+        
+        # Determine who to notify
+        messages = []
+        if ride.driver:
+            # Notify passenger about status change
+            messages.append((
+                f'user_{ride.passenger.id}',
+                {
+                    'type': 'ride_status_update',
+                    'ride_id': ride.id,
+                    'status': new_status,
+                }
+            ))
+        
+        # The ride group is closed in the same batch
+        if new_status in ('completed', 'cancelled'):
+            messages.append(ride_group_leave_message(ride))
+        
+        publish(messages)
+
+class RideTraceView(APIView):
+    """GPS trace recorded while the ride was in progress"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    @extend_schema(
+        responses={200: {
+            'type': 'object',
+            'properties': {
+                'ride_id': {'type': 'integer'},
+                'point_count': {'type': 'integer'},
+                'distance': {'type': 'string', 'description': 'Length of the trace in kilometers'},
+                'started_at': {'type': 'string', 'nullable': True},
+                'ended_at': {'type': 'string', 'nullable': True},
+                'polyline': {'type': 'string', 'description': 'Google encoded polyline (precision 5)'},
+            }
+        }},
+        description="Get the driver's recorded route for a ride as an encoded polyline",
+        parameters=[
+            OpenApiParameter(
+                name='ride_id',
+                type=int,
+                location=OpenApiParameter.PATH,
+                description='Ride ID'
+            )
+        ]
+    )
+    def get(self, request, ride_id):
+        from .traces import get_trace_recorder, encode_polyline, trace_distance
+        
+        ride = get_object_or_404(Ride, id=ride_id)
+        is_shared_passenger = ride.shared_passengers.filter(passenger=request.user).exists()
+        if request.user not in (ride.driver, ride.passenger) and not is_shared_passenger:
+            return Response(
+                {'error': 'Not authorized'}, 
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        points = get_trace_recorder().points(ride.id)
+        
+        def as_iso(point):
+            return datetime.fromtimestamp(point[2], tz=dt_timezone.utc).isoformat()
+        
+        return Response({
+            'ride_id': ride.id,
+            'point_count': len(points),
+            'distance': f"{trace_distance(points):.2f}",
+            'started_at': as_iso(points[0]) if points else None,
+            'ended_at': as_iso(points[-1]) if points else None,
+            'polyline': encode_polyline(points),
+        })
 
 class RideRatingView(APIView):
     """Rate a completed ride"""
@@ -350,7 +439,7 @@ class RideRatingView(APIView):
         
         if avg_rating:
             driver.driver_profile.rating = round(avg_rating, 2)
-            driver.driver_profile.save()
+            driver.driver_profile.save(update_fields=['rating', 'updated_at'])
 
 class ActiveRideView(APIView):
     """Get user's current active ride"""
@@ -369,10 +458,11 @@ class ActiveRideView(APIView):
                 status__in=['accepted', 'picked_up']
             ).first()
         else:
+            # Pooled passengers ride in someone else's shared ride
             ride = Ride.objects.filter(
-                passenger=user, 
+                Q(passenger=user) | Q(shared_passengers__passenger=user),
                 status__in=['pending', 'accepted', 'picked_up']
-            ).first()
+            ).distinct().first()
         
         if ride:
             return Response(RideSerializer(ride).data)
@@ -395,6 +485,7 @@ class RideEstimateView(APIView):
                 'estimated_time': {'type': 'integer', 'description': 'Estimated time in minutes'},
                 'currency': {'type': 'string', 'description': 'Currency code'},
                 'ride_type': {'type': 'string', 'description': 'Type of ride requested'},
+                'surge_multiplier': {'type': 'number', 'description': 'Demand multiplier applied to the fare (1.0 = no surge)'},
             }
         }},
         description="Get fare estimate before creating ride. Calculate distance and price based on pickup/dropoff locations.",
@@ -413,7 +504,7 @@ class RideEstimateView(APIView):
         ]
     )
     def post(self, request):
-        from .utils import calculate_distance, calculate_fare
+        from .estimates import estimate_trip
         
         # Validate input
         serializer = RideEstimateSerializer(data=request.data)
@@ -427,26 +518,25 @@ class RideEstimateView(APIView):
         ride_type = serializer.validated_data.get('ride_type', 'solo')
         
         try:
-            # Calculate distance
-            distance = calculate_distance(
+            # Distance, travel time and fare - cached per snapped origin/destination
+            estimate = estimate_trip(
                 float(pickup_lat),
                 float(pickup_lng),
                 float(dropoff_lat),
-                float(dropoff_lng)
+                float(dropoff_lng),
+                ride_type
             )
-            
-            # Calculate fare
-            fare = calculate_fare(distance, ride_type)
-            
-            # Estimate time (assume 30 km/h average speed)
-            estimated_time = int((distance / 30) * 60)  # in minutes
+            distance = estimate['distance']
+            fare = estimate['fare']
+            estimated_time = int(estimate['duration'])  # in minutes
             
             return Response({
                 'distance': f"{distance:.2f}",
                 'fare': f"{fare:.2f}",
                 'estimated_time': estimated_time,
                 'currency': 'UZS',
-                'ride_type': ride_type
+                'ride_type': ride_type,
+                'surge_multiplier': estimate['surge_multiplier']
             })
             
         except Exception as e:
@@ -454,16 +544,125 @@ class RideEstimateView(APIView):
                 {'error': str(e)},
                 status=status.HTTP_400_BAD_REQUEST
             )
+
+
+class RideBatchEstimateView(APIView):
+    """Estimate fares from one pickup to many destinations and ride types"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    @extend_schema(
+        request=RideBatchEstimateSerializer,
+        responses={200: {
+            'type': 'object',
+            'properties': {
+                'currency': {'type': 'string'},
+                'surge_multiplier': {'type': 'number', 'description': 'Demand multiplier at the pickup, applied to every fare'},
+                'quotes': {
+                    'type': 'array',
+                    'items': {
+                        'type': 'object',
+                        'properties': {
+                            'index': {'type': 'integer', 'description': 'Position in destinations'},
+                            'label': {'type': 'string'},
+                            'ride_type': {'type': 'string'},
+                            'distance': {'type': 'string'},
+                            'fare': {'type': 'string'},
+                            'estimated_time': {'type': 'integer'},
+                            'error': {'type': 'object', 'description': 'Set instead of a quote when this destination is invalid'},
+                        }
+                    }
+                },
+            }
+        }},
+        description="Quote every destination for every ride type in one request. Invalid destinations get an error entry without failing the batch.",
+        examples=[
+            OpenApiExample(
+                'Compare solo and shared for saved places',
+                value={
+                    "pickup_latitude": 41.299500,
+                    "pickup_longitude": 69.240100,
+                    "destinations": [
+                        {"latitude": 41.311151, "longitude": 69.279737, "label": "Amir Temur Square"},
+                        {"latitude": 41.257900, "longitude": 69.281100, "label": "Airport"}
+                    ],
+                    "ride_types": ["solo", "shared"]
+                },
+                request_only=True,
+            )
+        ]
+    )
+    def post(self, request):
+        from .roads import get_road_graph
+        from .estimates import estimate_trip
+        from .utils import calculate_distances, calculate_fares, AVERAGE_SPEED_KMH
+        from .surge import surge_multiplier
+        
+        serializer = RideBatchEstimateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        pickup_lat = float(serializer.validated_data['pickup_latitude'])
+        pickup_lng = float(serializer.validated_data['pickup_longitude'])
+        ride_types = list(dict.fromkeys(serializer.validated_data['ride_types']))
+        surge = surge_multiplier(pickup_lat, pickup_lng)
+        
+        # Validate destinations one by one so a bad item only fails itself
+        quotes = []
+        valid = []
+        for index, item in enumerate(serializer.validated_data['destinations']):
+            destination = BatchEstimateDestinationSerializer(data=item)
+            if destination.is_valid():
+                valid.append((index, destination.validated_data))
+            else:
+                quotes.append({'index': index, 'error': destination.errors})
+        
+        if valid:
+            lats = [float(data['latitude']) for _, data in valid]
+            lngs = [float(data['longitude']) for _, data in valid]
+            
+            if get_road_graph() is None:
+                # Straight line: every distance and fare in one vectorized pass
+                distances = calculate_distances(pickup_lat, pickup_lng, lats, lngs)
+                durations = distances / AVERAGE_SPEED_KMH * 60
+                fares = {ride_type: calculate_fares(distances, ride_type, surge) for ride_type in ride_types}
+            else:
+                # Road routes are computed (and cached) per destination
+                estimates = [
+                    estimate_trip(pickup_lat, pickup_lng, lat, lng)
+                    for lat, lng in zip(lats, lngs)
+                ]
+                distances = [estimate['distance'] for estimate in estimates]
+                durations = [estimate['duration'] for estimate in estimates]
+                fares = {ride_type: calculate_fares(distances, ride_type, surge) for ride_type in ride_types}
+            
+            for i, (index, data) in enumerate(valid):
+                for ride_type in ride_types:
+                    quotes.append({
+                        'index': index,
+                        'label': data.get('label', ''),
+                        'ride_type': ride_type,
+                        'distance': f"{distances[i]:.2f}",
+                        'fare': f"{fares[ride_type][i]:.2f}",
+                        'estimated_time': int(durations[i]),
+                    })
+        
+        quotes.sort(key=lambda quote: quote['index'])
+        return Response({
+            'currency': 'UZS',
+            'surge_multiplier': surge,
+            'quotes': quotes
+        })
+
 class NearbyRideRequestsView(APIView):
     """Get pending rides near driver's location (polling fallback)"""
     permission_classes = [permissions.IsAuthenticated]
     
     @extend_schema(
+        parameters=[NearbyRideRequestsQuerySerializer],
         responses={200: {
             'type': 'array',
             'items': {'type': 'object'}
         }},
-        description="Get pending ride requests within 5km of driver's current location"
+        description="Get pending ride requests near driver's current location, closest first"
     )
     def get(self, request):
         if request.user.user_type != 'driver':
@@ -472,31 +671,44 @@ class NearbyRideRequestsView(APIView):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        driver = request.user.driver_profile
+        query = NearbyRideRequestsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        radius = query.validated_data['radius']
+        limit = query.validated_data['limit']
         
-        # Check if driver has location set
-        if not driver.current_latitude or not driver.current_longitude:
+        from .location_store import get_driver_store, get_pending_ride_store
+        
+        # Driver position from the location store, database as fallback
+        location = get_driver_store().position(request.user.id)
+        if location:
+            driver_lat, driver_lng = location['latitude'], location['longitude']
+        else:
+            driver = request.user.driver_profile
+            if not driver.current_latitude or not driver.current_longitude:
+                return Response([])
+            driver_lat, driver_lng = float(driver.current_latitude), float(driver.current_longitude)
+        
+        # Only pickups in the grid cells around the driver are looked at
+        matches = get_pending_ride_store().search(driver_lat, driver_lng, radius)
+        if not matches:
             return Response([])
         
-        from .utils import calculate_distance
+        # Rides taken since they were indexed are dropped before the limit is applied
+        pending = set(Ride.objects.filter(
+            id__in=[ride_id for ride_id, _ in matches],
+            status='pending'
+        ).values_list('id', flat=True))
+        matches = [(ride_id, distance) for ride_id, distance in matches if ride_id in pending][:limit]
         
-        # Find pending rides within 5km
-        pending_rides = Ride.objects.filter(status='pending')
+        # Serialize only the rides returned
+        rides = Ride.objects.filter(
+            id__in=[ride_id for ride_id, _ in matches]
+        ).select_related('passenger', 'driver').in_bulk()
         
-        nearby_rides = []
-        for ride in pending_rides:
-            distance = calculate_distance(
-                float(driver.current_latitude),
-                float(driver.current_longitude),
-                float(ride.pickup_latitude),
-                float(ride.pickup_longitude)
-            )
-            
-            if distance <= 5:
-                nearby_rides.append({
-                    'ride': RideSerializer(ride).data,
-                    'distance_to_pickup': round(distance, 2)
-                })
+        nearby_rides = [{
+            'ride': RideSerializer(rides[ride_id]).data,
+            'distance_to_pickup': round(distance, 2)
+        } for ride_id, distance in matches if ride_id in rides]
         
         return Response(nearby_rides)
 
@@ -587,4 +799,40 @@ class RideAnalyticsView(APIView):
             'period': '30 days'
         })
 
-    
\ No newline at end of file
+    
+
+class RuntimeStatsView(APIView):
+    """Counters of the fast-tier workers running in the process that serves the request"""
+    permission_classes = [permissions.IsAdminUser]
+
+    @extend_schema(
+        responses={200: {
+            'type': 'object',
+            'properties': {
+                'pid': {'type': 'integer'},
+                'dispatch': {'type': 'object', 'nullable': True},
+                'estimates': {'type': 'object'},
+                'ingestion': {'type': 'object', 'nullable': True},
+            }
+        }},
+        description=(
+            "Admin only. Dispatch queue depth, drops (rejected submits), retries and latency "
+            "of this worker process (null while dispatch runs inline), the estimate "
+            "cache's size and hit rate, and the location ingestion filter's decision counts "
+            "(null while the filter is off)."
+        )
+    )
+    def get(self, request):
+        import os
+        from .dispatch import get_dispatch_worker
+        from .estimates import get_estimate_cache
+        from .ingestion import get_ingestion_filter
+
+        worker = get_dispatch_worker()
+        ingestion_filter = get_ingestion_filter()
+        return Response({
+            'pid': os.getpid(),
+            'dispatch': worker.stats() if worker is not None else None,
+            'estimates': get_estimate_cache().stats(),
+            'ingestion': ingestion_filter.stats() if ingestion_filter is not None else None,
+        })
@@ -230,6 +230,201 @@ else:
     }
     print("⚠️ Using InMemory channels (development mode)")
 
+# Driver location store - Redis GEO index shared by all workers when Redis is configured
+if REDIS_URL:
+    LOCATION_STORE = {
+        'BACKEND': 'rides.location_store.RedisLocationStore',
+        'OPTIONS': {
+            'url': REDIS_URL,
+            # Seconds before one worker reloads the store from the database
+            'loaded_ttl': config('LOCATION_STORE_LOADED_TTL', default=3600, cast=int),
+        },
+    }
+else:
+    LOCATION_STORE = {
+        'BACKEND': 'rides.location_store.InMemoryLocationStore',
+        'OPTIONS': {
+            'cell_size_km': config('LOCATION_CELL_SIZE_KM', default=1.0, cast=float),
+        },
+    }
+
+# WebSocket location fan-out - driver updates go to the group of the cell they are in;
+# clients join the cell groups within LOCATION_SUBSCRIBE_RADIUS_KM of their position
+LOCATION_BROADCAST_CELL_KM = config('LOCATION_BROADCAST_CELL_KM', default=1.0, cast=float)
+LOCATION_SUBSCRIBE_RADIUS_KM = config('LOCATION_SUBSCRIBE_RADIUS_KM', default=2.0, cast=float)
+
+# Driver positions are coalesced per group and sent as one location_batch frame per tick
+# (at most LOCATION_BATCH_MAX_DRIVERS drivers per frame); 0 sends every update on its own
+LOCATION_BROADCAST_TICK_MS = config('LOCATION_BROADCAST_TICK_MS', default=500, cast=int)
+LOCATION_BATCH_MAX_DRIVERS = config('LOCATION_BATCH_MAX_DRIVERS', default=100, cast=int)
+
+# Dispatch - new rides are offered to the N closest available drivers within max radius
+DISPATCH_MAX_DRIVERS = config('DISPATCH_MAX_DRIVERS', default=5, cast=int)
+DISPATCH_MAX_RADIUS_KM = config('DISPATCH_MAX_RADIUS_KM', default=10, cast=float)
+
+# 'broadcast' notifies nearby drivers on booking; 'waves' offers the ride to the closest
+# DISPATCH_WAVE_SIZE drivers, then the next ones every DISPATCH_WAVE_WINDOW seconds until it is
+# accepted (at most DISPATCH_MAX_WAVES waves); 'batch' leaves it to `manage.py run_matcher`,
+# which solves a min-cost assignment of pending rides to available drivers every interval
+DISPATCH_MODE = config('DISPATCH_MODE', default='broadcast')
+DISPATCH_BATCH_INTERVAL = config('DISPATCH_BATCH_INTERVAL', default=5, cast=float)
+DISPATCH_OFFER_TIMEOUT = config('DISPATCH_OFFER_TIMEOUT', default=20, cast=float)
+
+# Broadcast dispatch runs off the request path: bookings are queued (at most DISPATCH_QUEUE_SIZE)
+# for DISPATCH_WORKERS tasks on the ASGI loop; failed sends are retried with exponential backoff.
+# 0 dispatches inline in the booking request
+DISPATCH_QUEUE_SIZE = config('DISPATCH_QUEUE_SIZE', default=1000, cast=int)
+DISPATCH_WORKERS = config('DISPATCH_WORKERS', default=4, cast=int)
+DISPATCH_SEND_RETRIES = config('DISPATCH_SEND_RETRIES', default=3, cast=int)
+DISPATCH_RETRY_BACKOFF_MS = config('DISPATCH_RETRY_BACKOFF_MS', default=50, cast=int)
+
+DISPATCH_WAVE_SIZE = config('DISPATCH_WAVE_SIZE', default=3, cast=int)
+DISPATCH_WAVE_WINDOW = config('DISPATCH_WAVE_WINDOW', default=15, cast=float)
+DISPATCH_MAX_WAVES = config('DISPATCH_MAX_WAVES', default=4, cast=int)
+
+# Road routing - directory written by `manage.py build_road_graph`; empty uses straight-line distances
+ROAD_GRAPH_PATH = config('ROAD_GRAPH_PATH', default='')
+
+# Fare/ETA estimate cache - coordinates snapped to cells of ESTIMATE_CACHE_CELL_M metres
+# (also shared through Redis when REDIS_URL is set)
+ESTIMATE_CACHE_SIZE = config('ESTIMATE_CACHE_SIZE', default=10000, cast=int)
+ESTIMATE_CACHE_TTL = config('ESTIMATE_CACHE_TTL', default=300, cast=int)
+ESTIMATE_CACHE_CELL_M = config('ESTIMATE_CACHE_CELL_M', default=100, cast=float)
+
+# Shared-ride pooling - limits for attaching a shared request to an open shared ride
+POOLING_MAX_PICKUP_KM = config('POOLING_MAX_PICKUP_KM', default=2, cast=float)
+POOLING_MAX_DROPOFF_KM = config('POOLING_MAX_DROPOFF_KM', default=3, cast=float)
+POOLING_MAX_DETOUR_RATIO = config('POOLING_MAX_DETOUR_RATIO', default=1.5, cast=float)
+POOLING_MAX_WAIT_SECONDS = config('POOLING_MAX_WAIT_SECONDS', default=600, cast=int)
+
+# Candidate index for pooling - open shared rides by the cells of their stops and request time;
+# shared by all workers with Redis (the ride rows are still locked and re-checked before joining)
+POOLING_INDEX = {
+    'BACKEND': (
+        'rides.pooling.RedisPoolIndex' if REDIS_URL
+        else 'rides.pooling.InMemoryPoolIndex'
+    ),
+    'OPTIONS': {
+        'cell_size_km': config('POOLING_CELL_SIZE_KM', default=1.0, cast=float),
+        'time_bucket_seconds': config('POOLING_TIME_BUCKET_SECONDS', default=300, cast=int),
+    },
+}
+if REDIS_URL:
+    POOLING_INDEX['OPTIONS']['url'] = REDIS_URL
+
+# Location write-behind - pings update the fast tier at once and are bulk-written to
+# Postgres every LOCATION_FLUSH_INTERVAL seconds (by each worker, or `manage.py flush_locations`)
+LOCATION_BUFFER = {
+    'BACKEND': (
+        'rides.location_buffer.RedisLocationBuffer' if REDIS_URL
+        else 'rides.location_buffer.InMemoryLocationBuffer'
+    ),
+    'OPTIONS': {
+        'interval': config('LOCATION_FLUSH_INTERVAL', default=2.0, cast=float),
+        'batch_size': config('LOCATION_FLUSH_BATCH_SIZE', default=500, cast=int),
+        'max_pending': config('LOCATION_BUFFER_MAX_PENDING', default=50000, cast=int),
+    },
+    'FLUSH_IN_PROCESS': config('LOCATION_FLUSH_IN_PROCESS', default=True, cast=bool),
+}
+if REDIS_URL:
+    LOCATION_BUFFER['OPTIONS']['url'] = REDIS_URL
+
+# Ride traces - driver pings during accepted/picked_up rides, appended in chunks of N points
+RIDE_TRACE = {
+    'BACKEND': (
+        'rides.traces.RedisTraceRecorder' if REDIS_URL
+        else 'rides.traces.InMemoryTraceRecorder'
+    ),
+    'OPTIONS': {
+        'batch_size': config('RIDE_TRACE_BATCH_SIZE', default=30, cast=int),
+    },
+}
+if REDIS_URL:
+    RIDE_TRACE['OPTIONS']['url'] = REDIS_URL
+    RIDE_TRACE['OPTIONS']['loaded_ttl'] = config('RIDE_TRACE_LOADED_TTL', default=3600, cast=int)
+
+# Surge pricing - per-cell ride requests vs available drivers over a sliding window
+SURGE = {
+    'ENABLED': config('SURGE_ENABLED', default=True, cast=bool),
+    'BACKEND': (
+        'rides.surge.RedisSurgeEngine' if REDIS_URL
+        else 'rides.surge.InMemorySurgeEngine'
+    ),
+    'OPTIONS': {
+        'window_seconds': config('SURGE_WINDOW_SECONDS', default=300, cast=int),
+        'bucket_seconds': config('SURGE_BUCKET_SECONDS', default=30, cast=int),
+        'cell_size_km': config('SURGE_CELL_SIZE_KM', default=1.0, cast=float),
+        'sensitivity': config('SURGE_SENSITIVITY', default=0.5, cast=float),
+        'max_multiplier': config('SURGE_MAX_MULTIPLIER', default=2.5, cast=float),
+        'min_requests': config('SURGE_MIN_REQUESTS', default=3, cast=int),
+    },
+}
+if REDIS_URL:
+    SURGE['OPTIONS']['url'] = REDIS_URL
+
+# Location ingestion filter - driver pings that moved less than LOCATION_MIN_MOVE_M (status
+# unchanged) or came within LOCATION_MIN_INTERVAL_SECONDS of the last one are neither stored
+# nor broadcast; a stationary driver still gets through every LOCATION_KEEPALIVE_SECONDS
+LOCATION_INGESTION = {
+    'ENABLED': config('LOCATION_INGESTION_ENABLED', default=True, cast=bool),
+    'BACKEND': (
+        'rides.ingestion.RedisIngestionFilter' if REDIS_URL
+        else 'rides.ingestion.InMemoryIngestionFilter'
+    ),
+    'OPTIONS': {
+        'min_distance_m': config('LOCATION_MIN_MOVE_M', default=15.0, cast=float),
+        'keepalive_seconds': config('LOCATION_KEEPALIVE_SECONDS', default=30.0, cast=float),
+        'min_interval_seconds': config('LOCATION_MIN_INTERVAL_SECONDS', default=1.0, cast=float),
+        'log_every': config('LOCATION_INGESTION_LOG_EVERY', default=1000, cast=int),
+    },
+}
+if REDIS_URL:
+    LOCATION_INGESTION['OPTIONS']['url'] = REDIS_URL
+
+# Driver heartbeats - an available driver with no location ping for DRIVER_HEARTBEAT_TTL
+# seconds is taken offline by the sweeper (each worker, or `manage.py sweep_drivers`).
+# Without Redis each worker only sees its own pings, so sweeping is off unless enabled
+# for a single-process deployment.
+DRIVER_AVAILABILITY = {
+    'ENABLED': config('DRIVER_HEARTBEAT_ENABLED', default=True, cast=bool),
+    'BACKEND': (
+        'rides.availability.RedisAvailabilityTracker' if REDIS_URL
+        else 'rides.availability.InMemoryAvailabilityTracker'
+    ),
+    'OPTIONS': {
+        'ttl_seconds': config('DRIVER_HEARTBEAT_TTL', default=90.0, cast=float),
+        'sweep_interval': config('DRIVER_SWEEP_INTERVAL', default=15.0, cast=float),
+        'batch_size': config('DRIVER_SWEEP_BATCH_SIZE', default=500, cast=int),
+    },
+    'SWEEP_IN_PROCESS': config('DRIVER_SWEEP_IN_PROCESS', default=bool(REDIS_URL), cast=bool),
+}
+if REDIS_URL:
+    DRIVER_AVAILABILITY['OPTIONS']['url'] = REDIS_URL
+    DRIVER_AVAILABILITY['OPTIONS']['loaded_ttl'] = config('DRIVER_HEARTBEAT_LOADED_TTL', default=3600, cast=int)
+
+# Wave dispatch offer state - which drivers each open ride was offered to
+DISPATCH_OFFERS = {
+    'BACKEND': (
+        'rides.dispatch.RedisOfferBook' if REDIS_URL
+        else 'rides.dispatch.InMemoryOfferBook'
+    ),
+    'OPTIONS': {},
+}
+if REDIS_URL:
+    DISPATCH_OFFERS['OPTIONS']['url'] = REDIS_URL
+
+# Transactional outbox - ride and payment events are saved with the change they announce and
+# relayed to the channel layer in order, OUTBOX_BATCH_SIZE at a time, by the relay holding the
+# lease (each ASGI worker runs one, or `manage.py relay_outbox`). A gap in the ids blocks the relay
+# for up to OUTBOX_GAP_TIMEOUT seconds. Set OUTBOX_MAX_AGE to drop events older than that many
+# seconds instead of sending them (0, the default, sends everything)
+OUTBOX_BATCH_SIZE = config('OUTBOX_BATCH_SIZE', default=500, cast=int)
+OUTBOX_POLL_MS = config('OUTBOX_POLL_MS', default=200, cast=int)
+OUTBOX_GAP_TIMEOUT = config('OUTBOX_GAP_TIMEOUT', default=5, cast=float)
+OUTBOX_LEASE_SECONDS = config('OUTBOX_LEASE_SECONDS', default=10, cast=float)
+OUTBOX_MAX_AGE = config('OUTBOX_MAX_AGE', default=0, cast=float)
+OUTBOX_RELAY_IN_PROCESS = config('OUTBOX_RELAY_IN_PROCESS', default=True, cast=bool)
+
 # Security settings for production
 if not DEBUG:
     # SECURE_SSL_REDIRECT = True
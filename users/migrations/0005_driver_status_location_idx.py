@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_alter_driver_current_latitude_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='driver',
+            index=models.Index(fields=['status', 'current_latitude', 'current_longitude'], name='driver_status_location_idx'),
+        ),
+    ]
@@ -94,6 +94,15 @@ class Driver(models.Model):
   rating = models.DecimalField(max_digits=3, decimal_places=2, default=5.0)
   total_rides = models.IntegerField(default=0)
   total_earnings = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+  class Meta:
+    indexes = [
+      # Serves the bounding-box prefilter in rides.utils.find_nearby_drivers_db
+      models.Index(
+        fields=['status', 'current_latitude', 'current_longitude'],
+        name='driver_status_location_idx'
+      ),
+    ]
     
   @property
   def is_profile_complete(self):
@@ -136,4 +136,10 @@ class NearbyDriversSerializer(serializers.Serializer):
         min_value=1,
         max_value=50,
         help_text="Search radius in kilometers (1-50 km, default: 5km)"
+    )
+    limit = serializers.IntegerField(
+        required=False,
+        min_value=1,
+        max_value=100,
+        help_text="Return only the N closest drivers (searches outward until found)"
     )
\ No newline at end of file
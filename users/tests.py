@@ -1,3 +1,35 @@
-from django.test import TestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from rides.tests.helpers import FastTierTestCase, make_driver, make_user
+
+
+class NearbyDriversViewTests(FastTierTestCase):
+    url = '/api/auth/drivers/nearby/'
+
+    def setUp(self):
+        super().setUp()
+        self.near = make_driver('near', 41.312, 69.280)
+        self.far = make_driver('far', 41.320, 69.290)
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('searcher'))
+
+    def post(self, **data):
+        return self.client.post(self.url, {'latitude': '41.311', 'longitude': '69.279', **data},
+                                format='json')
+
+    def test_returns_closest_drivers_first(self):
+        response = self.post(radius=5)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['driver']['id'] for item in response.data],
+                         [self.near.id, self.far.id])
+
+        response = self.post(limit=1)
+        self.assertEqual([item['driver']['id'] for item in response.data], [self.near.id])
+
+    def test_invalid_input_is_rejected(self):
+        for data in [{'limit': -3}, {'limit': 0}, {'limit': 101}, {'limit': 'five'},
+                     {'radius': 0}, {'radius': 51}, {'latitude': 'north'}, {'longitude': None}]:
+            with self.subTest(**data):
+                response = self.post(**data)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(next(iter(data)), response.data)
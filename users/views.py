@@ -4,7 +4,7 @@ from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 from drf_spectacular.utils import extend_schema, OpenApiExample
 from django.contrib.auth import get_user_model
-from django.utils import timezone
+from datetime import datetime, timezone as dt_timezone
 from .models import Driver, Passanger
 from .serializers import (
     RegisterSerializer, LoginSerializer, UserSerializer,
@@ -13,8 +13,6 @@ from .serializers import (
     NearbyDriversSerializer,
     DriverProfileCompleteSerializer, PassengerSerializer
 )
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
 from rest_framework.permissions import IsAuthenticated
 
 User = get_user_model()
@@ -147,14 +145,16 @@ class UpdateLocationView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        user.current_latitude = latitude
-        user.current_longitude = longitude
-        user.location_updated_at = timezone.now()
-        user.save(update_fields=[
-            'current_latitude',
-            'current_longitude',
-            'location_updated_at'
-        ])
+        from rides.location_buffer import buffer_user_location
+
+        # Written to Postgres by the location buffer's bulk flush
+        try:
+            buffer_user_location(user, latitude, longitude)
+        except (TypeError, ValueError) as e:
+            return Response(
+                {'detail': f'Invalid coordinates: {e}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
         return Response(
             {
@@ -169,11 +169,13 @@ class UpdateLocationView(APIView):
     
     def broadcast_driver_location(self, driver_profile):
         """Broadcast driver location via WebSocket"""
+        from rides.fanout import publish_driver_location
+
         try:
-            channel_layer = get_channel_layer()
-            
-            async_to_sync(channel_layer.group_send)(
-                'location_updates',
+            publish_driver_location(
+                driver_profile.user_id,
+                driver_profile.current_latitude,
+                driver_profile.current_longitude,
                 {
                     'type': 'location_broadcast',
                     'user_id': driver_profile.user.id,  # ✅ FIX: Consistent naming
@@ -248,7 +250,10 @@ class CompleteDriverProfileView(APIView):
             driver.vehicle_model = serializer.validated_data['vehicle_model']
             driver.vehicle_number = serializer.validated_data['vehicle_number']
             driver.vehicle_color = serializer.validated_data['vehicle_color']
-            driver.save()
+            driver.save(update_fields=[
+                'license_number', 'vehicle_type', 'vehicle_model', 'vehicle_number',
+                'vehicle_color', 'updated_at',
+            ])
             
             print(f"✅ Profile saved successfully for {request.user.username}")
             
@@ -350,27 +355,48 @@ class DriverLocationUpdateView(APIView):
                 'profile_complete': False
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        driver_profile.current_latitude = serializer.validated_data['latitude']
-        driver_profile.current_longitude = serializer.validated_data['longitude']
+        from rides.availability import driver_heartbeat
+        from rides.ingestion import should_ingest
+        from rides.location_buffer import buffer_driver_location
+
+        latitude = serializer.validated_data['latitude']
+        longitude = serializer.validated_data['longitude']
+        new_status = serializer.validated_data.get('status')
+
+        # Any ping, filtered or not, proves the app is alive
+        driver_heartbeat(request.user.id)
+
+        # Parked or over-eager drivers: no write and no broadcast for this ping
+        ingest = should_ingest(request.user.id, latitude, longitude, new_status)
         
-        if 'status' in serializer.validated_data:
-            driver_profile.status = serializer.validated_data['status']
-            
-        driver_profile.save()
+        if ingest:
+            driver_profile.current_latitude = latitude
+            driver_profile.current_longitude = longitude
+
+            # Position goes to the location store now and to Postgres in the next bulk flush
+            buffer_driver_location(driver_profile)
+        
+        # Status changes are rare and must be durable right away
+        if new_status and new_status != driver_profile.status:
+            driver_profile.status = new_status
+            driver_profile.save(update_fields=['status', 'updated_at'])
         
         # Broadcast location to all passengers
-        self.broadcast_location(driver_profile)
+        if ingest:
+            self.broadcast_location(driver_profile)
 
         return Response(DriverSerializer(driver_profile).data)
 
     def broadcast_location(self, driver_profile):
         """Broadcast driver location via WebSocket"""
+        from rides.fanout import publish_driver_location
+
         try:
-            channel_layer = get_channel_layer()
-            
-            # Send to all users in location_updates room
-            async_to_sync(channel_layer.group_send)(
-                'location_updates',  # All passengers subscribed to this
+            # Only the driver's riders, or clients watching the driver's cell, get the update
+            publish_driver_location(
+                driver_profile.user_id,
+                driver_profile.current_latitude,
+                driver_profile.current_longitude,
                 {
                     'type': 'location_broadcast',
                     'driver_id': driver_profile.user.id,
@@ -415,21 +441,31 @@ class NearbyDriversView(APIView):
                     "radius": 5
                 },
                 request_only=True,
+            ),
+            OpenApiExample(
+                'Closest 5 Drivers',
+                value={
+                    "latitude": 41.299500,
+                    "longitude": 69.240100,
+                    "radius": 10,
+                    "limit": 5
+                },
+                request_only=True,
             )
         ]
     )
     def post(self, request):
         from rides.utils import find_nearby_drivers
         
-        latitude = request.data.get('latitude')
-        longitude = request.data.get('longitude')
-        radius = request.data.get('radius', 5)  # Default 5km
-        
-        if not latitude or not longitude:
-            return Response({'error': 'Latitude and longitude required'}, 
-                        status=status.HTTP_400_BAD_REQUEST)
+        serializer = NearbyDriversSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
         
-        nearby = find_nearby_drivers(float(latitude), float(longitude), radius)
+        nearby = find_nearby_drivers(
+            float(serializer.validated_data['latitude']),
+            float(serializer.validated_data['longitude']),
+            serializer.validated_data['radius'],
+            limit=serializer.validated_data.get('limit')  # Optional: only the N closest
+        )
         
         result = [{
             'driver': DriverSerializer(item['driver']).data,
@@ -515,6 +551,21 @@ class DriverCurrentLocationView(APIView):
         description="Get current location of a specific driver"
     )
     def get(self, request, driver_id):
+        from rides.location_store import get_driver_store
+        
+        # Fast path: latest position from the location store
+        location = get_driver_store().position(driver_id)
+        if location:
+            return Response({
+                'driver_id': driver_id,
+                'latitude': f"{location['latitude']:.6f}",
+                'longitude': f"{location['longitude']:.6f}",
+                'status': location.get('status'),
+                'updated_at': datetime.fromtimestamp(
+                    location['updated_at'], tz=dt_timezone.utc
+                ).isoformat(),
+            })
+        
         try:
             driver = Driver.objects.get(user_id=driver_id)
             